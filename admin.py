@@ -0,0 +1,1256 @@
+"""管理后台路由：问卷编辑、二维码、结果查看与导出、归档、模板
+
+导出、二维码、PDF 等较重的依赖只在对应路由首次使用时导入。
+"""
+import importlib.util
+import logging
+import os
+import secrets
+import tempfile
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from io import BytesIO
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, session, current_app
+
+from config import (
+    get_public_host, EXPORT_CHUNK_SIZE, EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES, EXPORT_WAIT_SECONDS,
+    ARCHIVE_DIR, PURGE_CHUNK_SIZE, ORDER_GAP, ORDER_GAP_LOW_WATER, QUESTION_MAX_LENGTH,
+)
+from models import (
+    db, User, Survey, Question, TableRespondent, QRCode, Vote, TableBallot, SubjectiveAnswer,
+    get_current_time, bump_data_version,
+)
+from writer import submit_queue, wait_for_survey
+from qr_sheets import build_qr_pdf
+from exports import write_results_xlsx, write_results_csv
+from export_cache import ExportCache
+from columnar import COLUMNAR_FORMATS, write_parquet, write_arrow, write_bundle
+from purge import purge_survey_data, RESULT_TABLES, SURVEY_TABLES
+from cold_storage import archive_survey, restore_survey, list_archives, ARCHIVE_PREFIX, ARCHIVE_SUFFIX
+from importer import ImportReport, iter_import_rows, import_values
+from cloning import clone_survey, instantiate_template
+from ballots import STORAGE_ROWS, STORAGE_PACKED, is_packed, iter_ballot_votes
+from shards import results_engine, results_session, export_version, absorb_results, drop_results
+from snapshots import (
+    snapshot_manifest, load_snapshot, snapshot_results, write_snapshot_xlsx, write_snapshot_csv,
+    invalidate_snapshot, drop_snapshot,
+)
+from participation import tracker as participation
+from search import search_answers, parse_date
+
+logger = logging.getLogger(__name__)
+
+admin_bp = Blueprint('admin', __name__)
+
+export_cache = ExportCache(EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES)
+
+def _write_csv_gz_bundle(session, survey, fileobj, chunk_size):
+    write_bundle(session, [survey], 'csv.gz', fileobj, chunk_size)
+
+# 导出格式 -> (写入函数, MIME 类型, 文件扩展名)
+EXPORT_FORMATS = {
+    'xlsx': (write_results_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'csv': (write_results_csv, 'text/csv', 'csv'),
+    'parquet': (write_parquet, COLUMNAR_FORMATS['parquet'][1], 'parquet'),
+    'arrow': (write_arrow, COLUMNAR_FORMATS['arrow'][1], 'arrow'),
+    'csv.gz': (_write_csv_gz_bundle, 'application/zip', 'csv.gz.zip'),  # 整数编码 CSV + 编码字典
+}
+
+# 可由分析快照生成的导出格式 -> 写入函数（列式格式仍按块直接读数据库）
+SNAPSHOT_EXPORTS = {
+    'xlsx': write_snapshot_xlsx,
+    'csv': write_snapshot_csv,
+}
+
+def make_archive_path(kind, survey_id):
+    """生成归档文件路径：instance/archives/<kind>_<survey_id>_<时间>.jsonl.gz"""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    timestamp = get_current_time().strftime('%Y%m%d_%H%M%S')
+    return os.path.join(ARCHIVE_DIR, f'{kind}_{survey_id}_{timestamp}.jsonl.gz')
+
+def pyarrow_missing(fmt):
+    """Parquet / Arrow 格式需要 pyarrow，未安装时返回 True"""
+    return fmt in ('parquet', 'arrow') and importlib.util.find_spec('pyarrow') is None
+
+@admin_bp.route('/admin_login', methods=['GET'])
+def admin_login():
+    # 通过 GET 参数密钥校验，仅持有密钥者可进入后台，无需 POST 账号密码
+    provided_key = request.args.get('k', '')
+    if not provided_key or provided_key != current_app.config['ADMIN_GATE_KEY']:
+        flash('非法访问', 'danger')
+        return redirect(url_for('voter.thank_you'))
+    session['is_admin'] = True
+    return redirect(url_for('admin.dashboard'))
+
+def ensure_admin_session():
+    if not session.get('is_admin'):
+        return redirect(url_for('voter.thank_you'))
+    return None
+
+
+@admin_bp.route('/admin')
+def dashboard():
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    surveys = Survey.query.filter_by(is_active=True).all()
+    
+    # 计算每个问卷的数据条数
+    survey_stats = []
+    for survey in surveys:
+        # 启用分析快照时使用快照中的计数，不读投票数据库
+        manifest = snapshot_manifest(survey)
+        if manifest:
+            counts = manifest['counts']
+            vote_count = {'single_choice': counts['votes'], 'table': counts['table_votes']}.get(survey.type, 0)
+            subjective_count = counts['answers']
+            survey_stats.append({
+                'survey': survey,
+                'vote_count': vote_count,
+                'subjective_count': subjective_count,
+                'total_count': vote_count + subjective_count,
+                'participation': participation.summary(db.session, survey.id),
+            })
+            continue
+        with results_session(survey.id) as results:
+            # 计算投票数据条数
+            if survey.type == 'single_choice':
+                vote_count = results.query(Vote).filter(Vote.survey_id == survey.id).count()
+            elif survey.type == 'table':
+                vote_count = results.query(Vote).filter(
+                    Vote.survey_id == survey.id,
+                    Vote.table_respondent_id.isnot(None)
+                ).count()
+                # 紧凑存储的选票按已作答单元格数计
+                vote_count += results.query(
+                    db.func.coalesce(db.func.sum(TableBallot.cell_count), 0)
+                ).filter(TableBallot.survey_id == survey.id).scalar()
+            else:
+                vote_count = 0
+            
+            # 计算主观题回答数
+            subjective_count = results.query(SubjectiveAnswer).filter_by(survey_id=survey.id).count()
+        
+        # 总数据条数
+        total_count = vote_count + subjective_count
+        
+        survey_stats.append({
+            'survey': survey,
+            'vote_count': vote_count,
+            'subjective_count': subjective_count,
+            'total_count': total_count,
+            'participation': participation.summary(db.session, survey.id),
+        })
+    
+    return render_template('admin.html', survey_stats=survey_stats, archives=list_archives(ARCHIVE_DIR))
+
+@admin_bp.route('/admin/create_survey', methods=['POST'])
+def create_survey():
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    survey_type = request.form.get('survey_type')
+    survey_name = request.form.get('survey_name')
+    survey_introduction = request.form.get('survey_introduction')
+    subjective_question_prompt = request.form.get('subjective_question_prompt')
+    table_option_count = int(request.form.get('table_option_count', 3))
+    
+    if not survey_name or not survey_type:
+        flash('请填写问卷名称并选择类型', 'danger')
+        return redirect(url_for('admin.dashboard'))
+    
+    enable_quick_fill = request.form.get('enable_quick_fill') == 'on'
+    survey = Survey(
+        name=survey_name, 
+        type=survey_type, 
+        introduction=survey_introduction, 
+        subjective_question_prompt=subjective_question_prompt,
+        table_option_count=table_option_count if survey_type == 'table' else None,
+        enable_quick_fill=enable_quick_fill
+    )
+    db.session.add(survey)
+    db.session.commit()
+    
+    # 统一重定向到编辑页面
+    return redirect(url_for('admin.edit_survey', survey_id=survey.id))
+
+@admin_bp.route('/admin/create_single_choice_questions/<int:survey_id>')
+def create_single_choice_questions(survey_id):
+    """旧路由：重定向到统一的编辑页面"""
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    # 统一重定向到新的编辑页面
+    return redirect(url_for('admin.edit_survey', survey_id=survey_id))
+
+@admin_bp.route('/admin/create_table_questions/<int:survey_id>', methods=['GET'])
+def create_table_questions(survey_id):
+    """旧路由：重定向到统一的编辑页面"""
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    # 统一重定向到新的编辑页面
+    return redirect(url_for('admin.edit_survey', survey_id=survey_id))
+
+@admin_bp.route('/admin/manage_table_respondents/<int:survey_id>', methods=['GET'])
+def manage_table_respondents(survey_id):
+    """旧路由：重定向到统一的编辑页面"""
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    # 统一重定向到新的编辑页面
+    return redirect(url_for('admin.edit_survey', survey_id=survey_id))
+
+def create_qr_tokens(session, survey_id, count):
+    """为问卷生成 count 个登录令牌并提交，返回令牌列表"""
+    tokens = [secrets.token_urlsafe(16) for _ in range(count)]
+    session.add_all([QRCode(survey_id=survey_id, token=token) for token in tokens])
+    session.commit()
+    participation.issued(session, survey_id)
+    return tokens
+
+@admin_bp.route('/admin/generate_qr/<int:survey_id>', methods=['POST'])
+def generate_qr(survey_id):
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    survey = Survey.query.get_or_404(survey_id)
+    num_users = int(request.form.get('num_users', 0))
+    
+    if num_users <= 0:
+        flash('请输入有效的用户数量', 'danger')
+        return redirect(url_for('admin.dashboard'))
+    
+    # 生成二维码
+    qr_codes = create_qr_tokens(db.session, survey_id, num_users)
+    
+    # 生成二维码图片并排版为PDF（动态获取主机地址）
+    public_host = get_public_host()
+    pdf_buffer = BytesIO()
+    build_qr_pdf([f"{public_host}login/{token}" for token in qr_codes], survey.name, pdf_buffer)
+    pdf_buffer.seek(0)
+    
+    return send_file(
+        pdf_buffer,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f'qr_codes_{survey.name}.pdf'
+    )
+
+@admin_bp.route('/preview/<int:survey_id>')
+def preview_survey(survey_id):
+    """预览问卷（不需要验证二维码，仅用于管理员预览）"""
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    survey = Survey.query.get_or_404(survey_id)
+    questions = Question.query.filter_by(survey_id=survey_id).order_by(Question.order_index, Question.id).all()
+    
+    # 如果是表格问卷，获取所有受访者
+    respondents = []
+    if survey.type == 'table':
+        respondents = TableRespondent.query.filter_by(survey_id=survey_id).order_by(TableRespondent.id).all()
+    
+    table_option_count = survey.table_option_count if survey.type == 'table' else None
+    
+    return render_template(
+        'vote.html',
+        survey=survey,
+        questions=questions,
+        respondents=respondents,
+        subjective_question_prompt=survey.subjective_question_prompt,
+        table_option_count=table_option_count,
+        enable_quick_fill=survey.enable_quick_fill,
+        is_preview=True,
+        saved_choices={}  # 预览模式下不需要保存选择
+    )
+
+@admin_bp.route('/admin/set_option_limits/<int:survey_id>', methods=['POST'])
+def set_option_limits(survey_id):
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    survey = Survey.query.get_or_404(survey_id)
+    
+    # 根据问卷类型确定可用的选项范围
+    if survey.type == 'table':
+        # 表格型问卷：只允许设置table_option_count范围内的选项
+        available_options = 'ABCDE'[:survey.table_option_count]
+    else:
+        # 单选题问卷：允许设置所有选项
+        available_options = 'ABCDE'
+    
+    # 统一重定向到编辑页面
+    redirect_url = url_for('admin.edit_survey', survey_id=survey_id)
+    
+    # 获取选项限制
+    option_limits = {}
+    for option in available_options:
+        limit = request.form.get(f'limit_{option}')
+        if limit and limit.strip():
+            try:
+                limit_value = int(limit)
+                if limit_value > 0:
+                    option_limits[option] = limit_value
+            except ValueError:
+                flash(f'选项 {option} 的限制值必须是正整数', 'danger')
+                return redirect(redirect_url)
+    
+    # 更新问卷的选项限制
+    survey.option_limits = option_limits
+    db.session.commit()
+    
+    flash('选项限制设置已保存', 'success')
+    return redirect(redirect_url)
+
+def live_results(survey):
+    """直接从投票数据库读取结果页的投票和主观题回答列表"""
+    survey_id = survey.id
+    with results_session(survey_id) as results:
+        # 获取投票数据
+        votes_data = []
+        if survey.type == 'single_choice':
+            votes = results.query(Vote).filter(Vote.survey_id == survey_id).order_by(Vote.created_at.desc()).all()
+            for vote in votes:
+                votes_data.append({
+                    'user': vote.user.username,
+                    'question': vote.question.content,
+                    'option': vote.score,
+                    'time': vote.created_at
+                })
+        elif survey.type == 'table':
+            # 包含自定义单选组件的投票（没有 table_respondent_id 的投票）
+            votes = results.query(Vote).filter(Vote.survey_id == survey_id).order_by(Vote.created_at.desc()).all()
+            
+            for vote in votes:
+                votes_data.append({
+                    'user': vote.user.username,
+                    'question': vote.question.content,
+                    'respondent': vote.table_respondent.name if vote.table_respondent else '-',
+                    'option': vote.score,
+                    'time': vote.created_at
+                })
+            
+            if is_packed(survey):
+                usernames = dict(results.query(User.id, User.username).filter(
+                    User.id.in_(results.query(TableBallot.user_id).filter(TableBallot.survey_id == survey_id))
+                ).all())
+                contents = {q.id: q.content for q in survey.questions}
+                names = {r.id: r.name for r in survey.table_respondents}
+                for user_id, q_id, respondent_id, score, created_at in iter_ballot_votes(results, survey_id):
+                    votes_data.append({
+                        'user': usernames.get(user_id),
+                        'question': contents.get(q_id),
+                        'respondent': names.get(respondent_id, '-'),
+                        'option': score,
+                        'time': created_at
+                    })
+                votes_data.sort(key=lambda v: v['time'], reverse=True)
+        
+        # 获取主观题回答
+        subjective_answers = results.query(SubjectiveAnswer).filter_by(survey_id=survey_id).order_by(SubjectiveAnswer.created_at.desc()).all()
+        subjective_data = []
+        for ans in subjective_answers:
+            subjective_data.append({
+                'user': ans.user.username,
+                'content': ans.content,
+                'time': ans.created_at
+            })
+    return votes_data, subjective_data
+
+@admin_bp.route('/admin/results/<int:survey_id>')
+def view_results(survey_id):
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    survey = Survey.query.get_or_404(survey_id)
+    
+    # 启用分析快照时从快照读取，?live=1 时直接读数据库
+    snapshot = None if request.args.get('live') else load_snapshot(survey)
+    if snapshot:
+        votes_data, subjective_data = snapshot_results(db.session, survey, snapshot)
+    else:
+        votes_data, subjective_data = live_results(survey)
+    
+    # 统计数据
+    total_votes = len(votes_data)
+    unique_users = len(set(v['user'] for v in votes_data))
+    unique_respondents = len(set(v.get('respondent') for v in votes_data if v.get('respondent'))) if survey.type == 'table' else 0
+    total_questions = len(survey.questions)
+    total_subjective_answers = len(subjective_data)
+    
+    return render_template('view_results.html', 
+                         survey=survey,
+                         votes_data=votes_data,
+                         subjective_answers=subjective_data,
+                         total_votes=total_votes,
+                         unique_users=unique_users,
+                         unique_respondents=unique_respondents,
+                         total_questions=total_questions,
+                         total_subjective_answers=total_subjective_answers,
+                         snapshot_time=snapshot.refreshed_at if snapshot else None)
+
+@admin_bp.route('/admin/results/<int:survey_id>/answers')
+def search_subjective_answers(survey_id):
+    """搜索主观题回答：按关键词（空格分隔，全部命中）、用户名、提交日期筛选，分页显示"""
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    survey = Survey.query.get_or_404(survey_id)
+    filters = {key: request.args.get(key, '').strip() for key in ('q', 'user', 'since', 'until')}
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = 20
+    with results_session(survey_id) as results:
+        total, answers = search_answers(
+            results, survey_id, query=filters['q'], username=filters['user'],
+            since=parse_date(filters['since']), until=parse_date(filters['until']),
+            offset=(page - 1) * per_page, limit=per_page,
+        )
+    total_pages = max((total + per_page - 1) // per_page, 1)
+    return render_template('answer_search.html', survey=survey, filters=filters, answers=answers,
+                           total=total, page=page, total_pages=total_pages, per_page=per_page)
+
+@admin_bp.route('/admin/download_results/<int:survey_id>')
+def download_results(survey_id):
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    survey = Survey.query.get_or_404(survey_id)
+    
+    fmt = request.args.get('format', 'xlsx')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'xlsx'
+    if pyarrow_missing(fmt):
+        flash('导出 Parquet / Arrow 格式需要安装 pyarrow', 'danger')
+        return redirect(url_for('admin.view_results', survey_id=survey_id))
+    writer, mimetype, ext = EXPORT_FORMATS[fmt]
+    download_name = f'vote_results_{survey.name}.{ext}'
+    
+    # 启用分析快照时由快照生成，?live=1 时直接读数据库
+    manifest = snapshot_manifest(survey) if fmt in SNAPSHOT_EXPORTS and not request.args.get('live') else None
+    
+    # 数据版本未变化时直接返回缓存文件
+    version = f"{survey.data_version}-s{manifest['generation']}" if manifest else export_version(survey)
+    fileobj = export_cache.open(survey.id, version, ext)
+    if fileobj is None:
+        # 由后台线程生成（多个管理员同时下载时只生成一次），按块读取投票数据并流式写入文件
+        app = current_app._get_current_object()
+
+        def generate(fileobj):
+            with app.app_context():
+                export_survey = db.session.get(Survey, survey_id)
+                snapshot = load_snapshot(export_survey, manifest) if manifest else None
+                if snapshot:
+                    SNAPSHOT_EXPORTS[fmt](db.session, export_survey, snapshot, fileobj)
+                    return
+                with results_session(survey_id) as results:
+                    writer(results, export_survey, fileobj, chunk_size=EXPORT_CHUNK_SIZE)
+        
+        # 生成完成到打开之间文件可能已被淘汰或失效，此时再生成一次
+        for _ in range(2):
+            future = export_cache.submit(survey.id, version, ext, generate)
+            try:
+                future.result(timeout=EXPORT_WAIT_SECONDS)
+            except FutureTimeoutError:
+                flash('导出文件正在后台生成，请稍后再次下载', 'info')
+                return redirect(url_for('admin.view_results', survey_id=survey_id))
+            except Exception as e:
+                logger.error(f"导出结果失败: {e}")
+                flash('导出结果失败，请重试', 'danger')
+                return redirect(url_for('admin.view_results', survey_id=survey_id))
+            fileobj = export_cache.open(survey.id, version, ext)
+            if fileobj is not None:
+                break
+        else:
+            flash('导出结果失败，请重试', 'danger')
+            return redirect(url_for('admin.view_results', survey_id=survey_id))
+    
+    response = send_file(
+        fileobj,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=download_name
+    )
+    response.content_length = os.fstat(fileobj.fileno()).st_size  # 文件对象不会自动带上长度
+    return response
+
+@admin_bp.route('/admin/export_bundle', methods=['POST'])
+def export_bundle():
+    """把多个问卷的整数编码分析数据打包导出为一个 zip 文件"""
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    fmt = request.form.get('format', 'parquet')
+    survey_ids = [int(sid) for sid in request.form.getlist('survey_ids') if sid.isdigit()]
+    if fmt not in COLUMNAR_FORMATS or not survey_ids:
+        flash('请选择要导出的问卷和格式', 'warning')
+        return redirect(url_for('admin.dashboard'))
+    if pyarrow_missing(fmt):
+        flash('导出 Parquet / Arrow 格式需要安装 pyarrow', 'danger')
+        return redirect(url_for('admin.dashboard'))
+    
+    surveys = Survey.query.filter(Survey.id.in_(survey_ids)).order_by(Survey.id).all()
+    output = tempfile.TemporaryFile(suffix='.zip')
+    try:
+        write_bundle(db.session, surveys, fmt, output, chunk_size=EXPORT_CHUNK_SIZE, session_for=results_session)
+        output.seek(0)
+    except Exception as e:
+        output.close()
+        logger.error(f"批量导出失败: {e}", exc_info=True)
+        flash('批量导出失败，请重试', 'danger')
+        return redirect(url_for('admin.dashboard'))
+    
+    return send_file(
+        output,
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name=f'vote_results_bundle_{fmt.replace(".", "_")}.zip'
+    )
+
+@admin_bp.route('/admin/delete_results/<int:survey_id>', methods=['POST'])
+def delete_results(survey_id):
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    survey = Survey.query.get_or_404(survey_id)
+    survey_name = survey.name
+    archive_path = make_archive_path('results', survey_id) if request.form.get('archive') == 'on' else None
+    
+    try:
+        # 分块删除所有投票数据（包括表格问卷中的自定义组件投票）和主观题回答
+        db.session.commit()  # 结束当前读事务，删除在独立的短事务中进行
+        # 删除前已提交、仍在写入队列中的投票写完后再删除，否则删除后又会写入
+        if not wait_for_survey(survey_id):
+            flash(f'问卷 "{survey_name}" 仍有投票在等待写入，请稍后再删除投票数据', 'warning')
+            return redirect(url_for('admin.view_results', survey_id=survey_id))
+        counts = purge_survey_data(results_engine(survey_id), survey_id, RESULT_TABLES,
+                                   chunk_size=PURGE_CHUNK_SIZE, archive_path=archive_path)
+        bump_data_version(survey_id)
+        db.session.commit()
+        invalidate_snapshot(survey_id)
+        participation.reset_votes(db.session, survey_id)
+        message = f'已成功删除问卷 "{survey_name}" 的所有投票数据（{counts["vote"]} 条投票，{counts["subjective_answer"]} 条主观题回答）'
+        if archive_path:
+            message += f'，已归档到 {os.path.basename(archive_path)}'
+        flash(message, 'success')
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"删除投票数据失败: {e}")
+        flash('删除投票数据失败，请重试', 'danger')
+    
+    return redirect(url_for('admin.view_results', survey_id=survey_id))
+
+@admin_bp.route('/admin/copy_survey/<int:survey_id>', methods=['POST'])
+def copy_survey(survey_id):
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    original_survey = Survey.query.get_or_404(survey_id)
+    
+    try:
+        # 在数据库内通过 INSERT ... SELECT 复制问卷、问题和人名
+        new_name = f"{original_survey.name} (副本)"
+        clone_survey(db.session.connection(), db.metadata, survey_id, new_name, get_current_time())
+        db.session.commit()
+        flash(f'问卷已复制为新问卷："{new_name}"', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'复制问卷失败: {e}', 'danger')
+    
+    return redirect(url_for('admin.dashboard'))
+
+@admin_bp.route('/admin/templates')
+def survey_templates():
+    """模板库：保存的问卷蓝图，可批量实例化"""
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    templates = Survey.query.filter_by(is_template=True).order_by(Survey.created_at.desc()).all()
+    question_counts = dict(db.session.query(Question.survey_id, db.func.count(Question.id))
+                           .filter(Question.survey_id.in_([t.id for t in templates]))
+                           .group_by(Question.survey_id).all())
+    respondent_counts = dict(db.session.query(TableRespondent.survey_id, db.func.count(TableRespondent.id))
+                             .filter(TableRespondent.survey_id.in_([t.id for t in templates]))
+                             .group_by(TableRespondent.survey_id).all())
+    return render_template('survey_templates.html', templates=templates,
+                           question_counts=question_counts, respondent_counts=respondent_counts)
+
+@admin_bp.route('/admin/participation/<int:survey_id>')
+def participation_report(survey_id):
+    """参与情况：已发放、已扫码、已投票的二维码数量，及尚未投票的二维码（按生成顺序分页）"""
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    survey = Survey.query.get_or_404(survey_id)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = 100
+    counts = participation.summary(db.session, survey_id)
+    pending = participation.not_voted(db.session, survey_id, offset=(page - 1) * per_page, limit=per_page)
+    # 用户名与扫码登录时创建的用户一致
+    rows = [{'seq': seq, 'username': f"user_{token[:8]}", 'scanned': scanned} for seq, token, scanned in pending]
+    total_pages = max((counts['issued'] - counts['voted'] + per_page - 1) // per_page, 1)
+    return render_template('participation.html', survey=survey, counts=counts, rows=rows,
+                           page=page, total_pages=total_pages, per_page=per_page)
+
+@admin_bp.route('/admin/profiling', methods=['GET', 'POST'])
+def profiling_report():
+    """性能记录：最慢的请求及其 SQL 条数（需 PROFILE_REQUESTS=true）"""
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    enabled = current_app.config.get('PROFILE_REQUESTS', False)
+    if not enabled:
+        return render_template('profiling.html', enabled=False, requests=[])
+    import profiling
+    if request.method == 'POST':
+        profiling.reset()
+        flash('性能记录已清空', 'success')
+        return redirect(url_for('admin.profiling_report'))
+    return render_template('profiling.html', enabled=True, requests=profiling.slowest_requests(),
+                           profile_flag=profiling.PROFILE_FLAG)
+
+@admin_bp.route('/admin/save_as_template/<int:survey_id>', methods=['POST'])
+def save_as_template(survey_id):
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    survey = Survey.query.get_or_404(survey_id)
+    template_name = request.form.get('template_name', '').strip() or survey.name
+    
+    try:
+        clone_survey(db.session.connection(), db.metadata, survey_id, template_name, get_current_time(),
+                     is_template=True, is_active=False)
+        db.session.commit()
+        flash(f'已保存为模板："{template_name}"', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'保存模板失败: {e}', 'danger')
+    
+    return redirect(url_for('admin.survey_templates'))
+
+@admin_bp.route('/admin/instantiate_template/<int:template_id>', methods=['POST'])
+def instantiate_template_route(template_id):
+    """按名称列表从模板批量创建问卷（例如每个部门一份），在一个事务中完成"""
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    template = Survey.query.filter_by(id=template_id, is_template=True).first_or_404()
+    
+    names = []
+    for line in request.form.get('survey_names', '').split('\n'):
+        name = line.strip()
+        if name and name not in names:
+            names.append(name)
+    if not names:
+        flash('请至少输入一个问卷名称', 'danger')
+        return redirect(url_for('admin.survey_templates'))
+    
+    try:
+        instantiate_template(db.session.connection(), db.metadata, template_id, names, get_current_time())
+        db.session.commit()
+        flash(f'已从模板 "{template.name}" 创建 {len(names)} 个问卷', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'创建问卷失败: {e}', 'danger')
+        return redirect(url_for('admin.survey_templates'))
+    
+    return redirect(url_for('admin.dashboard'))
+
+@admin_bp.route('/admin/delete_template/<int:template_id>', methods=['POST'])
+def delete_template(template_id):
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    template = Survey.query.filter_by(id=template_id, is_template=True).first_or_404()
+    template_name = template.name
+    
+    try:
+        db.session.commit()
+        purge_survey_data(db.engine, template_id, SURVEY_TABLES, chunk_size=PURGE_CHUNK_SIZE)
+        db.session.expunge_all()
+        flash(f'模板 "{template_name}" 已删除', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'删除模板失败: {e}', 'danger')
+    
+    return redirect(url_for('admin.survey_templates'))
+
+@admin_bp.route('/admin/delete_survey/<int:survey_id>', methods=['POST'])
+def delete_survey(survey_id):
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    survey = Survey.query.get_or_404(survey_id)
+    survey_name = survey.name
+    archive_path = make_archive_path('survey', survey_id) if request.form.get('archive') == 'on' else None
+    
+    try:
+        # 先关闭问卷，不再接受新的投票；仍在写入队列中的投票写完后再删除
+        survey.is_active = False
+        db.session.commit()  # 同时结束当前读事务，删除在独立的短事务中进行
+        if not wait_for_survey(survey_id):
+            flash(f'问卷 "{survey_name}" 已关闭，但仍有投票在等待写入，请稍后再删除', 'warning')
+            return redirect(url_for('admin.dashboard'))
+        # 依次分块删除投票、主观题回答、问题、人名、二维码，最后删除问卷本身
+        purge_survey_data(results_engine(survey_id), survey_id, SURVEY_TABLES,
+                          chunk_size=PURGE_CHUNK_SIZE, archive_path=archive_path)
+        drop_results(survey_id)
+        drop_snapshot(survey_id)
+        participation.drop(db.session, survey_id)
+        db.session.expunge_all()
+        export_cache.invalidate(survey_id)
+        flash(f'问卷 "{survey_name}" 及其所有相关数据已删除', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'删除问卷失败: {e}', 'danger')
+        
+    return redirect(url_for('admin.dashboard'))
+
+@admin_bp.route('/admin/archive_survey/<int:survey_id>', methods=['POST'])
+def archive_survey_route(survey_id):
+    """关闭问卷并转入冷存储：导出到 instance/archives 下的归档文件后从数据库中删除"""
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    survey = Survey.query.get_or_404(survey_id)
+    survey_name = survey.name
+    
+    try:
+        # 先关闭问卷，不再接受新的投票
+        survey.is_active = False
+        db.session.commit()
+        # 关闭前已提交、仍在写入队列中的投票写完后再归档，否则会随问卷一起被删除
+        if not wait_for_survey(survey_id):
+            flash(f'问卷 "{survey_name}" 已关闭，但仍有投票在等待写入，请稍后再归档', 'warning')
+            return redirect(url_for('admin.dashboard'))
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        timestamp = get_current_time().strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(ARCHIVE_DIR, f'{ARCHIVE_PREFIX}{survey_id}_{timestamp}{ARCHIVE_SUFFIX}')
+        counts = archive_survey(results_engine(survey_id), survey_id, path, chunk_size=PURGE_CHUNK_SIZE)
+        drop_results(survey_id)
+        drop_snapshot(survey_id)
+        participation.drop(db.session, survey_id)
+        db.session.expunge_all()
+        export_cache.invalidate(survey_id)
+        flash(f'问卷 "{survey_name}" 已归档（{counts["vote"]} 条投票），可在下方归档列表中恢复', 'success')
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"归档问卷失败: {e}", exc_info=True)
+        flash(f'归档问卷失败: {e}', 'danger')
+    
+    return redirect(url_for('admin.dashboard'))
+
+@admin_bp.route('/admin/restore_archive', methods=['POST'])
+def restore_archive():
+    """从冷存储归档文件恢复问卷"""
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    filename = os.path.basename(request.form.get('filename', ''))
+    path = os.path.join(ARCHIVE_DIR, filename)
+    if not (filename.startswith(ARCHIVE_PREFIX) and filename.endswith(ARCHIVE_SUFFIX)) or not os.path.isfile(path):
+        flash('归档文件不存在', 'danger')
+        return redirect(url_for('admin.dashboard'))
+    
+    try:
+        # 先恢复到目录库，分库时再把投票数据移入新问卷的分库
+        new_survey_id = restore_survey(db.engine, path, chunk_size=PURGE_CHUNK_SIZE)
+        absorb_results(new_survey_id)
+        # 恢复后改名，避免重复恢复
+        os.replace(path, path + '.restored')
+        flash('问卷已从归档恢复', 'success')
+    except Exception as e:
+        logger.error(f"恢复问卷失败: {e}", exc_info=True)
+        flash(f'恢复问卷失败: {e}', 'danger')
+    
+    return redirect(url_for('admin.dashboard'))
+
+@admin_bp.route('/admin/edit_survey/<int:survey_id>', methods=['GET', 'POST'])
+def edit_survey(survey_id):
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    survey = Survey.query.get_or_404(survey_id)
+    
+    if request.method == 'POST':
+        action = request.form.get('action')
+        
+        # 问卷型问题的处理
+        if survey.type == 'single_choice':
+            if action == 'import_list':
+                # 批量添加标准问题（粘贴文本或上传 CSV / XLSX 文件）
+                question_list_text = request.form.get('question_list')
+                upload = request.files.get('import_file')
+                option_count_batch = int(request.form.get('option_count_batch', 4))
+                
+                if question_list_text or (upload and upload.filename):
+                    max_order = db.session.query(db.func.max(Question.order_index)).filter_by(survey_id=survey_id).scalar() or 0
+                    existing = {row[0] for row in db.session.query(Question.content).filter_by(survey_id=survey_id).all()}
+                    try:
+                        report = import_values(
+                            db.session, Question.__table__,
+                            iter_import_rows(question_list_text, upload),
+                            existing,
+                            lambda idx, content: {
+                                'survey_id': survey.id,
+                                'content': content,
+                                'option_count': option_count_batch,
+                                'component_type': 'standard',
+                                'order_index': max_order + (idx + 1) * ORDER_GAP,
+                            },
+                            ImportReport(),
+                            max_length=QUESTION_MAX_LENGTH
+                        )
+                        bump_data_version(survey_id)
+                        db.session.commit()
+                        flash(report.summary('问题'), 'success' if report.accepted else 'warning')
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.error(f"导入问题失败: {e}", exc_info=True)
+                        flash(f'导入失败，请检查文件格式: {e}', 'danger')
+                else:
+                    flash('导入列表不能为空', 'danger')
+            elif action == 'add_custom_component':
+                # 添加自定义单选组件（支持动态选项）
+                content = request.form.get('custom_question_content')
+                
+                if content:
+                    max_order = db.session.query(db.func.max(Question.order_index)).filter_by(survey_id=survey_id).scalar() or 0
+                    
+                    # 收集自定义选项（使用逆序字母Z、Y、X...避免与标准选项A、B、C冲突）
+                    custom_options = {}
+                    options_letters = 'ZYXWVUTSRQPONMLKJIHGFEDCBA'  # 逆序字母
+                    for letter in options_letters:
+                        option_value = request.form.get(f'option_{letter}', '').strip()
+                        if option_value:
+                            custom_options[letter] = option_value
+                    
+                    if not custom_options:
+                        flash('至少需要添加一个选项', 'danger')
+                    else:
+                        question = Question(
+                            survey_id=survey_id,
+                            content=content,
+                            option_count=len(custom_options),
+                            component_type='custom_single_choice',
+                            custom_options=custom_options,
+                            order_index=max_order + ORDER_GAP
+                        )
+                        db.session.add(question)
+                        bump_data_version(survey_id)
+                        db.session.commit()
+                        flash('自定义单选组件添加成功', 'success')
+                else:
+                    flash('题目内容不能为空', 'danger')
+        
+        # 表格型问题的处理
+        elif survey.type == 'table':
+            if action == 'add_custom_component':
+                # 添加自定义单选组件（支持动态选项）
+                content = request.form.get('custom_question_content')
+                
+                if content:
+                    max_order = db.session.query(db.func.max(Question.order_index)).filter_by(survey_id=survey_id).scalar() or 0
+                    
+                    # 收集自定义选项（使用逆序字母Z、Y、X...避免与标准选项A、B、C冲突）
+                    custom_options = {}
+                    options_letters = 'ZYXWVUTSRQPONMLKJIHGFEDCBA'  # 逆序字母
+                    for letter in options_letters:
+                        option_value = request.form.get(f'option_{letter}', '').strip()
+                        if option_value:
+                            custom_options[letter] = option_value
+                    
+                    if not custom_options:
+                        flash('至少需要添加一个选项', 'danger')
+                    else:
+                        question = Question(
+                            survey_id=survey_id,
+                            content=content,
+                            option_count=len(custom_options),
+                            component_type='custom_single_choice',
+                            custom_options=custom_options,
+                            order_index=max_order + ORDER_GAP
+                        )
+                        db.session.add(question)
+                        bump_data_version(survey_id)
+                        db.session.commit()
+                        flash('自定义单选组件添加成功', 'success')
+                else:
+                    flash('题目内容不能为空', 'danger')
+            elif action == 'add_question':
+                # 添加标准横轴问题
+                content = request.form.get('content')
+                
+                if content:
+                    max_order = db.session.query(db.func.max(Question.order_index)).filter_by(survey_id=survey_id).scalar() or 0
+                    question = Question(
+                        survey_id=survey_id,
+                        content=content,
+                        option_count=None,
+                        component_type='standard',
+                        order_index=max_order + ORDER_GAP
+                    )
+                    db.session.add(question)
+                    bump_data_version(survey_id)
+                    db.session.commit()
+                    flash('横轴问题添加成功', 'success')
+                else:
+                    flash('问题内容不能为空', 'danger')
+            elif action == 'add_respondent':
+                # 添加人名
+                name = request.form.get('name')
+                if name:
+                    respondent = TableRespondent(survey_id=survey_id, name=name)
+                    db.session.add(respondent)
+                    bump_data_version(survey_id)
+                    db.session.commit()
+                    flash('人名添加成功', 'success')
+                else:
+                    flash('人名不能为空', 'danger')
+            elif action == 'import_respondents':
+                # 批量导入人名（粘贴文本或上传 CSV / XLSX 文件）
+                name_list_text = request.form.get('name_list')
+                upload = request.files.get('import_file')
+                if name_list_text or (upload and upload.filename):
+                    existing = {row[0] for row in db.session.query(TableRespondent.name).filter_by(survey_id=survey_id).all()}
+                    try:
+                        report = import_values(
+                            db.session, TableRespondent.__table__,
+                            iter_import_rows(name_list_text, upload),
+                            existing,
+                            lambda idx, name: {'survey_id': survey_id, 'name': name},
+                            ImportReport(),
+                            max_length=TableRespondent.name.type.length
+                        )
+                        bump_data_version(survey_id)
+                        db.session.commit()
+                        flash(report.summary('人名'), 'success' if report.accepted else 'warning')
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.error(f"导入人名失败: {e}", exc_info=True)
+                        flash(f'导入失败，请检查文件格式: {e}', 'danger')
+                else:
+                    flash('导入列表不能为空', 'danger')
+        
+        return redirect(url_for('admin.edit_survey', survey_id=survey_id))
+    
+    questions = Question.query.filter_by(survey_id=survey_id).order_by(Question.order_index, Question.id).all()
+    respondents = []
+    if survey.type == 'table':
+        respondents = TableRespondent.query.filter_by(survey_id=survey_id).order_by(TableRespondent.id).all()
+    return render_template('edit_survey.html', survey=survey, questions=questions, respondents=respondents)
+
+@admin_bp.route('/admin/update_survey_info/<int:survey_id>', methods=['POST'])
+def update_survey_info(survey_id):
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    survey = Survey.query.get_or_404(survey_id)
+    
+    survey.name = request.form.get('survey_name', '').strip()
+    survey.introduction = request.form.get('survey_introduction', '').strip() or None
+    survey.subjective_question_prompt = request.form.get('subjective_question_prompt', '').strip() or None
+    survey.enable_quick_fill = request.form.get('enable_quick_fill') == 'on'
+    
+    if survey.type == 'table':
+        table_option_count = int(request.form.get('table_option_count', 3))
+        survey.table_option_count = table_option_count
+        ballot_storage = STORAGE_PACKED if request.form.get('packed_ballots') == 'on' else STORAGE_ROWS
+        if ballot_storage != (survey.ballot_storage or STORAGE_ROWS):
+            with results_session(survey_id) as results:
+                has_votes = results.query(Vote.id).filter(Vote.survey_id == survey_id, Vote.table_respondent_id.isnot(None)).first() \
+                    or results.query(TableBallot.id).filter_by(survey_id=survey_id).first()
+            if has_votes:
+                flash('问卷已有投票数据，不能切换存储方式，请先删除投票结果', 'warning')
+            else:
+                survey.ballot_storage = ballot_storage
+    
+    if not survey.name:
+        flash('问卷名称不能为空', 'danger')
+        return redirect(url_for('admin.edit_survey', survey_id=survey_id))
+    
+    bump_data_version(survey_id)
+    db.session.commit()
+    flash('问卷基本信息已更新', 'success')
+    return redirect(url_for('admin.edit_survey', survey_id=survey_id))
+
+@admin_bp.route('/admin/update_question/<int:question_id>', methods=['POST'])
+def update_question(question_id):
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    question = Question.query.get_or_404(question_id)
+    survey = question.survey
+    
+    content = request.form.get('content', '').strip()
+    if not content:
+        flash('问题内容不能为空', 'danger')
+        return redirect(url_for('admin.edit_survey', survey_id=survey.id))
+    
+    question.content = content
+    
+    # 如果是单选题，更新选项数量
+    if survey.type == 'single_choice':
+        option_count = int(request.form.get('option_count', 4))
+        question.option_count = option_count
+    
+    bump_data_version(survey.id)
+    db.session.commit()
+    flash('问题已更新', 'success')
+    return redirect(url_for('admin.edit_survey', survey_id=survey.id))
+
+@admin_bp.route('/admin/delete_question/<int:question_id>', methods=['POST'])
+def delete_question(question_id):
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    question = Question.query.get_or_404(question_id)
+    survey_id = question.survey_id
+    
+    # 删除与该问题相关的所有投票记录
+    with results_session(survey_id) as results:
+        results.query(Vote).filter_by(question_id=question_id).delete()
+    
+    # 删除问题
+    db.session.delete(question)
+    bump_data_version(survey_id)
+    db.session.commit()
+    invalidate_snapshot(survey_id)
+    
+    flash('问题已删除', 'success')
+    return redirect(url_for('admin.edit_survey', survey_id=survey_id))
+
+@admin_bp.route('/admin/delete_respondent/<int:respondent_id>', methods=['POST'])
+def delete_respondent(respondent_id):
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    respondent = TableRespondent.query.get_or_404(respondent_id)
+    survey_id = respondent.survey_id
+    
+    # 删除与该人名相关的所有投票记录
+    with results_session(survey_id) as results:
+        results.query(Vote).filter_by(table_respondent_id=respondent_id).delete()
+    
+    # 删除人名
+    db.session.delete(respondent)
+    bump_data_version(survey_id)
+    db.session.commit()
+    invalidate_snapshot(survey_id)
+    
+    flash('人名已删除', 'success')
+    return redirect(url_for('admin.edit_survey', survey_id=survey_id))
+
+@admin_bp.route('/admin/batch_delete_questions', methods=['POST'])
+def batch_delete_questions():
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    
+    question_ids = request.form.getlist('question_ids')
+    survey_id = request.form.get('survey_id')
+    
+    if not question_ids:
+        flash('请选择要删除的问题', 'warning')
+        return redirect(url_for('admin.edit_survey', survey_id=survey_id) if survey_id else url_for('admin.dashboard'))
+    
+    if not survey_id:
+        # 如果没有提供survey_id，从第一个问题获取
+        first_question = Question.query.get(int(question_ids[0]))
+        if not first_question:
+            flash('问题不存在', 'danger')
+            return redirect(url_for('admin.dashboard'))
+        survey_id = first_question.survey_id
+    
+    try:
+        survey_id = int(survey_id)
+        
+        # 验证所有问题都属于同一个问卷
+        question_id_list = [int(qid) for qid in question_ids]
+        questions = Question.query.filter(Question.id.in_(question_id_list)).all()
+        
+        # 验证问题数量和survey_id
+        if len(questions) != len(question_id_list):
+            flash('部分问题不存在', 'danger')
+            return redirect(url_for('admin.edit_survey', survey_id=survey_id))
+        
+        for question in questions:
+            if question.survey_id != survey_id:
+                flash('不能批量删除不同问卷的问题', 'danger')
+                return redirect(url_for('admin.edit_survey', survey_id=survey_id))
+        
+        # 删除与这些问题相关的所有投票记录
+        with results_session(survey_id) as results:
+            results.query(Vote).filter(Vote.question_id.in_(question_id_list)).delete(synchronize_session='fetch')
+        
+        # 删除选中的问题
+        for question in questions:
+            db.session.delete(question)
+        
+        bump_data_version(survey_id)
+        db.session.commit()
+        invalidate_snapshot(survey_id)
+        flash(f'已成功删除 {len(questions)} 个问题', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'批量删除失败: {e}', 'danger')
+        survey_id = survey_id if 'survey_id' in locals() else None
+    
+    return redirect(url_for('admin.edit_survey', survey_id=survey_id) if survey_id else url_for('admin.dashboard'))
+
+def apply_question_order(survey_id, ordered_ids):
+    """用一条 UPDATE 语句按给定顺序重写问卷中问题的排序键（间隔为 ORDER_GAP）"""
+    if not ordered_ids:
+        return
+    Question.query.filter(Question.survey_id == survey_id, Question.id.in_(ordered_ids)).update(
+        {Question.order_index: db.case(
+            {q_id: (idx + 1) * ORDER_GAP for idx, q_id in enumerate(ordered_ids)},
+            value=Question.id
+        )},
+        synchronize_session=False
+    )
+
+def renumber_questions(survey_id):
+    """把问卷的排序键重新拉开为等间隔"""
+    ordered_ids = [row[0] for row in db.session.query(Question.id).filter_by(survey_id=survey_id)
+                   .order_by(Question.order_index, Question.id).all()]
+    apply_question_order(survey_id, ordered_ids)
+
+def renumber_questions_job(survey_id):
+    """后台重新编号任务，由数据库写入线程执行"""
+    try:
+        renumber_questions(survey_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+def _order_key_between(lo, hi):
+    """返回严格位于 lo 与 hi 之间的排序键，没有空间时返回 None"""
+    if hi - lo < 2:
+        return None
+    return (lo + hi) // 2
+
+def _neighbours(question, before, limit=2):
+    """按 (order_index, id) 顺序取问题前面或后面相邻的若干个问题"""
+    order_index = question.order_index or 0
+    query = Question.query.filter(Question.survey_id == question.survey_id)
+    if before:
+        query = query.filter(db.or_(
+            Question.order_index < order_index,
+            db.and_(Question.order_index == order_index, Question.id < question.id)
+        )).order_by(Question.order_index.desc(), Question.id.desc())
+    else:
+        query = query.filter(db.or_(
+            Question.order_index > order_index,
+            db.and_(Question.order_index == order_index, Question.id > question.id)
+        )).order_by(Question.order_index, Question.id)
+    return query.limit(limit).all()
+
+def _new_order_key(question, direction):
+    """计算移动后的排序键；无法移动返回 False，排序键没有空间返回 None"""
+    if direction in ('up', 'top'):
+        neighbours = _neighbours(question, before=True)
+        if not neighbours:
+            return False
+        if direction == 'top':
+            first = db.session.query(db.func.min(Question.order_index)).filter_by(survey_id=question.survey_id).scalar() or 0
+            return first - ORDER_GAP
+        if len(neighbours) == 1:
+            return neighbours[0].order_index - ORDER_GAP
+        return _order_key_between(neighbours[1].order_index, neighbours[0].order_index)
+    if direction in ('down', 'bottom'):
+        neighbours = _neighbours(question, before=False)
+        if not neighbours:
+            return False
+        if direction == 'bottom':
+            last = db.session.query(db.func.max(Question.order_index)).filter_by(survey_id=question.survey_id).scalar() or 0
+            return last + ORDER_GAP
+        if len(neighbours) == 1:
+            return neighbours[0].order_index + ORDER_GAP
+        return _order_key_between(neighbours[0].order_index, neighbours[1].order_index)
+    return False
+
+@admin_bp.route('/admin/move_question/<int:question_id>/<direction>', methods=['POST'])
+def move_question(question_id, direction):
+    """移动问题顺序（上移、下移、置顶、置底）
+
+    排序键之间留有间隔，移动时只改写当前问题一行；间隔用尽时先整体重新编号。
+    """
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    try:
+        question = Question.query.get_or_404(question_id)
+        survey_id = question.survey_id
+        
+        new_key = _new_order_key(question, direction)
+        if new_key is None:
+            # 相邻问题之间没有空位（包括旧数据中排序键相同的情况），重新编号后再计算
+            renumber_questions(survey_id)
+            db.session.flush()
+            db.session.refresh(question)
+            new_key = _new_order_key(question, direction)
+        if new_key is False or new_key is None:
+            return {'success': False, 'message': '无法移动'}, 400
+        
+        question.order_index = new_key
+        bump_data_version(survey_id)
+        db.session.commit()
+        
+        # 间隔过小时交给后台线程重新编号，下次移动时仍能只改写一行
+        if direction in ('up', 'down'):
+            neighbours = _neighbours(question, before=True, limit=1) + _neighbours(question, before=False, limit=1)
+            if any(abs(n.order_index - new_key) < ORDER_GAP_LOW_WATER for n in neighbours):
+                submit_queue.put((renumber_questions_job, (survey_id,), {}))
+        return {'success': True, 'message': '移动成功'}, 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f'移动问题失败: {e}')
+        return {'success': False, 'message': f'移动失败: {str(e)}'}, 500
+
+@admin_bp.route('/admin/reorder_questions/<int:survey_id>', methods=['POST'])
+def reorder_questions(survey_id):
+    """按拖拽后的完整顺序一次性重排问卷的所有问题
+
+    请求体为 JSON：{"question_ids": [按新顺序排列的问题ID]}
+    """
+    guard = ensure_admin_session()
+    if guard:
+        return guard
+    Survey.query.get_or_404(survey_id)
+    
+    payload = request.get_json(silent=True) or {}
+    try:
+        ordered_ids = [int(q_id) for q_id in payload.get('question_ids', [])]
+    except (TypeError, ValueError):
+        return {'success': False, 'message': '问题ID格式错误'}, 400
+    
+    existing_ids = {row[0] for row in db.session.query(Question.id).filter_by(survey_id=survey_id).all()}
+    if len(ordered_ids) != len(set(ordered_ids)) or set(ordered_ids) != existing_ids:
+        return {'success': False, 'message': '问题列表与问卷不一致，请刷新页面后重试'}, 400
+    
+    try:
+        apply_question_order(survey_id, ordered_ids)
+        bump_data_version(survey_id)
+        db.session.commit()
+        return {'success': True, 'message': '排序已保存'}, 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f'问题排序失败: {e}')
+        return {'success': False, 'message': f'排序失败: {str(e)}'}, 500
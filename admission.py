@@ -0,0 +1,121 @@
+"""投票提交的准入控制
+
+投票写入队列没有长度上限，突发提交时内存增长、写入延迟上升，所有人都受影响。
+提交投票前依次检查：
+1. 写入队列长度达到高水位，或队列中最早的投票等待过久：整体过载，直接拒绝；
+2. 每位投票人的令牌桶：限制同一个人连续重复提交；
+3. 每个问卷的令牌桶：限制单个问卷的提交速率，避免一个会场占满写入线程。
+
+被拒绝的请求返回 503 和 Retry-After，由调用方负责保留已填写的内容。
+速率或阈值设为 0 表示不做该项检查。
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from writer import queue_depth, writer_lag
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多积累 capacity 个"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now):
+        """取一个令牌，成功返回 0，否则返回需要等待的秒数"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class Rejection:
+    """拒绝原因及建议的重试等待秒数"""
+
+    __slots__ = ('reason', 'retry_after')
+
+    # 原因 -> 提示文字
+    MESSAGES = {
+        'queue': '当前提交人数较多，服务器正在处理',
+        'lag': '当前提交人数较多，服务器正在处理',
+        'client': '提交过于频繁',
+        'survey': '当前问卷提交人数较多',
+    }
+
+    def __init__(self, reason, retry_after):
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+    @property
+    def message(self):
+        return self.MESSAGES[self.reason]
+
+
+class AdmissionController:
+    def __init__(self, queue_high_water=0, max_lag=0, client_rate=0, client_burst=1,
+                 survey_rate=0, survey_burst=1, retry_after=5, max_clients=10000):
+        self.queue_high_water = queue_high_water
+        self.max_lag = max_lag
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.survey_rate = survey_rate
+        self.survey_burst = survey_burst
+        self.retry_after = retry_after
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._clients = OrderedDict()  # 按最近使用排序，超过 max_clients 时淘汰最久未用的
+        self._surveys = {}
+
+    def _client_bucket(self, key, now):
+        bucket = self._clients.get(key)
+        if bucket is None:
+            bucket = self._clients[key] = TokenBucket(self.client_rate, self.client_burst, now)
+            if len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(key)
+        return bucket
+
+    def _survey_bucket(self, survey_id, now):
+        bucket = self._surveys.get(survey_id)
+        if bucket is None:
+            bucket = self._surveys[survey_id] = TokenBucket(self.survey_rate, self.survey_burst, now)
+        return bucket
+
+    def check(self, survey_id, client_key):
+        """放行返回 None，否则返回 Rejection"""
+        # 按问卷分库时各问卷的写入队列互不影响，只看本问卷所在的队列
+        if self.queue_high_water and queue_depth(survey_id) >= self.queue_high_water:
+            return Rejection('queue', self.retry_after)
+        if self.max_lag and writer_lag(survey_id) >= self.max_lag:
+            return Rejection('lag', self.retry_after)
+        if not self.client_rate and not self.survey_rate:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            client = None
+            if self.client_rate:
+                client = self._client_bucket(client_key, now)
+                wait = client.take(now)
+                if wait:
+                    return Rejection('client', wait)
+            if self.survey_rate:
+                wait = self._survey_bucket(survey_id, now).take(now)
+                if wait:
+                    if client is not None:
+                        client.refund()  # 未放行，不消耗个人配额
+                    return Rejection('survey', wait)
+        return None
@@ -0,0 +1,148 @@
+"""投票端的 ASGI 入口
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5005
+
+手机在慢速网络下上传表格、接收页面时，连接由 asyncio 事件循环维持，不占用处理线程：
+请求体全部读完后才交给线程池中的 Flask 应用处理，响应生成完毕后再由事件循环异步发送。
+线程只在实际处理请求时占用，同时在线的客户端数量不再受线程数限制。
+投票校验通过后直接放入写入队列，不等待数据库写入。
+
+默认只加载投票端（APP_MODE=voter），管理后台仍通过 serve.py 单独部署。
+"""
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# 必须在导入应用之前设置：未显式指定运行模式时只加载投票端
+os.environ.setdefault('APP_MODE', 'voter')
+
+from app import app  # noqa: E402
+from config import ASGI_THREADS, ASGI_MAX_BODY_BYTES  # noqa: E402
+from writer import stop_accepting, shutdown_writer  # noqa: E402
+
+
+class VoterASGI:
+    """把 Flask（WSGI）应用包装为 ASGI 应用：网络读写走事件循环，业务处理走线程池"""
+
+    def __init__(self, wsgi_app, threads=ASGI_THREADS, max_body_bytes=ASGI_MAX_BODY_BYTES):
+        self.wsgi_app = wsgi_app
+        self.max_body_bytes = max_body_bytes
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='voter')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.handle_http(scope, receive, send)
+        else:
+            raise NotImplementedError(f"不支持的连接类型: {scope['type']}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # 服务器已停止接收新连接：不再接收投票，等待写入队列写完
+                stop_accepting()
+                await asyncio.get_running_loop().run_in_executor(None, shutdown_writer)
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle_http(self, scope, receive, send):
+        body = await self.read_body(scope, receive)
+        if body is None:
+            await self.send_response(send, 413, [(b'content-type', b'text/plain; charset=utf-8')],
+                                     [f'请求内容超过 {self.max_body_bytes} 字节'.encode('utf-8')])
+            return
+        if body is False:
+            return  # 客户端已断开
+        environ = self.build_environ(scope, body)
+        loop = asyncio.get_running_loop()
+        status, headers, chunks = await loop.run_in_executor(self.executor, self.run_wsgi, environ)
+        await self.send_response(send, status, headers, chunks)
+
+    async def read_body(self, scope, receive):
+        """异步读完请求体；超过上限返回 None，客户端中途断开返回 False"""
+        for name, value in scope['headers']:
+            if name == b'content-length' and value.isdigit() and int(value) > self.max_body_bytes:
+                return None
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return False
+            body += message.get('body', b'')
+            if len(body) > self.max_body_bytes:
+                return None
+            if not message.get('more_body', False):
+                return bytes(body)
+
+    def build_environ(self, scope, body):
+        """按 PEP 3333 由 ASGI scope 构造 WSGI environ"""
+        root_path = scope.get('root_path', '')
+        path = scope['path']
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+            'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin-1')
+            value = value.decode('latin-1')
+            if name == 'content-type':
+                environ['CONTENT_TYPE'] = value
+                continue
+            if name == 'content-length':
+                continue
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def run_wsgi(self, environ):
+        """在线程池中执行 Flask 应用，返回 (状态码, 响应头, 响应体分块)"""
+        response = {}
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            return chunks.append
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                if chunk:
+                    chunks.append(chunk)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], chunks
+
+    async def send_response(self, send, status, headers, chunks):
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b''.join(chunks)})
+
+
+application = VoterASGI(app)
@@ -0,0 +1,341 @@
+"""表格问卷的紧凑投票存储
+
+按行存储时，表格问卷的每个 (问题, 人名) 单元格都是一条 Vote 记录；
+紧凑存储时，每位投票人在每个问卷只有一条 table_ballot 记录，
+cells 字段是一个字节数组，每个字节对应一个单元格的选项编码：
+0 表示未作答，1..26 对应选项 A..Z。
+
+单元格的位置由 ballot_layout 决定：布局记录了生成选票时问卷中
+标准问题与人名的ID顺序，单元格下标 = 问题序号 × 人名数量 + 人名序号。
+问卷结构变化后写入的选票会使用新的布局，旧选票仍按原布局解码；
+已删除的问题或人名对应的单元格在解码时被忽略。
+自定义单选组件的投票和主观题回答仍按原方式存储。
+
+投票页面提交表格时也使用同样的单元格顺序：客户端把整张表格打包为一个字符串
+（每个单元格一个选项字母，'-' 表示未作答），连同结构指纹一起提交，
+服务端按缓存的单元格映射一次遍历解码。
+"""
+import functools
+import heapq
+import itertools
+import json
+import logging
+import zlib
+
+from sqlalchemy import text, bindparam, DateTime
+
+logger = logging.getLogger(__name__)
+
+STORAGE_ROWS = 'rows'
+STORAGE_PACKED = 'packed'
+
+EMPTY_CODE = 0
+CODE_OFFSET = ord('A') - 1
+
+# numpy 只在解码（结果查看、导出）时使用，投票写入路径不加载
+
+
+@functools.lru_cache(maxsize=None)
+def option_labels():
+    """编码 -> 选项字母的 numpy 数组，下标 0 为未作答"""
+    import numpy as np
+    return np.array([''] + [chr(CODE_OFFSET + code) for code in range(1, 27)], dtype=object)
+
+
+def is_packed(survey):
+    return survey.type == 'table' and getattr(survey, 'ballot_storage', None) == STORAGE_PACKED
+
+
+def encode_option(score):
+    """选项字母 -> 字节编码"""
+    if len(score) != 1 or not 'A' <= score <= 'Z':
+        raise ValueError(f'无法紧凑存储的选项: {score!r}')
+    return ord(score) - CODE_OFFSET
+
+
+def _load_json(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+
+class BallotLayout:
+    """单元格布局：标准问题ID × 人名ID"""
+
+    def __init__(self, layout_id, question_ids, respondent_ids):
+        self.id = layout_id
+        self.question_ids = list(question_ids)
+        self.respondent_ids = list(respondent_ids)
+        self.size = len(self.question_ids) * len(self.respondent_ids)
+        self._index = None
+
+    @property
+    def cell_index(self):
+        """(问题ID, 人名ID) -> 单元格下标"""
+        if self._index is None:
+            width = len(self.respondent_ids)
+            self._index = {
+                (q_id, r_id): qi * width + ri
+                for qi, q_id in enumerate(self.question_ids)
+                for ri, r_id in enumerate(self.respondent_ids)
+            }
+        return self._index
+
+    def cell_arrays(self):
+        """每个单元格对应的问题ID、人名ID数组（已删除的问题或人名为 -1）"""
+        import numpy as np
+        questions = np.array([q if q is not None else -1 for q in self.question_ids], dtype=np.int64)
+        respondents = np.array([r if r is not None else -1 for r in self.respondent_ids], dtype=np.int64)
+        return np.repeat(questions, len(respondents)), np.tile(respondents, len(questions))
+
+
+def _is_custom(component_type, custom_options):
+    return component_type == 'custom_single_choice' or bool(_load_json(custom_options))
+
+
+PAYLOAD_EMPTY = '-'
+
+
+class CellMap:
+    """投票页面提交时使用的单元格顺序：按问题顺序，每个问题下按人名顺序"""
+
+    def __init__(self, question_ids, respondent_ids):
+        self.question_ids = question_ids
+        self.respondent_ids = respondent_ids
+        self.cells = [(q_id, r_id) for q_id in question_ids for r_id in respondent_ids]
+        fingerprint = ','.join(map(str, question_ids)) + ';' + ','.join(map(str, respondent_ids))
+        self.token = format(zlib.crc32(fingerprint.encode('ascii')), '08x')
+
+
+@functools.lru_cache(maxsize=256)
+def cell_map(question_ids, respondent_ids):
+    """按 (标准问题ID元组, 人名ID元组) 缓存单元格映射"""
+    return CellMap(question_ids, respondent_ids)
+
+
+def decode_payload(payload, cells, options):
+    """一次遍历解码紧凑提交的表格，返回 ([(问题ID, 人名ID, 选项)], 未作答单元格数)
+
+    长度不符或含有不可用的选项时抛出 ValueError。
+    """
+    if len(payload) != len(cells.cells):
+        raise ValueError(f'表格数据长度不符: {len(payload)} != {len(cells.cells)}')
+    table_votes = []
+    missing = 0
+    for (q_id, r_id), option in zip(cells.cells, payload):
+        if option == PAYLOAD_EMPTY:
+            missing += 1
+        elif option in options:
+            table_votes.append((q_id, r_id, option))
+        else:
+            raise ValueError(f'无效的选项: {option!r}')
+    return table_votes, missing
+
+
+def schema_ids(session, survey_id):
+    """问卷当前的标准问题ID（按显示顺序）和人名ID"""
+    questions = session.execute(text(
+        "SELECT id, component_type, custom_options FROM question "
+        "WHERE survey_id = :survey_id ORDER BY order_index, id"
+    ), {'survey_id': survey_id}).all()
+    respondents = session.execute(text(
+        "SELECT id FROM table_respondent WHERE survey_id = :survey_id ORDER BY id"
+    ), {'survey_id': survey_id}).scalars().all()
+    return [q_id for q_id, component_type, custom_options in questions
+            if not _is_custom(component_type, custom_options)], list(respondents)
+
+
+def load_layouts(session, survey_id):
+    rows = session.execute(text(
+        "SELECT id, question_ids, respondent_ids FROM ballot_layout WHERE survey_id = :survey_id"
+    ), {'survey_id': survey_id}).all()
+    return {row[0]: BallotLayout(row[0], _load_json(row[1]), _load_json(row[2])) for row in rows}
+
+
+def current_layout(session, survey_id, now):
+    """返回与问卷当前结构一致的布局，结构变化后新建一个布局"""
+    question_ids, respondent_ids = schema_ids(session, survey_id)
+    row = session.execute(text(
+        "SELECT id, question_ids, respondent_ids FROM ballot_layout "
+        "WHERE survey_id = :survey_id ORDER BY id DESC LIMIT 1"
+    ), {'survey_id': survey_id}).first()
+    if row is not None and _load_json(row[1]) == question_ids and _load_json(row[2]) == respondent_ids:
+        return BallotLayout(row[0], question_ids, respondent_ids)
+    sql = (
+        "INSERT INTO ballot_layout (survey_id, question_ids, respondent_ids, created_at) "
+        "VALUES (:survey_id, :question_ids, :respondent_ids, :created_at)"
+    )
+    params = {
+        'survey_id': survey_id,
+        'question_ids': json.dumps(question_ids),
+        'respondent_ids': json.dumps(respondent_ids),
+        'created_at': now,
+    }
+    if session.get_bind().dialect.insert_returning:
+        layout_id = session.execute(text(sql + " RETURNING id"), params).scalar_one()
+    else:
+        layout_id = session.execute(text(sql), params).lastrowid
+    return BallotLayout(layout_id, question_ids, respondent_ids)
+
+
+def pack_cells(layout, table_votes):
+    """把 [(问题ID, 人名ID, 选项)] 编码为字节数组，返回 (字节串, 已作答单元格数)"""
+    cells = bytearray(layout.size)
+    index = layout.cell_index
+    for q_id, respondent_id, score in table_votes:
+        position = index.get((q_id, respondent_id))
+        if position is None:
+            continue
+        try:
+            cells[position] = encode_option(score)
+        except ValueError as e:
+            # 提交时已校验选项，这里只防御校验之前入队的数据：该单元格记为未作答，不丢弃整张选票
+            logger.warning(f"{e}，单元格记为未作答: question_id={q_id}, respondent_id={respondent_id}")
+    return bytes(cells), layout.size - cells.count(EMPTY_CODE)
+
+
+def save_ballot(session, survey_id, user_id, table_votes, now):
+    """写入（替换）一位投票人的紧凑选票，不提交事务；返回已作答单元格数"""
+    layout = current_layout(session, survey_id, now)
+    cells, cell_count = pack_cells(layout, table_votes)
+    # (survey_id, user_id) 上有唯一索引，SQLite 与 PostgreSQL 都支持 ON CONFLICT 写法
+    session.execute(text(
+        "INSERT INTO table_ballot (survey_id, user_id, layout_id, cells, cell_count, created_at) "
+        "VALUES (:survey_id, :user_id, :layout_id, :cells, :cell_count, :created_at) "
+        "ON CONFLICT (survey_id, user_id) DO UPDATE SET "
+        "layout_id = excluded.layout_id, cells = excluded.cells, "
+        "cell_count = excluded.cell_count, created_at = excluded.created_at"
+    ), {
+        'survey_id': survey_id, 'user_id': user_id, 'layout_id': layout.id,
+        'cells': cells, 'cell_count': cell_count, 'created_at': now,
+    })
+    return cell_count
+
+
+def iter_ballot_cells(session, survey_id, chunk_size=5000, since=None):
+    """按块解码选票，每块产出一个由 numpy 数组组成的字典，每个元素对应一个已作答的单元格
+
+    字典的键：user_id, question_id, respondent_id, code, created_at
+    since 不为空时只解码该时间之后写入的选票（分析快照增量刷新时使用）
+    """
+    import numpy as np
+    layouts = load_layouts(session, survey_id)
+    if not layouts:
+        return
+    question_ids, respondent_ids = schema_ids(session, survey_id)
+    live_questions = np.array(question_ids, dtype=np.int64)
+    live_respondents = np.array(respondent_ids, dtype=np.int64)
+    cell_arrays, masks = {}, {}
+    for layout_id, layout in layouts.items():
+        cell_questions, cell_respondents = layout.cell_arrays()
+        cell_arrays[layout_id] = (cell_questions, cell_respondents)
+        masks[layout_id] = np.isin(cell_questions, live_questions) & np.isin(cell_respondents, live_respondents)
+
+    stmt = text(
+        "SELECT layout_id, user_id, cells, created_at FROM table_ballot WHERE survey_id = :survey_id "
+        + ("AND created_at >= :since " if since is not None else "")
+        + "ORDER BY layout_id, id"
+    )
+    if since is not None:
+        stmt = stmt.bindparams(bindparam('since', type_=DateTime))
+    result = session.execute(
+        stmt.columns(created_at=DateTime),
+        {'survey_id': survey_id, 'since': since},
+        execution_options={'yield_per': chunk_size},
+    )
+    for partition in result.partitions():
+        start = 0
+        while start < len(partition):
+            layout_id = partition[start][0]
+            end = start
+            while end < len(partition) and partition[end][0] == layout_id:
+                end += 1
+            block = partition[start:end]
+            start = end
+
+            layout = layouts[layout_id]
+            if layout.size == 0:
+                continue
+            matrix = np.frombuffer(b''.join(row[2] for row in block), dtype=np.uint8).reshape(len(block), layout.size)
+            rows, cols = np.nonzero((matrix != EMPTY_CODE) & masks[layout_id])
+            cell_questions, cell_respondents = cell_arrays[layout_id]
+            users = np.array([row[1] for row in block], dtype=np.int64)
+            created = np.empty(len(block), dtype=object)
+            created[:] = [row[3] for row in block]
+            yield {
+                'user_id': users[rows],
+                'question_id': cell_questions[cols],
+                'respondent_id': cell_respondents[cols],
+                'code': matrix[rows, cols],
+                'created_at': created[rows],
+            }
+
+
+def iter_sorted_ballot_votes(session, survey_id, question_rank, respondent_rank, chunk_size=5000):
+    """按 (问题名次, 人名名次, 选项) 顺序产出全部选票中已作答的单元格：(用户ID, 问题ID, 人名ID, 选项, 时间)
+
+    question_rank / respondent_rank 为 ID -> 名次。每种布局的单元格位置只排序一次，
+    每张选票按该顺序逐个产出已作答的单元格，再用 heapq.merge 归并各张选票；
+    内存中只保留选票的原始字节，不展开全部单元格。
+    """
+    layouts = load_layouts(session, survey_id)
+    if not layouts:
+        return
+    question_ids, respondent_ids = schema_ids(session, survey_id)
+    live_questions, live_respondents = set(question_ids), set(respondent_ids)
+    orders = {}
+    for layout_id, layout in layouts.items():
+        width = len(layout.respondent_ids)
+        positions = sorted(
+            (question_rank[q_id], respondent_rank[r_id], qi * width + ri, q_id, r_id)
+            for qi, q_id in enumerate(layout.question_ids) if q_id in live_questions
+            for ri, r_id in enumerate(layout.respondent_ids) if r_id in live_respondents
+        )
+        # 名次相同（问题或人名同名）的单元格分为一组，产出时再按选项排序
+        orders[layout_id] = [
+            (ranks, [cell[2:] for cell in group])
+            for ranks, group in itertools.groupby(positions, key=lambda cell: cell[:2])
+        ]
+
+    def ballot_cells(layout_id, user_id, cells, created_at):
+        for ranks, group in orders[layout_id]:
+            found = [(cells[position], q_id, r_id) for position, q_id, r_id in group if cells[position] != EMPTY_CODE]
+            if len(found) > 1:
+                found.sort(key=lambda cell: cell[0])
+            for code, q_id, r_id in found:
+                yield ranks + (code,), user_id, q_id, r_id, code, created_at
+
+    result = session.execute(
+        text(
+            "SELECT layout_id, user_id, cells, created_at FROM table_ballot WHERE survey_id = :survey_id "
+            "ORDER BY layout_id, id"
+        ).columns(created_at=DateTime),
+        {'survey_id': survey_id},
+        execution_options={'yield_per': chunk_size},
+    )
+    streams = [ballot_cells(layout_id, user_id, bytes(cells), created_at)
+               for partition in result.partitions() for layout_id, user_id, cells, created_at in partition]
+    for _, user_id, q_id, r_id, code, created_at in heapq.merge(*streams, key=lambda cell: cell[0]):
+        yield user_id, q_id, r_id, chr(CODE_OFFSET + code), created_at
+
+
+def iter_ballot_votes(session, survey_id, chunk_size=5000):
+    """逐个产出选票中已作答的单元格：(用户ID, 问题ID, 人名ID, 选项, 时间)"""
+    labels = option_labels()
+    for cells in iter_ballot_cells(session, survey_id, chunk_size):
+        yield from zip(
+            cells['user_id'].tolist(), cells['question_id'].tolist(), cells['respondent_id'].tolist(),
+            labels[cells['code']].tolist(), cells['created_at'].tolist(),
+        )
+
+
+def count_ballot_cells(session, survey_id, chunk_size=5000):
+    """统计各 (问题ID, 人名ID, 选项) 的作答人数"""
+    import numpy as np
+    labels = option_labels()
+    totals = {}
+    for cells in iter_ballot_cells(session, survey_id, chunk_size):
+        keys = np.stack([cells['question_id'], cells['respondent_id'], cells['code'].astype(np.int64)], axis=1)
+        unique, counts = np.unique(keys, axis=0, return_counts=True)
+        for (q_id, respondent_id, code), count in zip(unique.tolist(), counts.tolist()):
+            key = (q_id, respondent_id, labels[code])
+            totals[key] = totals.get(key, 0) + count
+    return totals
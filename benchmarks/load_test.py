@@ -0,0 +1,316 @@
+"""端到端压测：模拟一个会场的投票人同时扫码投票
+
+    python benchmarks/load_test.py --type table --questions 10 --respondents 30 --options 3 \\
+        --voters 300 --concurrency 50 [--server serve|asgi] [--packed] [--compare 上次结果.json]
+
+流程：
+1. 在临时数据目录中建库，按参数创建问卷（单选题或表格问卷），
+   用管理后台生成二维码的同一逻辑生成 N 个登录令牌；
+2. 以子进程启动本地服务（serve.py 或 uvicorn asgi:application），等待 /readyz 就绪；
+3. 每个虚拟投票人依次请求 /login/<令牌>、/vote/<问卷ID>、/submit_vote/<问卷ID>，
+   并发数由 --concurrency 控制；
+4. 最后一个提交返回后，轮询数据库直到全部投票写入，得到写入队列排空时间。
+
+结果（各步骤的 p50/p95/p99 延迟、吞吐量、排空时间、数据库大小）输出到终端，
+并保存为 JSON（默认 benchmarks/results/load_<时间>.json），便于不同版本之间对比。
+不依赖外部网络和第三方压测工具。
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+STEPS = ('login', 'vote_page', 'submit')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='DemoVote 端到端压测')
+    parser.add_argument('--type', choices=('single_choice', 'table'), default='table', help='问卷类型')
+    parser.add_argument('--questions', type=int, default=10, help='问题数')
+    parser.add_argument('--respondents', type=int, default=20, help='人名数（仅表格问卷）')
+    parser.add_argument('--options', type=int, default=3, help='每题选项数')
+    parser.add_argument('--packed', action='store_true', help='表格问卷使用紧凑存储')
+    parser.add_argument('--subjective', action='store_true', help='附带主观题回答')
+    parser.add_argument('--voters', type=int, default=200, help='投票人数（生成的二维码数）')
+    parser.add_argument('--concurrency', type=int, default=50, help='同时投票的客户端数')
+    parser.add_argument('--server', choices=('serve', 'asgi'), default='serve', help='被测服务的启动方式')
+    parser.add_argument('--threads', type=int, default=16, help='被测服务的处理线程数')
+    parser.add_argument('--drain-timeout', type=float, default=120, help='等待写入队列排空的最长时间（秒）')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    parser.add_argument('--output', help='结果 JSON 的保存路径')
+    parser.add_argument('--compare', help='与之前保存的结果 JSON 对比')
+    parser.add_argument('--keep-data', action='store_true', help='保留临时数据目录')
+    return parser.parse_args(argv)
+
+
+def percentile(sorted_values, pct):
+    """最近秩法百分位数"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(samples):
+    values = sorted(samples)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values) * 1000, 2),
+        'p50_ms': round(percentile(values, 50) * 1000, 2),
+        'p95_ms': round(percentile(values, 95) * 1000, 2),
+        'p99_ms': round(percentile(values, 99) * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2),
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def seed_survey(args):
+    """在当前数据目录中创建被测问卷和登录令牌，返回 (问卷ID, 令牌列表, 表单构造函数)"""
+    from app import app
+    from admin import create_qr_tokens
+    from ballots import STORAGE_PACKED, STORAGE_ROWS, schema_ids, cell_map
+    from models import db, Survey, Question, TableRespondent
+
+    letters = 'ABCDE'[:args.options] if args.type == 'table' else [chr(ord('A') + i) for i in range(args.options)]
+    with app.app_context():
+        survey = Survey(
+            name=f'压测-{args.type}',
+            type=args.type,
+            table_option_count=args.options,
+            subjective_question_prompt='意见和建议' if args.subjective else None,
+            ballot_storage=STORAGE_PACKED if args.packed else STORAGE_ROWS,
+        )
+        db.session.add(survey)
+        db.session.flush()
+        for i in range(args.questions):
+            db.session.add(Question(
+                survey_id=survey.id, content=f'问题{i + 1}', order_index=(i + 1) * 1024,
+                option_count=args.options if args.type == 'single_choice' else None,
+            ))
+        if args.type == 'table':
+            db.session.add_all([TableRespondent(survey_id=survey.id, name=f'人名{i + 1}') for i in range(args.respondents)])
+        db.session.commit()
+        tokens = create_qr_tokens(db.session, survey.id, args.voters)
+
+        question_ids, respondent_ids = schema_ids(db.session, survey.id)
+        survey_id = survey.id
+    cells = cell_map(tuple(question_ids), tuple(respondent_ids))
+
+    def build_form(rng):
+        if args.type == 'table':
+            form = {
+                'ballot': ''.join(rng.choice(letters) for _ in cells.cells),
+                'ballot_schema': cells.token,
+            }
+        else:
+            form = {f'question_{q_id}': rng.choice(letters) for q_id in question_ids}
+        if args.subjective:
+            form['subjective_answer'] = '压测意见' * rng.randint(1, 20)
+        return form
+
+    return survey_id, tokens, build_form
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """不自动跟随重定向，按重定向目标判断请求结果"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def request(opener, url, data=None):
+    """返回 (状态码, 重定向目标, 耗时秒数)"""
+    started = time.perf_counter()
+    try:
+        with opener.open(url, data, timeout=60) as response:
+            response.read()
+            status, location = response.status, None
+    except urllib.error.HTTPError as e:
+        e.read()
+        status, location = e.code, e.headers.get('Location')
+    return status, location, time.perf_counter() - started
+
+
+def run_voter(base_url, survey_id, token, form):
+    """一个投票人的完整流程，返回 (各步骤耗时, 错误信息)"""
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect)
+    timings = {}
+    try:
+        status, location, timings['login'] = request(opener, f'{base_url}/login/{token}')
+        if status != 302 or f'/vote/{survey_id}' not in (location or ''):
+            return timings, f'login {status} {location}'
+        status, _, timings['vote_page'] = request(opener, f'{base_url}/vote/{survey_id}')
+        if status != 200:
+            return timings, f'vote_page {status}'
+        body = urllib.parse.urlencode(form).encode('utf-8')
+        status, location, timings['submit'] = request(opener, f'{base_url}/submit_vote/{survey_id}', body)
+        if status != 302 or '/thank_you' not in (location or ''):
+            return timings, f'submit {status} {location}'
+    except (OSError, urllib.error.URLError) as e:
+        return timings, f'{type(e).__name__}: {e}'
+    return timings, None
+
+
+def start_server(args, port, env, log_path):
+    if args.server == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1',
+                   '--port', str(port), '--log-level', 'warning']
+        env = dict(env, ASGI_THREADS=str(args.threads))
+    else:
+        command = [sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(port),
+                   '--threads', str(args.threads), '--connection-limit', str(max(1000, args.concurrency * 2))]
+    with open(log_path, 'wb') as log:
+        process = subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            with open(log_path, encoding='utf-8', errors='replace') as log:
+                raise RuntimeError(f'服务启动失败:\n{log.read()}')
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/readyz', timeout=1) as response:
+                if response.status == 200:
+                    return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('服务在 60 秒内未就绪')
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def count_written(survey_id):
+    """已写入数据库的投票人数"""
+    from sqlalchemy import text
+    from app import app
+    from models import db
+    with app.app_context():
+        return db.session.execute(text(
+            "SELECT COUNT(*) FROM (SELECT user_id FROM vote WHERE survey_id = :survey_id "
+            "UNION SELECT user_id FROM table_ballot WHERE survey_id = :survey_id "
+            "UNION SELECT user_id FROM subjective_answer WHERE survey_id = :survey_id)"
+        ), {'survey_id': survey_id}).scalar()
+
+
+def database_bytes(database_path):
+    return sum(os.path.getsize(path) for path in (database_path, database_path + '-wal') if os.path.exists(path))
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    data_dir = tempfile.mkdtemp(prefix='demovote-bench-')
+    # 必须在导入应用之前设置，压测数据不写入正式数据库
+    os.environ['INSTANCE_DIR'] = data_dir
+    sys.path.insert(0, ROOT_DIR)
+    from config import DATABASE_PATH
+
+    survey_id, tokens, build_form = seed_survey(args)
+    forms = [build_form(rng) for _ in tokens]
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, INSTANCE_DIR=data_dir, APP_MODE='voter' if args.server == 'asgi' else 'full')
+    server = start_server(args, port, env, os.path.join(data_dir, 'server.log'))
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            outcomes = list(pool.map(lambda pair: run_voter(base_url, survey_id, *pair), zip(tokens, forms)))
+        submitted_at = time.perf_counter()
+        errors = [error for _, error in outcomes if error]
+        expected = len(outcomes) - len(errors)
+
+        written = count_written(survey_id)
+        while written < expected and time.perf_counter() - submitted_at < args.drain_timeout:
+            time.sleep(0.05)
+            written = count_written(survey_id)
+        drained_at = time.perf_counter()
+    finally:
+        stop_server(server)
+
+    wall = submitted_at - started
+    result = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'keep_data')},
+        'voters': len(outcomes),
+        'succeeded': expected,
+        'errors': len(errors),
+        'error_samples': sorted(set(errors))[:10],
+        'wall_seconds': round(wall, 3),
+        'throughput_voters_per_s': round(expected / wall, 2) if wall else None,
+        'latency': {step: summarize([t[step] for t, _ in outcomes if step in t]) for step in STEPS},
+        'written': written,
+        'queue_drain_seconds': round(drained_at - submitted_at, 3) if written >= expected else None,
+        'database_bytes': database_bytes(DATABASE_PATH),
+    }
+    if args.keep_data:
+        result['data_dir'] = data_dir
+    else:
+        import shutil
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return result
+
+
+def print_result(result, previous=None):
+    print(f"投票人 {result['voters']}，成功 {result['succeeded']}，失败 {result['errors']}，"
+          f"耗时 {result['wall_seconds']} 秒，吞吐 {result['throughput_voters_per_s']} 人/秒")
+    for sample in result['error_samples']:
+        print(f"  失败示例: {sample}")
+    for step in STEPS:
+        stats = result['latency'][step]
+        if not stats['count']:
+            continue
+        line = f"  {step:<10} p50 {stats['p50_ms']:>8} ms  p95 {stats['p95_ms']:>8} ms  p99 {stats['p99_ms']:>8} ms"
+        old = (previous or {}).get('latency', {}).get(step)
+        if old and old.get('count'):
+            line += f"  (上次 p95 {old['p95_ms']} ms)"
+        print(line)
+    print(f"  写入队列排空 {result['queue_drain_seconds']} 秒，数据库 {result['database_bytes'] / 1024 / 1024:.2f} MB")
+    if previous:
+        print(f"  上次：吞吐 {previous.get('throughput_voters_per_s')} 人/秒，"
+              f"排空 {previous.get('queue_drain_seconds')} 秒，数据库 {previous.get('database_bytes', 0) / 1024 / 1024:.2f} MB")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+    result = run(args)
+    output = args.output or os.path.join(RESULTS_DIR, f"load_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print_result(result, previous)
+    print(f"结果已保存: {output}")
+    return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
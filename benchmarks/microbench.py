@@ -0,0 +1,277 @@
+"""导出与二维码 PDF 的微基准测试，带基线回归检查
+
+    python benchmarks/microbench.py                       # 运行并与基线对比，超出阈值时退出码为 1
+    python benchmarks/microbench.py --save-baseline       # 运行并把结果保存为新的基线
+    python benchmarks/microbench.py --voters 100,1000 --storage rows,packed --qr 16,128
+
+在临时数据目录中按参数批量生成问卷和投票数据，分别测量以下步骤的耗时、内存峰值和输出大小：
+- export.rows / export.rows_sorted：按块读取原始数据（"原始数据"、"按问题排列"工作表的数据来源）
+- export.stats：数据库分组计数生成"统计结果"工作表
+- export.xlsx / export.csv：完整的导出文件写入
+- qr.render / qr.png / qr.pdf：二维码图片生成、PNG 编码、PDF 排版
+
+耗时取多次运行的最小值；内存峰值由 tracemalloc 单独运行一次测得（只统计 Python 分配的内存）。
+基线与机器相关，换机器后需要重新 --save-baseline。
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from io import BytesIO
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT_DIR, 'benchmarks', 'baseline.json')
+EXPORT_CASES = ('export.rows', 'export.rows_sorted', 'export.stats', 'export.xlsx', 'export.csv')
+QR_CASES = ('qr.render', 'qr.png', 'qr.pdf')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='DemoVote 导出与二维码微基准测试')
+    parser.add_argument('--type', choices=('single_choice', 'table'), default='table', help='问卷类型')
+    parser.add_argument('--voters', default='100,500', help='投票人数，逗号分隔可测多组')
+    parser.add_argument('--questions', type=int, default=10, help='问题数')
+    parser.add_argument('--respondents', type=int, default=20, help='人名数（仅表格问卷）')
+    parser.add_argument('--options', type=int, default=3, help='每题选项数')
+    parser.add_argument('--storage', default='rows,packed', help='表格问卷的存储方式，逗号分隔：rows,packed')
+    parser.add_argument('--qr', default='16,64', help='二维码数量，逗号分隔可测多组')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，耗时取最小值')
+    parser.add_argument('--only', help='只运行名称以此开头的测试项，例如 export 或 qr.pdf')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线文件路径')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    parser.add_argument('--time-tolerance', type=float, default=0.25, help='耗时允许超出基线的比例')
+    parser.add_argument('--min-delta-ms', type=float, default=5, help='耗时增加少于该毫秒数时不视为回归')
+    parser.add_argument('--memory-tolerance', type=float, default=0.20, help='内存峰值允许超出基线的比例')
+    parser.add_argument('--output', help='本次结果 JSON 的保存路径')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    return parser.parse_args(argv)
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def seed_results(args, voters, storage, rng):
+    """批量生成一个问卷及 voters 位投票人的数据，返回问卷ID"""
+    from sqlalchemy import text
+    from ballots import STORAGE_PACKED, current_layout, pack_cells
+    from models import db, Survey, Question, TableRespondent, get_current_time
+
+    letters = [chr(ord('A') + i) for i in range(args.options)]
+    now = get_current_time()
+    survey = Survey(name=f'基准-{args.type}-{storage}-{voters}', type=args.type,
+                    table_option_count=args.options, ballot_storage=storage,
+                    subjective_question_prompt='意见和建议')
+    db.session.add(survey)
+    db.session.flush()
+    questions = [Question(survey_id=survey.id, content=f'问题 {i + 1}', order_index=(i + 1) * 1024,
+                          option_count=args.options) for i in range(args.questions)]
+    db.session.add_all(questions)
+    respondents = []
+    if args.type == 'table':
+        respondents = [TableRespondent(survey_id=survey.id, name=f'人名{i + 1}') for i in range(args.respondents)]
+        db.session.add_all(respondents)
+    db.session.flush()
+
+    first_user = (db.session.execute(text('SELECT MAX(id) FROM "user"')).scalar() or 0) + 1
+    user_ids = list(range(first_user, first_user + voters))
+    db.session.execute(text(
+        'INSERT INTO "user" (id, username, password_hash, is_admin) VALUES (:id, :username, \'-\', 0)'
+    ), [{'id': u, 'username': f'user_{u:08d}'} for u in user_ids])
+
+    if args.type == 'table' and storage == STORAGE_PACKED:
+        layout = current_layout(db.session, survey.id, now)
+        ballots = []
+        for user_id in user_ids:
+            cells, count = pack_cells(layout, [(q.id, r.id, rng.choice(letters)) for q in questions for r in respondents])
+            ballots.append({'survey_id': survey.id, 'user_id': user_id, 'layout_id': layout.id,
+                            'cells': cells, 'cell_count': count, 'created_at': now})
+        db.session.execute(text(
+            "INSERT INTO table_ballot (survey_id, user_id, layout_id, cells, cell_count, created_at) "
+            "VALUES (:survey_id, :user_id, :layout_id, :cells, :cell_count, :created_at)"
+        ), ballots)
+    else:
+        cells = [(q.id, r.id) for q in questions for r in respondents] if args.type == 'table' else [(q.id, None) for q in questions]
+        db.session.execute(text(
+            "INSERT INTO vote (user_id, survey_id, question_id, table_respondent_id, score, created_at) "
+            "VALUES (:user_id, :survey_id, :question_id, :respondent_id, :score, :created_at)"
+        ), [{'user_id': u, 'survey_id': survey.id, 'question_id': q_id, 'respondent_id': r_id,
+             'score': rng.choice(letters), 'created_at': now}
+            for u in user_ids for q_id, r_id in cells])
+    db.session.execute(text(
+        "INSERT INTO subjective_answer (user_id, survey_id, content, created_at) "
+        "VALUES (:user_id, :survey_id, :content, :created_at)"
+    ), [{'user_id': u, 'survey_id': survey.id, 'content': '意见' * rng.randint(1, 30), 'created_at': now}
+        for u in user_ids[::5]])
+    db.session.commit()
+    return survey.id
+
+
+def measure(func, repeat):
+    """返回 (最短耗时, 内存峰值字节数, 输出大小)；先空跑一次预热缓存"""
+    output = func()
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak, output
+
+
+def export_cases(survey_id):
+    """导出相关的测试项：名称 -> 返回输出大小（行数或字节数）的函数"""
+    from models import db, Survey
+    from exports import iter_vote_rows, build_stats, write_results_xlsx, write_results_csv
+
+    def survey():
+        db.session.expire_all()
+        return db.session.get(Survey, survey_id)
+
+    def count_rows(sort):
+        return lambda: {'rows': sum(1 for _ in iter_vote_rows(db.session, survey(), sort=sort))}
+
+    def write_with(writer):
+        def run():
+            buffer = BytesIO()
+            writer(db.session, survey(), buffer)
+            return {'bytes': buffer.tell()}
+        return run
+
+    return {
+        'export.rows': count_rows(False),
+        'export.rows_sorted': count_rows(True),
+        'export.stats': lambda: {'rows': len(build_stats(db.session, survey())[1])},
+        'export.xlsx': write_with(write_results_xlsx),
+        'export.csv': write_with(write_results_csv),
+    }
+
+
+def qr_cases(count, rng):
+    from qr_sheets import load_title_font, render_qr_image, encode_png, write_qr_pdf
+
+    font = load_title_font()
+    urls = [f'http://192.168.1.100:5005/login/{rng.getrandbits(128):032x}' for _ in range(count)]
+    title = '基准测试问卷'
+    images = [render_qr_image(url, title, font) for url in urls]
+    pngs = [encode_png(img) for img in images]
+
+    def pdf():
+        buffer = BytesIO()
+        write_qr_pdf(pngs, buffer)
+        return {'bytes': buffer.tell()}
+
+    return {
+        'qr.render': lambda: {'images': len([render_qr_image(url, title, font) for url in urls])},
+        'qr.png': lambda: {'bytes': sum(len(encode_png(img)) for img in images)},
+        'qr.pdf': pdf,
+    }
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    data_dir = tempfile.mkdtemp(prefix='demovote-microbench-')
+    # 必须在导入应用之前设置，测试数据不写入正式数据库
+    os.environ['INSTANCE_DIR'] = data_dir
+    sys.path.insert(0, ROOT_DIR)
+    from app import app
+
+    storages = args.storage.split(',') if args.type == 'table' else ['rows']
+    export_names = [name for name in EXPORT_CASES if not args.only or name.startswith(args.only)]
+    qr_names = [name for name in QR_CASES if not args.only or name.startswith(args.only)]
+    results = {}
+    try:
+        with app.app_context():
+            for voters in _int_list(args.voters) if export_names else []:
+                for storage in storages:
+                    label = f'{args.type}-{storage}-v{voters}-q{args.questions}'
+                    if args.type == 'table':
+                        label += f'-r{args.respondents}'
+                    survey_id = seed_results(args, voters, storage, rng)
+                    cases = export_cases(survey_id)
+                    for name in export_names:
+                        _run_case(results, f'{name}[{label}]', cases[name], args.repeat)
+            for count in _int_list(args.qr) if qr_names else []:
+                cases = qr_cases(count, rng)
+                for name in qr_names:
+                    _run_case(results, f'{name}[n{count}]', cases[name], args.repeat)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return results
+
+
+def _run_case(results, key, func, repeat):
+    seconds, peak_bytes, output = measure(func, repeat)
+    result = results[key] = {'seconds': round(seconds, 4), 'peak_bytes': peak_bytes, 'output': output}
+    output = ', '.join(f'{k}={v}' for k, v in result['output'].items())
+    print(f"{key:<52} {result['seconds'] * 1000:>10.1f} ms  峰值 {result['peak_bytes'] / 1024 / 1024:>8.2f} MB  {output}", flush=True)
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance, min_delta_ms=0):
+    """与基线对比，返回超出阈值的项目说明列表"""
+    failures = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        slower = result['seconds'] - base['seconds']
+        if base['seconds'] and result['seconds'] > base['seconds'] * (1 + time_tolerance) and slower * 1000 >= min_delta_ms:
+            failures.append(f"{key} 耗时 {result['seconds'] * 1000:.1f} ms，基线 {base['seconds'] * 1000:.1f} ms")
+        if base['peak_bytes'] and result['peak_bytes'] > base['peak_bytes'] * (1 + memory_tolerance):
+            failures.append(f"{key} 内存峰值 {result['peak_bytes'] / 1024 / 1024:.2f} MB，"
+                            f"基线 {base['peak_bytes'] / 1024 / 1024:.2f} MB")
+    return failures
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': datetime.now().isoformat(timespec='seconds'), 'results': results},
+                      f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"基线已保存: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"没有基线文件 {args.baseline}，使用 --save-baseline 保存本次结果作为基线")
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    failures = compare(results, baseline, args.time_tolerance, args.memory_tolerance, args.min_delta_ms)
+    missing = [key for key in results if key not in baseline]
+    if missing:
+        print(f"基线中没有以下 {len(missing)} 项，未参与对比: {', '.join(missing)}")
+    if failures:
+        print("超出基线阈值：")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("全部在基线阈值内")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
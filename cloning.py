@@ -0,0 +1,50 @@
+"""问卷复制与模板实例化
+
+问卷、问题、人名都通过 INSERT ... SELECT 在数据库内复制，不经过 ORM 对象，
+也不在 Python 中深拷贝 custom_options / option_limits 等 JSON 字段。
+"""
+from sqlalchemy import select, literal, insert
+
+
+def _insert_from_select(conn, table, overrides, where, returning_id=False):
+    """把 table 中满足 where 的行复制一份，overrides 中的列使用给定值"""
+    columns = [c for c in table.columns if not c.primary_key]
+    selected = [
+        literal(overrides[c.name], type_=c.type).label(c.name) if c.name in overrides else c
+        for c in columns
+    ]
+    stmt = insert(table).from_select([c.name for c in columns], select(*selected).where(where))
+    if not returning_id:
+        return conn.execute(stmt).rowcount
+    if conn.dialect.insert_returning:
+        return conn.execute(stmt.returning(table.c.id)).scalar_one()
+    return conn.execute(stmt).lastrowid
+
+
+def clone_survey(conn, metadata, source_id, name, now, is_template=False, is_active=True):
+    """复制一个问卷（含问题和人名，不含投票和二维码），返回新问卷ID
+
+    Args:
+        conn: 数据库连接（由调用方控制事务）
+        metadata: 包含 survey / question / table_respondent 表的 MetaData
+        source_id: 源问卷ID
+        name: 新问卷名称
+        now: 新记录的创建时间
+    """
+    survey = metadata.tables['survey']
+    question = metadata.tables['question']
+    respondent = metadata.tables['table_respondent']
+
+    survey_overrides = {'name': name, 'created_at': now, 'is_active': is_active,
+                        'is_template': is_template, 'data_version': 0}
+    new_id = _insert_from_select(conn, survey, survey_overrides, survey.c.id == source_id, returning_id=True)
+    _insert_from_select(conn, question, {'survey_id': new_id, 'created_at': now},
+                        question.c.survey_id == source_id)
+    _insert_from_select(conn, respondent, {'survey_id': new_id, 'created_at': now},
+                        respondent.c.survey_id == source_id)
+    return new_id
+
+
+def instantiate_template(conn, metadata, template_id, names, now):
+    """按名称列表从模板批量创建问卷，返回新问卷ID列表"""
+    return [clone_survey(conn, metadata, template_id, name, now) for name in names]
@@ -0,0 +1,254 @@
+"""问卷冷存储：归档与恢复
+
+把已关闭的问卷（结构、投票、主观题回答、二维码以及相关用户）导出到
+gzip 压缩的 JSON Lines 归档文件后从数据库中删除，需要时再恢复。
+归档文件首行为文件头（含各表结构），末行为各表行数，用于恢复前校验完整性。
+"""
+import base64
+import gzip
+import json
+import os
+import logging
+from datetime import datetime, date
+
+from sqlalchemy import MetaData, Table, inspect, select, Boolean, DateTime, Date, LargeBinary
+
+from purge import ArchiveWriter, purge_survey_data, SURVEY_TABLES
+from database import copy_rows
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT = 'demovote-survey-archive'
+ARCHIVE_FORMAT_VERSION = 1
+ARCHIVE_PREFIX = 'cold_'
+ARCHIVE_SUFFIX = '.jsonl.gz'
+
+# 归档顺序：恢复时先建立问卷、问题、人名、用户的新旧ID映射，再写入投票
+ARCHIVE_TABLES = ('survey', 'question', 'table_respondent', 'ballot_layout', 'qr_code', 'user',
+                  'vote', 'table_ballot', 'subjective_answer')
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _reflect(engine, names):
+    """反射各表结构；主库中没有的表到附加的数据库中查找（按问卷分库时问卷、问题等表在附加的目录库中）"""
+    metadata = MetaData()
+    inspector = inspect(engine)
+    schemas = [None] + [name for name in inspector.get_schema_names() if name != 'main']
+    tables = {}
+    for name in names:
+        schema = next((s for s in schemas if inspector.has_table(name, schema=s)), None)
+        tables[name] = Table(name, metadata, autoload_with=engine, schema=schema, resolve_fks=False)
+    return tables
+
+
+def _scope_clause(tables, name, survey_id):
+    t = tables[name]
+    if name == 'survey':
+        return t.c.id == survey_id
+    if name == 'user':
+        # 参与过该问卷的用户，以及持有该问卷二维码的用户
+        vote, answer, qr_code = tables['vote'], tables['subjective_answer'], tables['qr_code']
+        voted = select(vote.c.user_id).where(vote.c.survey_id == survey_id)
+        balloted = select(tables['table_ballot'].c.user_id).where(tables['table_ballot'].c.survey_id == survey_id)
+        answered = select(answer.c.user_id).where(answer.c.survey_id == survey_id)
+        scanned = select(qr_code.c.token).where(qr_code.c.survey_id == survey_id)
+        return t.c.id.in_(voted) | t.c.id.in_(balloted) | t.c.id.in_(answered) | t.c.qr_code.in_(scanned)
+    return t.c.survey_id == survey_id
+
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    return value
+
+
+def _decode_row(table, row):
+    """把归档中的行转换为当前表结构可插入的值，忽略已不存在的列"""
+    values = {}
+    for name, value in row.items():
+        if name not in table.c:
+            continue
+        column_type = table.c[name].type
+        if value is not None and isinstance(column_type, DateTime):
+            value = datetime.fromisoformat(value)
+        elif value is not None and isinstance(column_type, Date):
+            value = date.fromisoformat(value)
+        elif value is not None and isinstance(column_type, LargeBinary):
+            value = base64.b64decode(value)
+        elif value is not None and isinstance(column_type, Boolean):
+            value = bool(value)  # SQLite 中迁移添加的布尔列以 0 / 1 归档
+        values[name] = value
+    return values
+
+
+def archive_survey(engine, survey_id, path, chunk_size=5000):
+    """把问卷完整导出到归档文件，并从数据库中删除；返回各表行数
+
+    归档文件写完并校验通过后才开始删除，删除失败时归档文件仍然保留。
+    """
+    tables = _reflect(engine, ARCHIVE_TABLES)
+    schema = {
+        name: [{'name': c.name, 'type': str(c.type)} for c in table.columns]
+        for name, table in tables.items()
+    }
+    tmp_path = path + '.tmp'
+    counts = {}
+    with engine.connect() as conn:
+        survey = conn.execute(select(tables['survey']).where(tables['survey'].c.id == survey_id)).mappings().first()
+        if survey is None:
+            raise ArchiveError(f'问卷不存在: survey_id={survey_id}')
+        header = {
+            'format': ARCHIVE_FORMAT,
+            'version': ARCHIVE_FORMAT_VERSION,
+            'survey_id': survey_id,
+            'survey_name': survey['name'],
+            'survey_type': survey['type'],
+            'archived_at': datetime.now().isoformat(timespec='seconds'),
+            'schema': schema,
+        }
+        with ArchiveWriter(tmp_path, header=header) as archive:
+            for name in ARCHIVE_TABLES:
+                table = tables[name]
+                result = conn.execute(
+                    select(table).where(_scope_clause(tables, name, survey_id)).order_by(table.c.id),
+                    execution_options={'yield_per': chunk_size},
+                )
+                counts[name] = 0
+                for partition in result.mappings().partitions():
+                    for row in partition:
+                        archive.write(name, {k: _encode(v) for k, v in row.items()})
+                    counts[name] += len(partition)
+            archive.write('__footer__', {'counts': counts})
+
+    if read_archive_header(tmp_path)[1] != counts:
+        raise ArchiveError('归档文件校验失败')
+    os.replace(tmp_path, path)
+
+    # 用户表为各问卷共用，不随问卷删除
+    purge_survey_data(engine, survey_id, SURVEY_TABLES, chunk_size=chunk_size)
+    logger.info(f"问卷已归档: survey_id={survey_id}, 文件={path}, 行数={counts}")
+    return counts
+
+
+def read_archive_header(path):
+    """读取归档文件的文件头和末行的行数统计；文件不完整时行数为 None"""
+    header, counts = None, None
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if header is None:
+                if record.get('table') != '__header__' or record['row'].get('format') != ARCHIVE_FORMAT:
+                    raise ArchiveError('不是有效的问卷归档文件')
+                header = record['row']
+            elif record.get('table') == '__footer__':
+                counts = record['row']['counts']
+    return header, counts
+
+
+def list_archives(directory):
+    """列出目录中的问卷归档文件，返回 [{'filename', 'survey_name', 'archived_at', 'size'}]"""
+    archives = []
+    if not os.path.isdir(directory):
+        return archives
+    for filename in sorted(os.listdir(directory), reverse=True):
+        if not (filename.startswith(ARCHIVE_PREFIX) and filename.endswith(ARCHIVE_SUFFIX)):
+            continue
+        path = os.path.join(directory, filename)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                header = json.loads(f.readline())['row']
+        except (OSError, ValueError, KeyError):
+            logger.warning(f"无法读取归档文件: {path}")
+            continue
+        archives.append({
+            'filename': filename,
+            'survey_name': header.get('survey_name'),
+            'survey_type': header.get('survey_type'),
+            'archived_at': header.get('archived_at'),
+            'size': os.path.getsize(path),
+        })
+    return archives
+
+
+def restore_survey(engine, path, chunk_size=5000):
+    """从归档文件恢复问卷，返回新问卷的ID
+
+    问卷、问题、人名使用新分配的ID；用户按用户名匹配已有用户，不存在时重新创建。
+    整个恢复过程在一个事务中完成。
+    """
+    header, counts = read_archive_header(path)
+    if counts is None:
+        raise ArchiveError('归档文件不完整，无法恢复')
+
+    tables = _reflect(engine, ARCHIVE_TABLES)
+    id_maps = {name: {} for name in ('survey', 'question', 'table_respondent', 'ballot_layout', 'user')}
+    pending = {'vote': [], 'table_ballot': [], 'subjective_answer': []}
+
+    def flush(conn, name):
+        if pending[name]:
+            copy_rows(conn, tables[name], pending[name])
+            pending[name] = []
+
+    with engine.begin() as conn, gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            name, row = record['table'], record['row']
+            if name in ('__header__', '__footer__'):
+                continue
+            table = tables[name]
+            values = _decode_row(table, row)
+            old_id = values.pop('id', None)
+
+            if name == 'survey':
+                values['is_active'] = True
+                id_maps['survey'][old_id] = conn.execute(table.insert().values(**values)).inserted_primary_key[0]
+            elif name in ('question', 'table_respondent'):
+                values['survey_id'] = id_maps['survey'][values['survey_id']]
+                id_maps[name][old_id] = conn.execute(table.insert().values(**values)).inserted_primary_key[0]
+            elif name == 'ballot_layout':
+                # 布局中已删除的问题、人名没有新ID，解码时会被忽略
+                values['survey_id'] = id_maps['survey'][values['survey_id']]
+                values['question_ids'] = [id_maps['question'].get(i) for i in values['question_ids']]
+                values['respondent_ids'] = [id_maps['table_respondent'].get(i) for i in values['respondent_ids']]
+                id_maps[name][old_id] = conn.execute(table.insert().values(**values)).inserted_primary_key[0]
+            elif name == 'qr_code':
+                values['survey_id'] = id_maps['survey'][values['survey_id']]
+                exists = conn.execute(select(table.c.id).where(table.c.token == values['token'])).first()
+                if not exists:
+                    conn.execute(table.insert().values(**values))
+            elif name == 'user':
+                existing = conn.execute(select(table.c.id).where(table.c.username == values['username'])).scalar()
+                if existing is None:
+                    existing = conn.execute(table.insert().values(**values)).inserted_primary_key[0]
+                id_maps['user'][old_id] = existing
+            elif name == 'vote':
+                values['user_id'] = id_maps['user'][values['user_id']]
+                # 早期归档中的投票没有 survey_id 列，统一使用新问卷ID
+                values['survey_id'] = next(iter(id_maps['survey'].values()))
+                values['question_id'] = id_maps['question'][values['question_id']]
+                if values.get('table_respondent_id') is not None:
+                    values['table_respondent_id'] = id_maps['table_respondent'].get(values['table_respondent_id'])
+                pending[name].append(values)
+            elif name == 'table_ballot':
+                values['user_id'] = id_maps['user'][values['user_id']]
+                values['survey_id'] = id_maps['survey'][values['survey_id']]
+                values['layout_id'] = id_maps['ballot_layout'][values['layout_id']]
+                pending[name].append(values)
+            elif name == 'subjective_answer':
+                values['user_id'] = id_maps['user'][values['user_id']]
+                values['survey_id'] = id_maps['survey'][values['survey_id']]
+                pending[name].append(values)
+
+            if name in pending and len(pending[name]) >= chunk_size:
+                flush(conn, name)
+        for name in pending:
+            flush(conn, name)
+
+    new_survey_id = next(iter(id_maps['survey'].values()))
+    logger.info(f"问卷已从归档恢复: 文件={path}, 新问卷ID={new_survey_id}, 行数={counts}")
+    return new_survey_id
@@ -0,0 +1,195 @@
+"""列式分析数据导出（Parquet / Arrow IPC / gzip CSV）
+
+投票数据按整数编码输出：用户、问题、人名、选项都以紧凑的整数编码表示，
+对应的文字内容作为字典存放在文件元数据中（CSV 格式则随附 dictionaries.json）。
+数据按块从数据库读取，逐批写入，内存占用与问卷规模无关。
+Parquet / Arrow 依赖 pyarrow，仅在导出时才导入。
+"""
+import csv
+import gzip
+import io
+import json
+import zipfile
+from contextlib import nullcontext
+
+from sqlalchemy import text, DateTime
+
+from ballots import is_packed, iter_ballot_cells, option_labels
+
+METADATA_KEY = b'demovote'
+
+# 格式 -> (文件扩展名, MIME 类型)
+COLUMNAR_FORMATS = {
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.file'),
+    'csv.gz': ('csv.gz', 'application/gzip'),
+}
+
+COLUMNS = ['survey_id', 'user', 'question', 'respondent', 'option', 'created_at']
+
+
+def build_dictionaries(session, survey):
+    """构造问题、人名、选项、用户的整数编码字典"""
+    questions = session.execute(text(
+        "SELECT id, content, component_type, custom_options FROM question "
+        "WHERE survey_id = :survey_id ORDER BY order_index, id"
+    ), {'survey_id': survey.id}).all()
+    respondents = session.execute(text(
+        "SELECT id, name FROM table_respondent WHERE survey_id = :survey_id ORDER BY id"
+    ), {'survey_id': survey.id}).all()
+    options = session.execute(text(
+        "SELECT DISTINCT score FROM vote WHERE survey_id = :survey_id ORDER BY score"
+    ), {'survey_id': survey.id}).scalars().all()
+    if is_packed(survey):
+        # 紧凑选票的选项由问卷定义决定（提交时校验），不需要解码全部选票；
+        # 调低选项数之前写入的选票可能用到后面的选项，因此包含全部表格选项
+        options = sorted(set(options) | set('ABCDE'))
+    users = session.execute(text(
+        'SELECT u.id, u.username FROM "user" u '
+        'WHERE u.id IN (SELECT user_id FROM vote WHERE survey_id = :survey_id '
+        'UNION SELECT user_id FROM table_ballot WHERE survey_id = :survey_id) ORDER BY u.id'
+    ), {'survey_id': survey.id}).all()
+
+    def is_custom(component_type, custom_options):
+        return component_type == 'custom_single_choice' or bool(custom_options)
+
+    return {
+        'survey': {
+            'id': survey.id,
+            'name': survey.name,
+            'type': survey.type,
+            'table_option_count': survey.table_option_count,
+            'data_version': getattr(survey, 'data_version', None),
+        },
+        'questions': [
+            {'code': code, 'id': q_id, 'content': content,
+             'custom': is_custom(component_type, custom_options),
+             'custom_options': custom_options if isinstance(custom_options, dict) else (json.loads(custom_options) if custom_options else None)}
+            for code, (q_id, content, component_type, custom_options) in enumerate(questions)
+        ],
+        'respondents': [{'code': code, 'id': r_id, 'name': name} for code, (r_id, name) in enumerate(respondents)],
+        'options': [{'code': code, 'label': label} for code, label in enumerate(options)],
+        'users': [{'code': code, 'id': u_id, 'username': username} for code, (u_id, username) in enumerate(users)],
+    }
+
+
+def iter_coded_chunks(session, survey, dictionaries, chunk_size=50000):
+    """按块读取投票数据并转换为整数编码，每块产出一个 {列名: 列表} 字典"""
+    question_codes = {q['id']: q['code'] for q in dictionaries['questions']}
+    respondent_codes = {r['id']: r['code'] for r in dictionaries['respondents']}
+    option_codes = {o['label']: o['code'] for o in dictionaries['options']}
+    user_codes = {u['id']: u['code'] for u in dictionaries['users']}
+
+    result = session.execute(
+        text(
+            "SELECT v.user_id, v.question_id, v.table_respondent_id, v.score, v.created_at "
+            "FROM vote v WHERE v.survey_id = :survey_id"
+        ).columns(created_at=DateTime),
+        {'survey_id': survey.id},
+        execution_options={'yield_per': chunk_size},
+    )
+    for partition in result.partitions():
+        chunk = {name: [] for name in COLUMNS}
+        for user_id, question_id, respondent_id, score, created_at in partition:
+            chunk['survey_id'].append(survey.id)
+            chunk['user'].append(user_codes.get(user_id))
+            chunk['question'].append(question_codes.get(question_id))
+            chunk['respondent'].append(respondent_codes.get(respondent_id) if respondent_id is not None else None)
+            chunk['option'].append(option_codes.get(score))
+            chunk['created_at'].append(created_at)
+        yield chunk
+
+    if is_packed(survey):
+        # 选项编码 -> 字典编码，不在字典中的选项（校验之前写入的数据）为空
+        labels = option_labels()
+        code_options = [option_codes.get(label) for label in labels.tolist()]
+        for cells in iter_ballot_cells(session, survey.id, chunk_size):
+            yield {
+                'survey_id': [survey.id] * len(cells['code']),
+                'user': _lookup(user_codes, cells['user_id']),
+                'question': _lookup(question_codes, cells['question_id']),
+                'respondent': _lookup(respondent_codes, cells['respondent_id']),
+                'option': [code_options[code] for code in cells['code'].tolist()],
+                'created_at': cells['created_at'].tolist(),
+            }
+
+
+def _lookup(codes, values):
+    """按字典把 numpy 数组整体转换为编码列表（值均在字典中）"""
+    import numpy as np
+    keys = np.array(sorted(codes))
+    mapped = np.array([codes[k] for k in keys], dtype=np.int64)
+    return mapped[np.searchsorted(keys, values)].tolist()
+
+
+def _arrow_schema(dictionaries):
+    import pyarrow as pa
+    schema = pa.schema([
+        ('survey_id', pa.int32()),
+        ('user', pa.int32()),
+        ('question', pa.int32()),
+        ('respondent', pa.int32()),
+        ('option', pa.int16()),
+        ('created_at', pa.timestamp('us')),
+    ])
+    return schema.with_metadata({METADATA_KEY: json.dumps(dictionaries, ensure_ascii=False).encode('utf-8')})
+
+
+def _iter_record_batches(session, survey, schema, dictionaries, chunk_size):
+    import pyarrow as pa
+    for chunk in iter_coded_chunks(session, survey, dictionaries, chunk_size):
+        yield pa.RecordBatch.from_pydict(chunk, schema=schema)
+
+
+def write_parquet(session, survey, fileobj, chunk_size=50000):
+    import pyarrow.parquet as pq
+    dictionaries = build_dictionaries(session, survey)
+    schema = _arrow_schema(dictionaries)
+    with pq.ParquetWriter(fileobj, schema, compression='zstd') as writer:
+        for batch in _iter_record_batches(session, survey, schema, dictionaries, chunk_size):
+            writer.write_batch(batch)
+
+
+def write_arrow(session, survey, fileobj, chunk_size=50000):
+    import pyarrow as pa
+    dictionaries = build_dictionaries(session, survey)
+    schema = _arrow_schema(dictionaries)
+    with pa.ipc.new_file(fileobj, schema) as writer:
+        for batch in _iter_record_batches(session, survey, schema, dictionaries, chunk_size):
+            writer.write_batch(batch)
+
+
+def write_csv_gz(session, survey, fileobj, chunk_size=50000):
+    """写入 gzip 压缩的整数编码 CSV，返回编码字典（由调用方另行保存）"""
+    dictionaries = build_dictionaries(session, survey)
+    with gzip.GzipFile(fileobj=fileobj, mode='wb') as gz:
+        wrapper = io.TextIOWrapper(gz, encoding='utf-8', newline='')
+        writer = csv.writer(wrapper)
+        writer.writerow(COLUMNS)
+        for chunk in iter_coded_chunks(session, survey, dictionaries, chunk_size):
+            writer.writerows(zip(*(chunk[name] for name in COLUMNS)))
+        wrapper.flush()
+        wrapper.detach()
+    return dictionaries
+
+
+def write_bundle(session, surveys, fmt, fileobj, chunk_size=50000, session_for=None):
+    """把多个问卷导出到一个 zip 包中，每个问卷一个数据文件
+
+    CSV 格式没有内嵌元数据，编码字典写入同名的 .dictionaries.json。
+    按问卷分库时传入 session_for：问卷ID -> 该问卷投票数据所在 session 的上下文管理器。
+    """
+    ext, _ = COLUMNAR_FORMATS[fmt]
+    with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as bundle:
+        for survey in surveys:
+            base = f'survey_{survey.id}'
+            survey_session = session_for(survey.id) if session_for else nullcontext(session)
+            with survey_session as results, bundle.open(f'{base}.{ext}', 'w', force_zip64=True) as member:
+                if fmt == 'parquet':
+                    write_parquet(results, survey, member, chunk_size)
+                elif fmt == 'arrow':
+                    write_arrow(results, survey, member, chunk_size)
+                else:
+                    dictionaries = write_csv_gz(results, survey, member, chunk_size)
+            if fmt == 'csv.gz':
+                bundle.writestr(f'{base}.dictionaries.json', json.dumps(dictionaries, ensure_ascii=False, indent=2))
@@ -0,0 +1,98 @@
+"""应用配置与运行环境相关的辅助函数"""
+import os
+import secrets
+import socket
+
+from dotenv import load_dotenv
+
+# 加载 .env 文件
+load_dotenv()
+
+# 获取项目根目录
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INSTANCE_DIR = os.getenv('INSTANCE_DIR') or os.path.join(BASE_DIR, 'instance')  # 数据目录，压测等场景可指向临时目录
+os.makedirs(INSTANCE_DIR, exist_ok=True)
+
+# 配置：优先从 .env 文件读取，如果没有则使用环境变量或默认值
+PUBLIC_HOST = os.getenv('PUBLIC_HOST', '')  # 如果为空，将动态获取
+SECRET_KEY = os.getenv('SECRET_KEY', secrets.token_hex(32))
+ADMIN_GATE_KEY = os.getenv('ADMIN_GATE_KEY', 'wzkjgz')
+DATABASE_PATH = os.path.join(INSTANCE_DIR, 'votes.db')
+DATABASE_URL = os.getenv('DATABASE_URL') or f'sqlite:///{DATABASE_PATH}'  # 设置为 postgresql://... 时使用 PostgreSQL
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', 5005))
+DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 5000))  # 导出时每次从数据库读取的行数
+EXPORT_CACHE_DIR = os.path.join(INSTANCE_DIR, 'export_cache')
+EXPORT_CACHE_MAX_BYTES = int(os.getenv('EXPORT_CACHE_MAX_MB', 512)) * 1024 * 1024  # 导出缓存目录大小上限
+EXPORT_WAIT_SECONDS = float(os.getenv('EXPORT_WAIT_SECONDS', 60))  # 下载时等待后台生成的最长时间
+ARCHIVE_DIR = os.path.join(INSTANCE_DIR, 'archives')
+SHARD_BY_SURVEY = os.getenv('SHARD_BY_SURVEY', 'False').lower() == 'true'  # 每个问卷的投票数据写入单独的 SQLite 文件
+SHARD_DIR = os.path.join(INSTANCE_DIR, 'shards')
+SNAPSHOT_INTERVAL = float(os.getenv('SNAPSHOT_INTERVAL', 0))  # 分析快照的刷新间隔（秒），0 表示不启用，结果页和导出直接读数据库
+SNAPSHOT_DIR = os.path.join(INSTANCE_DIR, 'snapshots')
+SNAPSHOT_OVERLAP = float(os.getenv('SNAPSHOT_OVERLAP', 30))  # 增量刷新时向前多读的秒数，覆盖刷新时尚未提交的写入事务
+SNAPSHOT_MAX_PARTS = int(os.getenv('SNAPSHOT_MAX_PARTS', 16))  # 每个问卷的快照分区数超过该值时合并
+PARTICIPATION_FLUSH_INTERVAL = float(os.getenv('PARTICIPATION_FLUSH_INTERVAL', 10))  # 参与情况位图写回数据库的间隔（秒）
+PURGE_CHUNK_SIZE = int(os.getenv('PURGE_CHUNK_SIZE', 5000))  # 批量删除时每个事务删除的行数
+ORDER_GAP = 1024  # 问题排序键之间的间隔，移动问题时只需改写一行
+ORDER_GAP_LOW_WATER = 8  # 相邻排序键的间隔低于该值时在后台重新编号
+QUESTION_MAX_LENGTH = 2000  # 批量导入时问题内容的最大长度
+APP_MODE = os.getenv('APP_MODE', 'full')  # 'voter' 时只提供投票页面，不加载管理后台
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', 1))  # serve.py 的工作进程数，大于1时使用 gunicorn
+SERVER_THREADS = int(os.getenv('SERVER_THREADS', 16))  # 每个工作进程的处理线程数
+SERVER_CONNECTION_LIMIT = int(os.getenv('SERVER_CONNECTION_LIMIT', 1000))  # 单进程最大并发连接数
+SERVER_CHANNEL_TIMEOUT = int(os.getenv('SERVER_CHANNEL_TIMEOUT', 120))  # 空闲连接超时（秒）
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', 8))  # asgi.py 中处理请求的线程数
+ASGI_MAX_BODY_BYTES = int(os.getenv('ASGI_MAX_BODY_MB', 4)) * 1024 * 1024  # asgi.py 接收的请求体上限
+WRITER_THREADS = int(os.getenv('WRITER_THREADS', 4))  # 写入线程数（仅 PostgreSQL 等非 SQLite 数据库，SQLite 固定为1）
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', SERVER_THREADS + WRITER_THREADS))  # 连接池大小（SQLite 不使用），默认每个处理线程和写入线程各一个连接
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))  # 连接池满时最多额外建立的连接数
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))  # 等待空闲连接的最长时间（秒）
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # 连接使用超过该秒数后重建
+WRITER_DRAIN_TIMEOUT = float(os.getenv('WRITER_DRAIN_TIMEOUT', 30))  # 退出时等待写入队列写完的最长时间（秒）
+RESULTS_VERSION_INTERVAL = float(os.getenv('RESULTS_VERSION_INTERVAL', 1))  # 持续有投票写入时，问卷数据版本（导出缓存）最多每隔这么多秒递增一次
+ADMISSION_QUEUE_HIGH_WATER = int(os.getenv('ADMISSION_QUEUE_HIGH_WATER', 500))  # 写入队列达到该长度时拒绝新的投票提交
+ADMISSION_MAX_LAG = float(os.getenv('ADMISSION_MAX_LAG', 15))  # 队列中最早的投票等待超过该秒数时拒绝新的提交
+ADMISSION_CLIENT_RATE = float(os.getenv('ADMISSION_CLIENT_RATE', 0.2))  # 每位投票人每秒允许的提交次数
+ADMISSION_CLIENT_BURST = int(os.getenv('ADMISSION_CLIENT_BURST', 5))  # 每位投票人允许的连续提交次数
+ADMISSION_SURVEY_RATE = float(os.getenv('ADMISSION_SURVEY_RATE', 100))  # 每个问卷每秒允许的提交次数
+ADMISSION_SURVEY_BURST = int(os.getenv('ADMISSION_SURVEY_BURST', 300))  # 每个问卷允许的突发提交次数
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 5))  # 过载时建议客户端等待的秒数
+PROFILE_REQUESTS = os.getenv('PROFILE_REQUESTS', 'False').lower() == 'true'  # 记录每个请求的耗时和 SQL 条数
+PROFILE_QUERY_THRESHOLD = int(os.getenv('PROFILE_QUERY_THRESHOLD', 20))  # SQL 条数超过该值的请求写入警告日志
+PROFILE_SLOW_KEEP = int(os.getenv('PROFILE_SLOW_KEEP', 50))  # 保留最慢请求的个数
+
+
+def get_local_ip():
+    """获取本机IP地址"""
+    try:
+        # 创建一个UDP socket来获取本机IP
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # 不实际发送数据，只是用来获取本机IP
+        s.connect(('8.8.8.8', 80))
+        ip = s.getsockname()[0]
+        s.close()
+        return ip
+    except Exception:
+        try:
+            # 备用方法：通过hostname获取
+            hostname = socket.gethostname()
+            ip = socket.gethostbyname(hostname)
+            return ip
+        except Exception:
+            return '127.0.0.1'
+
+def get_public_host():
+    """动态获取PUBLIC_HOST，如果未设置则从请求中获取"""
+    if PUBLIC_HOST:
+        return PUBLIC_HOST
+    # 从请求中动态获取（如果可用）
+    try:
+        from flask import has_request_context, request as req
+        if has_request_context() and req:
+            return f"{req.scheme}://{req.host}/"
+    except:
+        pass
+    # 默认值（用于生成二维码时）
+    return f"http://localhost:{PORT}/"
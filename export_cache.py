@@ -0,0 +1,126 @@
+"""导出文件缓存
+
+导出文件按 (问卷, 数据版本, 格式) 缓存在磁盘上，由后台线程生成。
+数据版本在每次提交投票时递增，版本不变时直接返回已生成的文件；
+缓存目录总大小超过上限时按最近访问时间淘汰（LRU）。
+命中时在文件锁内打开文件，淘汰和失效也在锁内删除文件，
+返回的文件对象在下载过程中不会因文件被删除而失效。
+"""
+import os
+import glob
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class ExportCache:
+    def __init__(self, directory, max_bytes, max_workers=1):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export')
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()  # 打开与删除缓存文件互斥
+        self._jobs = {}  # (survey_id, version, fmt) -> Future
+
+    def path_for(self, survey_id, version, fmt):
+        return os.path.join(self.directory, f'survey_{survey_id}_v{version}.{fmt}')
+
+    def open(self, survey_id, version, fmt):
+        """打开已缓存的文件（二进制只读），未命中返回 None；调用方负责关闭"""
+        path = self.path_for(survey_id, version, fmt)
+        with self._file_lock:
+            try:
+                fileobj = open(path, 'rb')
+            except OSError:
+                return None
+            try:
+                # 更新修改时间作为最近访问时间，供 LRU 淘汰使用
+                os.utime(path)
+            except OSError:
+                pass
+        return fileobj
+
+    def submit(self, survey_id, version, fmt, generate):
+        """提交后台生成任务，同一个键同时只会生成一次
+
+        Args:
+            generate: 可调用对象，接收一个二进制文件对象并写入导出内容
+        Returns:
+            concurrent.futures.Future，结果为生成文件的路径
+        """
+        key = (survey_id, version, fmt)
+        with self._lock:
+            future = self._jobs.get(key)
+            if future is None:
+                future = self._executor.submit(self._generate, key, generate)
+                self._jobs[key] = future
+                future.add_done_callback(lambda _: self._forget(key))
+            return future
+
+    def _forget(self, key):
+        with self._lock:
+            self._jobs.pop(key, None)
+
+    def _generate(self, key, generate):
+        survey_id, version, fmt = key
+        path = self.path_for(survey_id, version, fmt)
+        if os.path.exists(path):
+            return path
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                generate(f)
+            os.replace(tmp_path, path)
+        except Exception:
+            logger.error(f"导出文件生成失败: survey_id={survey_id}, version={version}, format={fmt}", exc_info=True)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._remove_stale_versions(survey_id, fmt, keep=path)
+        self._evict(keep=path)
+        return path
+
+    def invalidate(self, survey_id):
+        """删除某个问卷的全部缓存文件"""
+        for path in glob.glob(os.path.join(self.directory, f'survey_{survey_id}_v*')):
+            self._remove(path)
+
+    def _remove_stale_versions(self, survey_id, fmt, keep):
+        # 数据版本只增不减，旧版本的文件不会再被命中
+        for path in glob.glob(os.path.join(self.directory, f'survey_{survey_id}_v*.{fmt}')):
+            if path != keep:
+                self._remove(path)
+
+    def _evict(self, keep):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            if self._remove(path):
+                total -= size
+
+    def _remove(self, path):
+        try:
+            with self._file_lock:
+                os.remove(path)
+            return True
+        except OSError:
+            # Windows 下正在被下载的文件无法删除，下次淘汰时再处理
+            return False
@@ -0,0 +1,237 @@
+"""投票结果导出
+
+按块从数据库读取投票数据，直接写入只写模式的工作簿（或CSV）文件对象，
+内存占用与问卷规模无关。
+"""
+import csv
+import heapq
+import io
+
+from sqlalchemy import text, DateTime
+
+from ballots import is_packed, iter_ballot_votes, iter_sorted_ballot_votes, count_ballot_cells
+
+# Excel 单个工作表的最大行数（含表头）
+XLSX_MAX_ROWS = 1048576
+
+SUBJECTIVE_DEFAULT_TITLE = "主观题回答"
+
+
+def _vote_rows_sql(survey, order_by=None):
+    """构造投票 + 主观题回答的查询语句
+
+    返回的列依次为：用户、问题、人名（仅表格问卷）、选项、时间
+    """
+    is_table = survey.type == 'table'
+    respondent_col = "COALESCE(r.name, '-') AS respondent, " if is_table else ""
+    respondent_join = "LEFT JOIN table_respondent r ON r.id = v.table_respondent_id " if is_table else ""
+    subjective_respondent = "NULL AS respondent, " if is_table else ""
+    sql = (
+        "SELECT u.username AS username, REPLACE(q.content, ' ', '-') AS question, "
+        f"{respondent_col}v.score AS option, v.created_at AS created_at "
+        "FROM vote v "
+        "JOIN question q ON q.id = v.question_id "
+        'JOIN "user" u ON u.id = v.user_id '
+        f"{respondent_join}"
+        "WHERE v.survey_id = :survey_id "
+        "UNION ALL "
+        "SELECT u.username AS username, :subjective_title AS question, "
+        f"{subjective_respondent}a.content AS option, a.created_at AS created_at "
+        "FROM subjective_answer a "
+        'JOIN "user" u ON u.id = a.user_id '
+        "WHERE a.survey_id = :survey_id"
+    )
+    if order_by:
+        sql += f" ORDER BY {order_by}"
+    return text(sql).columns(created_at=DateTime)
+
+
+def result_columns(survey):
+    """导出文件的列名"""
+    columns = ['用户', '问题', '选项', '时间']
+    if survey.type == 'table':
+        columns.insert(2, '人名')  # 在'问题'和'选项'之间插入'人名'
+    return columns
+
+
+def iter_vote_rows(session, survey, sort=False, chunk_size=5000):
+    """按块读取问卷的全部投票与主观题回答，逐行产出元组
+
+    Args:
+        session: SQLAlchemy 会话
+        survey: 问卷对象
+        sort: 是否按问题、人名、选项排序（对应"按问题排列"工作表）
+        chunk_size: 每次从数据库游标读取的行数
+    """
+    order_by = None
+    if sort:
+        order_by = "question, respondent, option" if survey.type == 'table' else "question, option"
+    subjective_title = (survey.subjective_question_prompt or SUBJECTIVE_DEFAULT_TITLE).replace(' ', '-')
+    result = session.execute(
+        _vote_rows_sql(survey, order_by),
+        {'survey_id': survey.id, 'subjective_title': subjective_title},
+        execution_options={'yield_per': chunk_size},
+    )
+    rows = (tuple(row) for partition in result.partitions() for row in partition)
+    if not is_packed(survey):
+        yield from rows
+        return
+    ballot_rows = _iter_ballot_rows(session, survey, sort, chunk_size)
+    if sort:
+        # 两路都已按 (问题, 人名, 选项) 排序，归并即可
+        yield from heapq.merge(rows, ballot_rows, key=row_sort_key)
+    else:
+        yield from rows
+        yield from ballot_rows
+
+
+def row_sort_key(row):
+    # 与 SQLite 的 ORDER BY 一致：NULL 排在最前
+    return row[1] or '', row[2] or '', row[3] or ''
+
+
+def _label_ranks(labels):
+    """ID -> 标签文本的名次（与 row_sort_key 一致），标签相同的ID名次相同，按选项继续排序"""
+    ranks = {label: rank for rank, label in enumerate(sorted({label or '' for label in labels.values()}))}
+    return {item_id: ranks[label or ''] for item_id, label in labels.items()}
+
+
+def _iter_ballot_rows(session, survey, sort=False, chunk_size=5000):
+    """解码紧凑存储的选票，产出与 _vote_rows_sql 结构相同的行"""
+    params = {'survey_id': survey.id}
+    usernames = dict(session.execute(text(
+        'SELECT u.id, u.username FROM "user" u '
+        'WHERE u.id IN (SELECT user_id FROM table_ballot WHERE survey_id = :survey_id)'
+    ), params).all())
+    questions = dict(session.execute(text(
+        "SELECT id, REPLACE(content, ' ', '-') FROM question WHERE survey_id = :survey_id"
+    ), params).all())
+    respondents = dict(session.execute(text(
+        "SELECT id, name FROM table_respondent WHERE survey_id = :survey_id"
+    ), params).all())
+
+    if sort:
+        # 各张选票分别按 (问题, 人名, 选项) 产出后归并，不需要把全部单元格读入内存排序
+        votes = iter_sorted_ballot_votes(
+            session, survey.id, _label_ranks(questions), _label_ranks(respondents), chunk_size
+        )
+    else:
+        votes = iter_ballot_votes(session, survey.id, chunk_size)
+    for user_id, q_id, respondent_id, option, created_at in votes:
+        yield usernames.get(user_id), questions.get(q_id), respondents.get(respondent_id, '-'), option, created_at
+
+
+def build_stats(session, survey):
+    """在数据库中分组计数，生成"统计结果"工作表的表头和数据行
+
+    只统计投票数据，主观题回答不参与选项计数。
+    """
+    rows = session.execute(text(
+        "SELECT v.question_id, v.table_respondent_id, v.score, COUNT(*) "
+        "FROM vote v WHERE v.survey_id = :survey_id "
+        "GROUP BY v.question_id, v.table_respondent_id, v.score"
+    ), {'survey_id': survey.id}).all()
+    counts = {}
+    for q_id, respondent_id, score, count in rows:
+        if survey.type != 'table':
+            respondent_id = None
+        key = (q_id, respondent_id, score)
+        counts[key] = counts.get(key, 0) + count
+    if is_packed(survey):
+        for key, count in count_ballot_cells(session, survey.id).items():
+            counts[key] = counts.get(key, 0) + count
+    return stats_table(session, survey, counts)
+
+
+def stats_table(session, survey, counts):
+    """由 {(问题ID, 人名ID, 选项): 票数} 生成"统计结果"工作表的表头和数据行
+
+    单选题问卷的人名ID为 None；session 只用于读取问题和人名。
+    """
+    questions = session.execute(text(
+        "SELECT id, REPLACE(content, ' ', '-'), component_type, custom_options FROM question "
+        "WHERE survey_id = :survey_id ORDER BY order_index, id"
+    ), {'survey_id': survey.id}).all()
+
+    if survey.type == 'table':
+        options = list('ABCDE')[:survey.table_option_count or 0]
+        options += sorted({score for _, _, score in counts if score not in options})
+        respondents = session.execute(text(
+            "SELECT id, name FROM table_respondent WHERE survey_id = :survey_id ORDER BY id"
+        ), {'survey_id': survey.id}).all()
+
+        header = ['问题', '人名'] + options
+        data = []
+        for q_id, content, component_type, custom_options in questions:
+            if component_type == 'custom_single_choice' or custom_options:
+                # 自定义单选组件没有人名
+                data.append([content, '-'] + [counts.get((q_id, None, o), 0) for o in options])
+                continue
+            for respondent_id, name in respondents:
+                data.append([content, name] + [counts.get((q_id, respondent_id, o), 0) for o in options])
+        return header, data
+
+    # 只列出有投票的问题
+    question_ids = {q_id for q_id, _, _, _ in questions}
+    per_question = {}
+    for (q_id, _, score), count in counts.items():
+        if q_id in question_ids:
+            per_question.setdefault(q_id, {})[score] = count
+    options = sorted({score for counter in per_question.values() for score in counter})
+    header = ['问题'] + options
+    data = [[content] + [per_question[q_id].get(o, 0) for o in options]
+            for q_id, content, _, _ in questions if q_id in per_question]
+    return header, data
+
+
+def _append_sheet(workbook, title, header, rows):
+    """向只写工作簿追加一个工作表，超过 Excel 行数上限时自动续写到新工作表"""
+    sheet_no = 1
+    sheet = workbook.create_sheet(title)
+    sheet.append(header)
+    written = 1
+    for row in rows:
+        if written >= XLSX_MAX_ROWS:
+            sheet_no += 1
+            sheet = workbook.create_sheet(f'{title}({sheet_no})')
+            sheet.append(header)
+            written = 1
+        sheet.append(row)
+        written += 1
+
+
+def write_xlsx(fileobj, columns, rows, sorted_rows, stats):
+    """把原始数据、按问题排列的数据和统计结果（表头, 数据行）写入 xlsx 文件对象"""
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    _append_sheet(workbook, '原始数据', columns, rows)
+    _append_sheet(workbook, '按问题排列', columns, sorted_rows)
+    header, data = stats
+    _append_sheet(workbook, '统计结果', header, data)
+    workbook.save(fileobj)
+
+
+def write_csv(fileobj, columns, rows):
+    """把原始数据写入 CSV 文件对象（UTF-8 BOM，便于 Excel 直接打开）"""
+    wrapper = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    writer = csv.writer(wrapper)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+    wrapper.flush()
+    wrapper.detach()
+
+
+def write_results_xlsx(session, survey, fileobj, chunk_size=5000):
+    """把问卷结果流式写入 xlsx 文件对象：排序和统计都在数据库中完成"""
+    write_xlsx(
+        fileobj, result_columns(survey),
+        iter_vote_rows(session, survey, chunk_size=chunk_size),
+        iter_vote_rows(session, survey, sort=True, chunk_size=chunk_size),
+        build_stats(session, survey),
+    )
+
+
+def write_results_csv(session, survey, fileobj, chunk_size=5000):
+    """把问卷原始数据流式写入 CSV 文件对象"""
+    write_csv(fileobj, result_columns(survey), iter_vote_rows(session, survey, chunk_size=chunk_size))
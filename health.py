@@ -0,0 +1,41 @@
+"""健康检查接口
+
+/healthz：进程存活即返回 200，供进程守护判断是否需要重启；
+/readyz：数据库可用、写入线程正在运行且没有进入退出流程时返回 200，
+否则返回 503，供负载均衡判断是否继续转发请求。
+"""
+import logging
+
+from flask import Blueprint, jsonify
+from sqlalchemy import text
+
+from models import db
+from writer import queue_depth, writer_alive, writer_lag, accepting_votes
+
+logger = logging.getLogger(__name__)
+
+health_bp = Blueprint('health', __name__)
+
+
+@health_bp.route('/healthz')
+def healthz():
+    return jsonify({'status': 'ok'})
+
+
+@health_bp.route('/readyz')
+def readyz():
+    checks = {'writer': writer_alive(), 'accepting': accepting_votes()}
+    try:
+        db.session.execute(text('SELECT 1'))
+        checks['database'] = True
+    except Exception as e:
+        logger.warning(f"就绪检查：数据库不可用: {e}")
+        checks['database'] = False
+    ready = all(checks.values())
+    body = {
+        'status': 'ready' if ready else 'unavailable',
+        'checks': checks,
+        'queue_depth': queue_depth(),
+        'writer_lag_seconds': round(writer_lag(), 3),
+    }
+    return jsonify(body), 200 if ready else 503
@@ -0,0 +1,150 @@
+"""批量导入问题与人名
+
+支持粘贴文本（每行一条）以及上传的 CSV / XLSX 文件（取每行第一个非空单元格，首行为表头时跳过）。
+逐行解析，与问卷中已有的内容做一次集合比对去重，再以多行 INSERT 在一个事务中写入，
+最后返回导入报告：成功、重复跳过、无效的行数。
+"""
+import codecs
+import csv
+import io
+
+from sqlalchemy import insert
+
+# CSV / XLSX 文件首行为以下表头时跳过（粘贴文本不跳过）
+HEADER_NAMES = {'问题', '题目', '内容', '人名', '姓名', '名字', 'name', 'question', 'content'}
+
+INSERT_BATCH_SIZE = 1000
+DECODE_CHUNK_SIZE = 64 * 1024
+MAX_INVALID_SAMPLES = 5
+
+
+class ImportReport:
+    def __init__(self):
+        self.accepted = 0
+        self.skipped = 0   # 与已有内容或本次导入中的前面行重复
+        self.invalid = 0   # 超长等无法导入的行
+        self.invalid_samples = []
+
+    def add_invalid(self, line_no, reason):
+        self.invalid += 1
+        if len(self.invalid_samples) < MAX_INVALID_SAMPLES:
+            self.invalid_samples.append(f'第{line_no}行：{reason}')
+
+    def summary(self, noun):
+        message = f'成功导入 {self.accepted} 个{noun}'
+        if self.skipped:
+            message += f'，跳过重复 {self.skipped} 个'
+        if self.invalid:
+            message += f'，无效 {self.invalid} 行（{"；".join(self.invalid_samples)}）'
+        return message
+
+
+def iter_text_lines(text):
+    """逐行产出粘贴文本中的 (行号, 内容)"""
+    for line_no, line in enumerate(io.StringIO(text), start=1):
+        yield line_no, line
+
+
+def _first_cell(values):
+    for value in values:
+        if value is not None and str(value).strip():
+            return str(value)
+    return ''
+
+
+def _skip_header(rows):
+    """跳过文件首行的表头"""
+    for line_no, value in rows:
+        if line_no == 1 and value.strip().lower() in HEADER_NAMES:
+            continue
+        yield line_no, value
+
+
+def detect_encoding(stream):
+    """整个文件能按 UTF-8 解码时返回 utf-8-sig，否则返回 gbk；读完后回到文件开头
+
+    用增量解码器分块读取，多字节字符跨块时由解码器拼接，不会误判。
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        for chunk in iter(lambda: stream.read(DECODE_CHUNK_SIZE), b''):
+            decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        # Windows 下 Excel 另存的 CSV 通常为 GBK 编码
+        return 'gbk'
+    finally:
+        stream.seek(0)
+
+
+def iter_csv_rows(stream):
+    """逐行读取上传的 CSV 文件，产出 (行号, 第一个非空单元格)"""
+    encoding = detect_encoding(stream)
+    reader = csv.reader(io.TextIOWrapper(stream, encoding=encoding, errors='replace', newline=''))
+    for line_no, row in enumerate(reader, start=1):
+        yield line_no, _first_cell(row)
+
+
+def iter_xlsx_rows(stream):
+    """以只读模式逐行读取上传的 XLSX 文件的第一个工作表"""
+    from openpyxl import load_workbook
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        for line_no, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+            yield line_no, _first_cell(row)
+    finally:
+        workbook.close()
+
+
+def iter_import_rows(text=None, upload=None):
+    """根据输入来源选择解析器；上传文件优先于粘贴文本
+
+    Args:
+        text: 粘贴的文本
+        upload: werkzeug FileStorage 对象
+    """
+    if upload is not None and upload.filename:
+        filename = upload.filename.lower()
+        if filename.endswith('.xlsx'):
+            return _skip_header(iter_xlsx_rows(upload.stream))
+        if filename.endswith('.csv'):
+            return _skip_header(iter_csv_rows(upload.stream))
+        return iter_text_lines(upload.stream.read().decode('utf-8-sig', errors='replace'))
+    return iter_text_lines(text or '')
+
+
+def import_values(session, table, rows, existing, make_row, report, max_length=None):
+    """去重并以多行 INSERT 批量写入，不提交事务
+
+    Args:
+        session: SQLAlchemy 会话
+        table: 目标表（模型的 __table__）
+        rows: (行号, 内容) 的可迭代对象
+        existing: 问卷中已有内容的集合
+        make_row: 把 (序号, 内容) 转换为插入字典的函数
+        report: ImportReport
+        max_length: 内容最大长度
+    """
+    seen = set(existing)
+    batch = []
+    for line_no, value in rows:
+        value = value.strip()
+        if not value:
+            continue
+        if max_length and len(value) > max_length:
+            report.add_invalid(line_no, f'超过{max_length}个字符')
+            continue
+        if value in seen:
+            report.skipped += 1
+            continue
+        seen.add(value)
+        batch.append(make_row(report.accepted, value))
+        report.accepted += 1
+        if len(batch) >= INSERT_BATCH_SIZE:
+            session.execute(insert(table), batch)
+            batch = []
+    if batch:
+        session.execute(insert(table), batch)
+    return report
@@ -0,0 +1,161 @@
+"""数据库版本迁移
+
+每个迁移有一个递增的版本号，已执行的版本记录在 schema_migrations 表中，
+启动时只执行尚未执行过的迁移，每个迁移在独立的事务中完成。
+迁移本身也是幂等的：新建的数据库已由 db.create_all() 建好全部列和索引，
+迁移检测到列或索引已存在时直接跳过。
+新增列以 SQLAlchemy 的 Column 描述，按当前数据库方言生成 DDL，SQLite 与 PostgreSQL 通用。
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import (
+    MetaData, Table, Column, ForeignKey, Integer, String, Boolean, DateTime, JSON, inspect, select, text, true, false,
+)
+from sqlalchemy.schema import CreateColumn
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """注册一个迁移，被装饰的函数接收一个处于事务中的数据库连接"""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+
+def add_column(conn, table, column):
+    """列不存在时添加列，column 为未绑定到表的 Column"""
+    columns = [col['name'] for col in inspect(conn).get_columns(table)]
+    if column.name in columns:
+        return False
+    ddl = str(CreateColumn(column).compile(dialect=conn.dialect))
+    for foreign_key in column.foreign_keys:
+        ref_table, ref_column = foreign_key.target_fullname.split('.')
+        ddl += f' REFERENCES "{ref_table}" ({ref_column})'
+    conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {ddl}'))
+    logger.info(f"数据库迁移：已添加 {table}.{column.name} 列")
+    return True
+
+
+def create_index(conn, name, table, columns):
+    """索引不存在时创建索引"""
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({", ".join(columns)})'))
+
+
+@migration(1, '问卷增加快填开关')
+def _add_enable_quick_fill(conn):
+    # SQLite 中 BOOLEAN 存储为 INTEGER (0 或 1)
+    add_column(conn, 'survey', Column('enable_quick_fill', Boolean, server_default=true()))
+
+
+@migration(2, '问题增加组件类型、自定义选项和排序索引')
+def _add_question_component_columns(conn):
+    add_column(conn, 'question', Column('component_type', String(50), server_default='standard'))
+    add_column(conn, 'question', Column('custom_options', JSON))
+    add_column(conn, 'question', Column('order_index', Integer, server_default=text('0')))
+
+
+@migration(3, '问卷增加数据版本和模板标记')
+def _add_survey_version_columns(conn):
+    add_column(conn, 'survey', Column('data_version', Integer, nullable=False, server_default=text('0')))
+    add_column(conn, 'survey', Column('is_template', Boolean, server_default=false()))
+
+
+@migration(4, '为投票、结果、管理页面的常用查询添加索引')
+def _add_hot_query_indexes(conn):
+    # save_vote_to_db：按 survey_id 取问题ID；vote/edit_survey：按 survey_id 取问题并按 order_index 排序
+    create_index(conn, 'ix_question_survey_order', 'question', ['survey_id', 'order_index', 'id'])
+    # save_vote_to_db：DELETE FROM vote WHERE user_id = ? AND question_id IN (...)
+    create_index(conn, 'ix_vote_user_question', 'vote', ['user_id', 'question_id'])
+    # view_results / admin / 导出：按问题连接投票，并按人名、选项分组计数（覆盖索引）
+    create_index(conn, 'ix_vote_question_respondent_score', 'vote', ['question_id', 'table_respondent_id', 'score'])
+    # delete_respondent：按人名删除投票
+    create_index(conn, 'ix_vote_table_respondent', 'vote', ['table_respondent_id'])
+    # 主观题：按问卷读取、按 (用户, 问卷) 删除旧回答
+    create_index(conn, 'ix_subjective_answer_survey_user', 'subjective_answer', ['survey_id', 'user_id'])
+    create_index(conn, 'ix_table_respondent_survey', 'table_respondent', ['survey_id'])
+    create_index(conn, 'ix_qr_code_survey', 'qr_code', ['survey_id'])
+
+
+@migration(5, '投票表增加冗余的 survey_id 列')
+def _add_vote_survey_id(conn):
+    # 问卷范围内的读取、计数、删除不再需要连接 question 表
+    add_column(conn, 'vote', Column('survey_id', Integer, ForeignKey('survey.id')))
+    conn.execute(text(
+        'UPDATE vote SET survey_id = (SELECT question.survey_id FROM question WHERE question.id = vote.question_id) '
+        'WHERE survey_id IS NULL'
+    ))
+    # 写入线程按 (问卷, 用户) 删除旧投票；结果统计按问卷分组计数（覆盖索引）
+    create_index(conn, 'ix_vote_survey_user', 'vote', ['survey_id', 'user_id'])
+    create_index(conn, 'ix_vote_survey_question_respondent_score', 'vote',
+                 ['survey_id', 'question_id', 'table_respondent_id', 'score'])
+    conn.execute(text('DROP INDEX IF EXISTS ix_vote_user_question'))
+
+
+@migration(6, '表格问卷增加紧凑投票存储')
+def _add_ballot_storage(conn):
+    # ballot_layout / table_ballot 两张新表由 db.create_all() 创建
+    add_column(conn, 'survey', Column('ballot_storage', String(20), server_default='rows'))
+
+
+@migration(7, '投票表增加按写入时间读取的索引')
+def _add_vote_created_index(conn):
+    # 分析快照增量刷新：按问卷读取上次刷新以来写入的投票
+    create_index(conn, 'ix_vote_survey_created', 'vote', ['survey_id', 'created_at'])
+
+
+@migration(8, '已扫码的二维码标记为已使用')
+def _mark_used_qr_codes(conn):
+    # participation 表由 db.create_all() 创建；之前扫码登录不设置 is_used，按已有用户补上
+    conn.execute(
+        text('UPDATE qr_code SET is_used = :used WHERE token IN (SELECT qr_code FROM "user" WHERE qr_code IS NOT NULL)'),
+        {'used': True},
+    )
+
+
+@migration(9, '主观题回答全文索引')
+def _add_answer_search_index(conn):
+    # SQLite：FTS5 trigram 索引及同步触发器；PostgreSQL：pg_trgm GIN 索引（不可用时跳过）
+    from search import create_search_index
+    create_search_index(conn)
+    # 搜索结果按ID倒序分页，命中很多时不需要排序
+    create_index(conn, 'ix_subjective_answer_survey_id', 'subjective_answer', ['survey_id', 'id'])
+
+
+def current_version(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(schema_migrations.c.version).order_by(schema_migrations.c.version.desc())).scalar() or 0
+
+
+def run_migrations(engine):
+    """执行所有尚未执行的迁移，返回执行的迁移数量"""
+    _metadata.create_all(engine, checkfirst=True)
+    applied = 0
+    for version, description, func in sorted(MIGRATIONS, key=lambda m: m[0]):
+        with engine.begin() as conn:
+            done = conn.execute(
+                select(schema_migrations.c.version).where(schema_migrations.c.version == version)
+            ).first()
+            if done:
+                continue
+            logger.info(f"执行数据库迁移 {version}: {description}")
+            func(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version, description=description, applied_at=datetime.now()
+            ))
+            applied += 1
+    if applied:
+        logger.info(f"数据库迁移完成，当前版本 {current_version(engine)}")
+    return applied
@@ -0,0 +1,153 @@
+"""数据库模型与 Flask 扩展对象（由 app.create_app 绑定到应用）"""
+from datetime import datetime, timedelta
+
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import LoginManager, UserMixin
+
+from ballots import STORAGE_ROWS
+
+db = SQLAlchemy()
+login_manager = LoginManager()
+login_manager.login_view = 'voter.index'
+
+# 设置时区为北京时间
+def get_current_time():
+    return datetime.utcnow() + timedelta(hours=8)
+
+# 数据模型
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password_hash = db.Column(db.String(256), nullable=False)  # scrypt 哈希约 160 个字符（SQLite 不检查长度，PostgreSQL 检查）
+    is_admin = db.Column(db.Boolean, default=False)
+    qr_code = db.Column(db.String(200), unique=True)
+    votes = db.relationship('Vote', backref='user', lazy=True)
+    subjective_answers = db.relationship(
+        'SubjectiveAnswer',
+        backref='user',
+        lazy=True,
+        cascade="all, delete-orphan"
+    )
+
+class Survey(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    type = db.Column(db.String(20), nullable=False)  # 'single_choice' 或 'table'
+    introduction = db.Column(db.Text, nullable=True)  # 保留：问卷简介
+    subjective_question_prompt = db.Column(db.Text, nullable=True) # 新增：主观题说明文字
+    created_at = db.Column(db.DateTime, default=get_current_time)
+    is_active = db.Column(db.Boolean, default=True)
+    option_limits = db.Column(db.JSON, nullable=True)  # 新增：选项限制，格式为 {"A": 7, "B": 7, ...}
+    table_option_count = db.Column(db.Integer, default=3)  # 新增：表格问卷选项数量，默认3
+    enable_quick_fill = db.Column(db.Boolean, default=True)  # 新增：是否启用快填功能，默认启用
+    data_version = db.Column(db.Integer, default=0, nullable=False)  # 数据版本，每次提交投票或修改问卷时递增，用于导出缓存
+    is_template = db.Column(db.Boolean, default=False)  # 是否为模板（模板不在问卷列表中显示，也不能投票）
+    ballot_storage = db.Column(db.String(20), default=STORAGE_ROWS)  # 表格问卷投票存储方式：'rows' 每个单元格一行，'packed' 每位投票人一行
+    questions = db.relationship('Question', backref='survey', lazy=True)
+    qr_codes = db.relationship('QRCode', backref='survey', lazy=True)
+
+class Question(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    survey_id = db.Column(db.Integer, db.ForeignKey('survey.id'), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    option_count = db.Column(db.Integer, nullable=True)  # 单选题的选项数量
+    component_type = db.Column(db.String(50), default='standard')  # 'standard' 或 'custom_single_choice'
+    custom_options = db.Column(db.JSON, nullable=True)  # 自定义选项内容，格式: {"A": "党员", "B": "群众"}
+    order_index = db.Column(db.Integer, default=0)  # 排序索引
+    created_at = db.Column(db.DateTime, default=get_current_time)
+    votes = db.relationship('Vote', backref='question', lazy=True)
+    __table_args__ = (
+        db.Index('ix_question_survey_order', 'survey_id', 'order_index', 'id'),
+    )
+
+class TableRespondent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    survey_id = db.Column(db.Integer, db.ForeignKey('survey.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=get_current_time)
+    survey = db.relationship('Survey', backref='table_respondents', lazy=True)
+    __table_args__ = (
+        db.Index('ix_table_respondent_survey', 'survey_id'),
+    )
+
+class QRCode(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    survey_id = db.Column(db.Integer, db.ForeignKey('survey.id'), nullable=False)
+    token = db.Column(db.String(200), unique=True, nullable=False)
+    is_used = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=get_current_time)
+    __table_args__ = (
+        db.Index('ix_qr_code_survey', 'survey_id'),
+    )
+
+class Vote(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    survey_id = db.Column(db.Integer, db.ForeignKey('survey.id'), nullable=True)  # 冗余自 question.survey_id，由写入线程维护
+    table_respondent_id = db.Column(db.Integer, db.ForeignKey('table_respondent.id'), nullable=True)
+    score = db.Column(db.Text, nullable=False)  # 改为Text以支持长文本回答
+    created_at = db.Column(db.DateTime, default=get_current_time)
+    table_respondent = db.relationship('TableRespondent', backref='votes', lazy=True)
+    __table_args__ = (
+        db.Index('ix_vote_survey_user', 'survey_id', 'user_id'),
+        db.Index('ix_vote_survey_question_respondent_score', 'survey_id', 'question_id', 'table_respondent_id', 'score'),
+        db.Index('ix_vote_question_respondent_score', 'question_id', 'table_respondent_id', 'score'),
+        db.Index('ix_vote_table_respondent', 'table_respondent_id'),
+        db.Index('ix_vote_survey_created', 'survey_id', 'created_at'),
+    )
+
+class BallotLayout(db.Model):
+    """紧凑选票的单元格布局，见 ballots.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    survey_id = db.Column(db.Integer, db.ForeignKey('survey.id'), nullable=False)
+    question_ids = db.Column(db.JSON, nullable=False)  # 标准问题ID，按显示顺序
+    respondent_ids = db.Column(db.JSON, nullable=False)  # 人名ID
+    created_at = db.Column(db.DateTime, default=get_current_time)
+    __table_args__ = (
+        db.Index('ix_ballot_layout_survey', 'survey_id'),
+    )
+
+class TableBallot(db.Model):
+    """紧凑存储的表格问卷选票：每位投票人每个问卷一行"""
+    id = db.Column(db.Integer, primary_key=True)
+    survey_id = db.Column(db.Integer, db.ForeignKey('survey.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    layout_id = db.Column(db.Integer, db.ForeignKey('ballot_layout.id'), nullable=False)
+    cells = db.Column(db.LargeBinary, nullable=False)  # 每个单元格一个字节的选项编码
+    cell_count = db.Column(db.Integer, nullable=False, default=0)  # 已作答的单元格数
+    created_at = db.Column(db.DateTime, default=get_current_time)
+    __table_args__ = (
+        db.Index('ix_table_ballot_survey_user', 'survey_id', 'user_id', unique=True),
+    )
+
+class SubjectiveAnswer(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    survey_id = db.Column(db.Integer, db.ForeignKey('survey.id'), nullable=False)
+    content = db.Column(db.Text, nullable=True) # 主观回答内容，可以为空
+    created_at = db.Column(db.DateTime, default=get_current_time)
+    __table_args__ = (
+        db.Index('ix_subjective_answer_survey_user', 'survey_id', 'user_id'),
+        db.Index('ix_subjective_answer_survey_id', 'survey_id', 'id'),  # 搜索结果按ID倒序分页
+    )
+
+class Participation(db.Model):
+    """问卷参与情况位图（每个二维码一位，按二维码ID顺序），见 participation.py"""
+    survey_id = db.Column(db.Integer, primary_key=True)  # 不设外键：问卷删除或归档时由 participation 模块删除
+    token_count = db.Column(db.Integer, nullable=False, default=0)  # 位图覆盖的二维码数
+    scanned = db.Column(db.LargeBinary, nullable=False, default=b'')  # 已扫码
+    voted = db.Column(db.LargeBinary, nullable=False, default=b'')  # 已投票
+    epoch = db.Column(db.Integer, nullable=False, default=0)  # 删除投票数据时递增
+    updated_at = db.Column(db.DateTime, default=get_current_time)
+
+def bump_data_version(survey_id, session=None):
+    """递增问卷的数据版本（随调用方的事务一起提交）"""
+    session = session or db.session
+    session.query(Survey).filter(Survey.id == survey_id).update(
+        {Survey.data_version: Survey.data_version + 1}, synchronize_session=False
+    )
+
+@login_manager.user_loader
+def load_user(user_id):
+    return db.session.get(User, int(user_id))
@@ -0,0 +1,318 @@
+"""问卷参与情况：已发放、已扫码、已投票的二维码数量及尚未投票的二维码
+
+统计参与人数原本要对投票表按用户去重计数，QRCode.is_used 也从未被设置。
+每个问卷的二维码按生成顺序（二维码ID）编号，扫码和投票各用一个位图记录，
+每个二维码一位，同时维护置位数，查询数量为 O(1)：
+- 扫码登录时设置扫码位（同时设置 QRCode.is_used），写入线程提交投票后设置投票位；
+- 进程内首次用到某个问卷时加载：二维码及是否扫码（is_used）来自二维码表，
+  投票位来自 participation 表中保存的位图，再补上保存之后写入的投票；
+  没有保存过时按投票数据推算；
+- 写入线程每隔 PARTICIPATION_FLUSH_INTERVAL 秒把有变化的位图与已保存的位图按位或后写回，
+  进程退出前再写一次。多进程部署时各进程记录的位由此合并。
+
+删除投票数据后递增 epoch 并清空已保存的投票位图，其他进程写回时看到 epoch 变化，
+丢弃内存中的投票位图，不会把已删除的投票重新写回。
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from sqlalchemy import select, union
+
+from models import User, QRCode, Vote, TableBallot, SubjectiveAnswer, Participation, get_current_time
+from shards import results_session
+
+logger = logging.getLogger(__name__)
+
+# 加载已保存的位图后，补读保存时间之前这么多秒以来写入的投票（覆盖保存时尚未提交的写入）
+CATCH_UP_SECONDS = 60
+
+
+class Bitmap:
+    """定长位图，第 i 位对应第 i 个二维码"""
+
+    __slots__ = ('bits', 'count')
+
+    def __init__(self):
+        self.bits = bytearray()
+        self.count = 0
+
+    def resize(self, size):
+        length = (size + 7) // 8
+        if length > len(self.bits):
+            self.bits.extend(bytes(length - len(self.bits)))
+
+    def set(self, index):
+        """置位，原来未置位时返回 True"""
+        byte, mask = index >> 3, 1 << (index & 7)
+        if self.bits[byte] & mask:
+            return False
+        self.bits[byte] |= mask
+        self.count += 1
+        return True
+
+    def test(self, index):
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def merge(self, data):
+        """与保存的位图按位或（超出当前长度的部分忽略），有新置位时返回 True"""
+        data = bytes(data[:len(self.bits)])
+        if not data.strip(b'\x00'):
+            return False
+        before = self.count
+        for i, byte in enumerate(data):
+            self.bits[i] |= byte
+        self.count = _popcount(self.bits)
+        return self.count != before
+
+    def clear(self):
+        self.bits = bytearray(len(self.bits))
+        self.count = 0
+
+    def iter_unset(self, size):
+        """依次返回前 size 位中未置位的下标（全部置位的字节整体跳过）"""
+        for byte_index in range((size + 7) >> 3):
+            byte = self.bits[byte_index]
+            if byte == 0xFF:
+                continue
+            for bit in range(8):
+                index = (byte_index << 3) | bit
+                if index < size and not byte & (1 << bit):
+                    yield index
+
+    def dump(self):
+        return bytes(self.bits)
+
+
+def _popcount(data):
+    return bin(int.from_bytes(data, 'little')).count('1')
+
+
+class SurveyParticipation:
+    """单个问卷的参与位图"""
+
+    def __init__(self, survey_id):
+        self.survey_id = survey_id
+        self.tokens = []  # 按二维码ID排列的令牌
+        self.index = {}  # 令牌 -> 序号
+        self.last_qr_id = 0
+        self.scanned = Bitmap()
+        self.voted = Bitmap()
+        self.epoch = 0
+        self.dirty = False
+
+    def add_tokens(self, rows):
+        """追加新生成的二维码，rows 为按ID排列的 (ID, 令牌, 是否已扫码)"""
+        added = False
+        for qr_id, token, scanned in rows:
+            if token in self.index:
+                continue
+            self.index[token] = len(self.tokens)
+            self.tokens.append(token)
+            self.last_qr_id = max(self.last_qr_id, qr_id)
+            self.scanned.resize(len(self.tokens))
+            self.voted.resize(len(self.tokens))
+            if scanned:
+                self.scanned.set(len(self.tokens) - 1)
+            added = True
+        return added
+
+    def counts(self):
+        return {'issued': len(self.tokens), 'scanned': self.scanned.count, 'voted': self.voted.count}
+
+
+class ParticipationTracker:
+    """问卷ID -> 参与位图（每个进程一份）"""
+
+    def __init__(self):
+        self._surveys = {}
+        self._lock = threading.RLock()
+
+    # -- 加载 --
+
+    def get(self, session, survey_id):
+        """问卷的参与位图，进程内首次使用时从数据库加载"""
+        state = self._surveys.get(survey_id)
+        if state is None:
+            # 加载期间持有锁：加载前已提交的扫码/投票由查询读到，之后的由 mark_* 记录
+            with self._lock:
+                state = self._surveys.get(survey_id)
+                if state is None:
+                    state = self._load(session, survey_id)
+                    self._surveys[survey_id] = state
+        return state
+
+    def _load(self, session, survey_id):
+        state = SurveyParticipation(survey_id)
+        _extend_tokens(session, state)
+        stored = session.get(Participation, survey_id)
+        if stored is None:
+            # 没有保存过：按投票数据推算
+            _count_voters(state)
+            state.dirty = True
+            return state
+        state.epoch = stored.epoch
+        state.scanned.merge(stored.scanned)
+        state.voted.merge(stored.voted)
+        since = stored.updated_at - timedelta(seconds=CATCH_UP_SECONDS)
+        caught_up = _count_voters(state, since)
+        state.dirty = caught_up or len(state.tokens) != stored.token_count
+        return state
+
+    def issued(self, session, survey_id):
+        """生成二维码后调用：已加载的问卷追加新的二维码"""
+        state = self._surveys.get(survey_id)
+        if state is not None:
+            with self._lock:
+                if _extend_tokens(session, state):
+                    state.dirty = True
+
+    # -- 记录 --
+
+    def _mark(self, survey_id, token, attribute):
+        state = self._surveys.get(survey_id)
+        if state is None or not token:
+            return  # 尚未加载：加载时从数据库读到
+        with self._lock:
+            seq = state.index.get(token)
+            if seq is None:
+                return  # 其他问卷的二维码，或本进程尚未追加的新二维码（加载或写回时补上）
+            if getattr(state, attribute).set(seq):
+                state.dirty = True
+
+    def mark_scanned(self, survey_id, token):
+        self._mark(survey_id, token, 'scanned')
+
+    def mark_voted(self, survey_id, token):
+        self._mark(survey_id, token, 'voted')
+
+    # -- 查询 --
+
+    def summary(self, session, survey_id):
+        """已发放、已扫码、已投票的数量
+
+        先追加其他进程生成的二维码、合并其他进程已写回的位，只读不写。
+        """
+        state = self.get(session, survey_id)
+        with self._lock:
+            _extend_tokens(session, state)
+            stored = session.get(Participation, survey_id)
+            if stored is not None:
+                self._adopt(state, stored)
+            return state.counts()
+
+    def not_voted(self, session, survey_id, offset=0, limit=100):
+        """尚未投票的二维码：[(序号, 令牌, 是否已扫码)]，序号从 1 开始，与生成顺序一致"""
+        state = self.get(session, survey_id)
+        result = []
+        with self._lock:
+            for seq in state.voted.iter_unset(len(state.tokens)):
+                if offset:
+                    offset -= 1
+                    continue
+                result.append((seq + 1, state.tokens[seq], state.scanned.test(seq)))
+                if len(result) >= limit:
+                    break
+        return result
+
+    # -- 保存 --
+
+    def _adopt(self, state, stored):
+        if stored.epoch != state.epoch:
+            # 投票数据已删除：丢弃内存中的投票位，按删除后写入的投票重新统计
+            state.epoch = stored.epoch
+            state.voted.clear()
+            _count_voters(state)
+        state.scanned.merge(stored.scanned)
+        state.voted.merge(stored.voted)
+
+    def dirty(self):
+        return any(state.dirty for state in list(self._surveys.values()))
+
+    def flush(self, session):
+        """把有变化的位图与已保存的位图合并后写回（由写入线程调用）"""
+        with self._lock:
+            pending = [state for state in self._surveys.values() if state.dirty]
+            for state in pending:
+                state.dirty = False
+        for state in pending:
+            try:
+                self._flush_one(session, state)
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                with self._lock:
+                    state.dirty = True
+                logger.error(f"保存参与情况失败: survey_id={state.survey_id}, 错误: {e}", exc_info=True)
+
+    def _flush_one(self, session, state):
+        survey_id = state.survey_id
+        stored = session.query(Participation).filter_by(survey_id=survey_id).with_for_update().first()
+        if stored is None:
+            if not session.execute(select(QRCode.id).where(QRCode.survey_id == survey_id).limit(1)).first():
+                self.forget(survey_id)  # 问卷已删除或二维码已清空
+                return
+            stored = Participation(survey_id=survey_id, scanned=b'', voted=b'', epoch=state.epoch)
+            session.add(stored)
+        with self._lock:
+            self._adopt(state, stored)
+            stored.token_count = len(state.tokens)
+            stored.scanned = state.scanned.dump()
+            stored.voted = state.voted.dump()
+        stored.updated_at = get_current_time()
+
+    def reset_votes(self, session, survey_id):
+        """删除问卷的投票数据后调用：清空已保存的投票位图，其他进程写回时据 epoch 丢弃内存中的投票位"""
+        stored = session.query(Participation).filter_by(survey_id=survey_id).with_for_update().first()
+        if stored is None:
+            stored = Participation(survey_id=survey_id, token_count=0, scanned=b'', epoch=0)
+            session.add(stored)
+        stored.epoch += 1
+        stored.voted = b''
+        stored.updated_at = get_current_time()
+        session.commit()
+        self.forget(survey_id)
+
+    def drop(self, session, survey_id):
+        """问卷删除或归档后调用：删除保存的位图"""
+        session.query(Participation).filter_by(survey_id=survey_id).delete(synchronize_session=False)
+        session.commit()
+        self.forget(survey_id)
+
+    def forget(self, survey_id):
+        """丢弃进程内的位图（问卷删除、归档或投票数据删除后），下次使用时重新加载"""
+        with self._lock:
+            self._surveys.pop(survey_id, None)
+
+
+def _extend_tokens(session, state):
+    """追加 ID 大于已加载的最大ID的二维码"""
+    rows = session.execute(
+        select(QRCode.id, QRCode.token, QRCode.is_used.is_(True))
+        .where(QRCode.survey_id == state.survey_id, QRCode.id > state.last_qr_id)
+        .order_by(QRCode.id)
+    )
+    return state.add_tokens(rows)
+
+
+def _count_voters(state, since=None):
+    """按投票数据设置投票位（since 不为空时只看该时间之后写入的投票），有新置位时返回 True"""
+    selects = []
+    for model in (Vote, TableBallot, SubjectiveAnswer):
+        stmt = select(model.user_id).where(model.survey_id == state.survey_id)
+        if since is not None:
+            stmt = stmt.where(model.created_at >= since)
+        selects.append(stmt)
+    with results_session(state.survey_id) as results:
+        tokens = results.execute(
+            select(User.qr_code).where(User.id.in_(union(*selects)), User.qr_code.isnot(None))
+        ).scalars().all()
+    changed = False
+    for token in tokens:
+        seq = state.index.get(token)
+        if seq is not None and state.voted.set(seq):
+            changed = True
+    return changed
+
+
+tracker = ParticipationTracker()
@@ -0,0 +1,148 @@
+"""请求级性能记录（默认关闭，PROFILE_REQUESTS=true 时启用）
+
+- 通过 SQLAlchemy 游标事件统计每个请求的 SQL 条数和 SQL 耗时，连同请求总耗时一起记录；
+- SQL 条数超过 PROFILE_QUERY_THRESHOLD 的请求写入警告日志，并列出重复次数最多的语句，
+  用于发现逐行懒加载、逐行删除之类的 N+1 查询；
+- 保留最慢的 PROFILE_SLOW_KEEP 个请求，在管理后台"性能记录"页面查看；
+- 管理员访问任意页面时加上 ?_profile=1，该请求在 cProfile 下执行，
+  返回按累计耗时排序的函数统计，而不是原页面。
+
+写入线程中的 SQL 不属于任何请求，不计入统计。
+"""
+import cProfile
+import heapq
+import io
+import itertools
+import logging
+import pstats
+import threading
+import time
+from collections import Counter
+
+from flask import Response, request, session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FLAG = '_profile'
+
+_local = threading.local()
+_slowest = []  # 小顶堆：(耗时, 序号, 记录)
+_slowest_lock = threading.Lock()
+_sequence = itertools.count()
+_keep = 50
+
+
+class RequestStats:
+    __slots__ = ('method', 'path', 'started_at', 'started', 'status', 'wall_ms', 'query_count', 'sql_ms', 'statements')
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.started_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.started = time.perf_counter()
+        self.status = None
+        self.wall_ms = 0.0
+        self.query_count = 0
+        self.sql_ms = 0.0
+        self.statements = Counter()
+
+    def top_statements(self, limit=3):
+        return [(' '.join(sql.split())[:200], count) for sql, count in self.statements.most_common(limit)]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        conn.info.setdefault('profiling_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_local, 'stats', None)
+    started = conn.info.get('profiling_started')
+    if stats is None or not started:
+        return
+    stats.sql_ms += (time.perf_counter() - started.pop()) * 1000
+    stats.query_count += 1
+    stats.statements[statement] += 1
+
+
+def _record(stats):
+    with _slowest_lock:
+        entry = (stats.wall_ms, next(_sequence), stats)
+        if len(_slowest) < _keep:
+            heapq.heappush(_slowest, entry)
+        elif entry[0] > _slowest[0][0]:
+            heapq.heapreplace(_slowest, entry)
+
+
+def slowest_requests():
+    """最慢的请求，按耗时从高到低"""
+    with _slowest_lock:
+        return [stats for _, _, stats in sorted(_slowest, reverse=True)]
+
+
+def reset():
+    with _slowest_lock:
+        _slowest.clear()
+
+
+def _profile_requested():
+    # 与管理后台相同，以 session 中的管理员标记判断
+    return request.args.get(PROFILE_FLAG) == '1' and session.get('is_admin', False)
+
+
+def init_profiling(app, query_threshold=20, keep=50):
+    """在应用上注册请求钩子，并在所有数据库引擎上注册游标事件"""
+    global _keep
+    _keep = keep
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_request_stats():
+        _local.stats = RequestStats(request.method, request.full_path.rstrip('?'))
+        _local.profiler = None
+        if _profile_requested():
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # 其他线程正在采样，本次请求不采样
+                logger.warning(f"已有请求正在采样，忽略本次采样: {request.path}")
+            else:
+                _local.profiler = profiler
+
+    @app.after_request
+    def finish_request_stats(response):
+        stats = getattr(_local, 'stats', None)
+        if stats is None:
+            return response
+        profiler = _local.profiler
+        if profiler is not None:
+            profiler.disable()
+        stats.status = response.status_code
+        stats.wall_ms = (time.perf_counter() - stats.started) * 1000
+        if stats.query_count > query_threshold:
+            repeated = '; '.join(f'{count}× {sql}' for sql, count in stats.top_statements())
+            logger.warning(
+                f"请求 SQL 条数过多: {stats.method} {stats.path} 共 {stats.query_count} 条，"
+                f"SQL 耗时 {stats.sql_ms:.1f} ms，总耗时 {stats.wall_ms:.1f} ms；重复最多: {repeated}"
+            )
+        _record(stats)
+        if profiler is None:
+            return response
+        output = io.StringIO()
+        output.write(
+            f"{stats.method} {stats.path} -> {stats.status}\n"
+            f"总耗时 {stats.wall_ms:.1f} ms，SQL {stats.query_count} 条，SQL 耗时 {stats.sql_ms:.1f} ms\n\n"
+        )
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(40)
+        return Response(output.getvalue(), mimetype='text/plain')
+
+    @app.teardown_request
+    def clear_request_stats(exc):
+        _local.stats = None
+        _local.profiler = None
@@ -0,0 +1,113 @@
+"""批量删除问卷数据
+
+使用基于集合的 DELETE 语句分块删除，每块单独提交事务，
+避免长时间持有数据库写锁而阻塞其他问卷的投票写入。
+可选在删除前把被删除的行归档到 gzip 压缩的 JSON Lines 文件中。
+"""
+import base64
+import gzip
+import json
+import logging
+import time
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# 表名 -> 选出属于某个问卷的行的 WHERE 条件（:survey_id 为参数）
+SURVEY_SCOPES = {
+    'vote': 'survey_id = :survey_id',
+    'table_ballot': 'survey_id = :survey_id',
+    'ballot_layout': 'survey_id = :survey_id',
+    'subjective_answer': 'survey_id = :survey_id',
+    'question': 'survey_id = :survey_id',
+    'table_respondent': 'survey_id = :survey_id',
+    'qr_code': 'survey_id = :survey_id',
+    'survey': 'id = :survey_id',
+}
+
+# 删除问卷投票结果时涉及的表
+RESULT_TABLES = ('vote', 'table_ballot', 'subjective_answer')
+# 删除整个问卷时涉及的表（按外键依赖顺序）
+SURVEY_TABLES = ('vote', 'table_ballot', 'subjective_answer', 'ballot_layout', 'question', 'table_respondent',
+                 'qr_code', 'survey')
+
+
+def _json_default(value):
+    # 紧凑选票的 cells 为二进制，以 base64 文本保存
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode('ascii')
+    return str(value)
+
+
+class ArchiveWriter:
+    """把行写入 gzip 压缩的 JSON Lines 文件，每行形如 {"table": ..., "row": {...}}"""
+
+    def __init__(self, path, header=None):
+        self.path = path
+        self._file = gzip.open(path, 'wt', encoding='utf-8')
+        if header is not None:
+            self.write('__header__', header)
+
+    def write(self, table, row):
+        self._file.write(json.dumps({'table': table, 'row': row}, ensure_ascii=False, default=_json_default))
+        self._file.write('\n')
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def purge_table(engine, table, survey_id, chunk_size=5000, archive=None, pause=0.01):
+    """分块删除某张表中属于问卷的全部行，返回删除的行数"""
+    where = SURVEY_SCOPES[table]
+    table_sql = f'"{table}"'
+    deleted = 0
+    while True:
+        with engine.begin() as conn:
+            if archive is not None:
+                rows = conn.execute(
+                    text(f"SELECT * FROM {table_sql} WHERE {where} ORDER BY id LIMIT :limit"),
+                    {'survey_id': survey_id, 'limit': chunk_size},
+                ).mappings().all()
+                if not rows:
+                    break
+                for row in rows:
+                    archive.write(table, dict(row))
+                ids = [row['id'] for row in rows]
+                conn.execute(
+                    text(f"DELETE FROM {table_sql} WHERE id IN ({', '.join(str(int(i)) for i in ids)})")
+                )
+                count = len(ids)
+            else:
+                count = conn.execute(
+                    text(f"DELETE FROM {table_sql} WHERE id IN "
+                         f"(SELECT id FROM {table_sql} WHERE {where} LIMIT :limit)"),
+                    {'survey_id': survey_id, 'limit': chunk_size},
+                ).rowcount
+        deleted += count
+        if count < chunk_size:
+            break
+        # 两块之间让出写锁，使投票写入线程有机会提交
+        time.sleep(pause)
+    return deleted
+
+
+def purge_survey_data(engine, survey_id, tables, chunk_size=5000, archive_path=None, pause=0.01):
+    """按顺序分块删除问卷在各表中的数据，返回 {表名: 删除行数}"""
+    archive = ArchiveWriter(archive_path, header={'survey_id': survey_id, 'tables': list(tables)}) if archive_path else None
+    counts = {}
+    started = time.time()
+    try:
+        for table in tables:
+            counts[table] = purge_table(engine, table, survey_id, chunk_size, archive, pause)
+    finally:
+        if archive is not None:
+            archive.close()
+    logger.info(f"问卷数据已删除: survey_id={survey_id}, 行数={counts}, 耗时={time.time() - started:.2f}s")
+    return counts
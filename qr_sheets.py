@@ -0,0 +1,89 @@
+"""登录二维码的图片生成与 PDF 排版
+
+分为三步，便于单独计时：
+1. render_qr_image：生成二维码图片，并在下方写上问卷名称；
+2. encode_png：把图片编码为 PNG；
+3. write_qr_pdf：把 PNG 按每页 4×4 排版写入 A4 PDF。
+
+qrcode、PIL、reportlab 只在调用时导入。
+"""
+import logging
+import math
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+# 问卷名称使用的字体，依次尝试
+TITLE_FONTS = ("msyh.ttf", "simhei.ttf")
+TITLE_FONT_SIZE = 20
+
+# 每页固定显示 4×4 个二维码
+PAGE_COLS = 4
+PAGE_ROWS = 4
+PAGE_MARGIN = 20  # 页面边距
+
+
+def load_title_font(size=TITLE_FONT_SIZE):
+    """加载中文字体，找不到时使用默认字体（问卷名称可能显示为方框）"""
+    from PIL import ImageFont
+    for name in TITLE_FONTS:
+        try:
+            return ImageFont.truetype(name, size)
+        except IOError:
+            continue
+    logger.warning(f"无法加载中文字体 ({', '.join(TITLE_FONTS)})。问卷名称可能无法正确显示或显示为方框。")
+    return ImageFont.load_default()
+
+
+def render_qr_image(url, title, font):
+    """生成一个二维码图片，在下方写上问卷名称"""
+    import qrcode
+    from PIL import ImageDraw
+
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(url)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+
+    # 在二维码下方添加问卷名称（略高于底部留白）
+    draw = ImageDraw.Draw(img)
+    text_width = draw.textlength(title, font=font)
+    draw.text(((img.size[0] - text_width) // 2, img.size[1] - 30), title, font=font, fill='black')
+    return img
+
+
+def encode_png(img):
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def write_qr_pdf(png_images, fileobj):
+    """把 PNG 二维码按每页 4×4 排版写入 PDF 文件对象"""
+    from reportlab.pdfgen import canvas
+    from reportlab.pdfbase.pdfutils import ImageReader
+    from reportlab.lib.pagesizes import A4
+
+    c = canvas.Canvas(fileobj, pagesize=A4)
+
+    # 计算每个二维码可用的最大正方形尺寸
+    cell_width = (A4[0] - 2 * PAGE_MARGIN) / PAGE_COLS
+    cell_height = (A4[1] - 2 * PAGE_MARGIN) / PAGE_ROWS
+    qr_size_on_page = min(cell_width, cell_height)
+    per_page = PAGE_COLS * PAGE_ROWS
+
+    for page in range(math.ceil(len(png_images) / per_page)):
+        for idx, png in enumerate(png_images[page * per_page:(page + 1) * per_page]):
+            row_in_page, col_in_page = divmod(idx, PAGE_COLS)
+            # 二维码在单元格中居中
+            x_pos = PAGE_MARGIN + col_in_page * cell_width + (cell_width - qr_size_on_page) / 2
+            y_pos = A4[1] - PAGE_MARGIN - (row_in_page + 1) * cell_height + (cell_height - qr_size_on_page) / 2
+            c.drawImage(ImageReader(BytesIO(png)), x_pos, y_pos, width=qr_size_on_page, height=qr_size_on_page)
+        c.showPage()
+    c.save()
+
+
+def build_qr_pdf(urls, title, fileobj):
+    """生成一批登录二维码并写入 PDF"""
+    font = load_title_font()
+    write_qr_pdf([encode_png(render_qr_image(url, title, font)) for url in urls], fileobj)
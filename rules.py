@@ -0,0 +1,54 @@
+"""投票页的校验规则
+
+完整性检查和选项次数限制原本只在提交后由服务端进行，不通过时重定向回投票页、重新渲染整页，
+大型表格问卷中投票人往往要往返多次才能提交成功。投票页加载后获取编译好的规则，
+在浏览器中即时检查，不合规的选票基本不会再提交到服务端（服务端的检查保持不变）。
+
+规则是一个很小的 JSON，与 voter.submit_vote 的检查逐项对应：
+- single：以 question_<ID> 提交的问题（单选题问卷的全部问题、表格问卷的自定义单选组件），每题必答，及允许的选项；
+- cells：表格问卷标准问题的ID、人名ID和允许的选项，每个单元格必答；
+- limits：各选项最多选择的次数，只统计标准问题；
+- counted：单选题问卷中计入选项限制的问题ID（不含自定义单选组件）。
+
+规则地址带有内容摘要，规则不变时浏览器直接使用缓存。
+"""
+import hashlib
+import json
+
+OPTION_LETTERS = 'ABCDE'
+
+
+def is_custom(question):
+    """自定义单选组件：component_type 为 custom_single_choice 或 custom_options 不为空"""
+    return question.component_type == 'custom_single_choice' or bool(question.custom_options)
+
+
+def question_options(question):
+    if question.custom_options:
+        return list(question.custom_options)
+    return list(OPTION_LETTERS[:question.option_count])  # 与投票页一致：未设置时显示全部选项
+
+
+def compile_rules(survey, questions, respondent_ids):
+    """由按顺序排列的问题和人名ID编译校验规则"""
+    if survey.type == 'single_choice':
+        single_questions = questions
+    else:
+        single_questions = [q for q in questions if is_custom(q)]
+    rules = {'single': [{'id': q.id, 'options': question_options(q)} for q in single_questions]}
+    if survey.type == 'table':
+        rules['cells'] = {
+            'questions': [q.id for q in questions if not is_custom(q)],
+            'respondents': list(respondent_ids),
+            'options': OPTION_LETTERS[:survey.table_option_count or 0],
+        }
+    if survey.option_limits:
+        rules['limits'] = {option: int(limit) for option, limit in survey.option_limits.items()}
+        if survey.type == 'single_choice':
+            rules['counted'] = [q.id for q in questions if not is_custom(q)]
+    return rules
+
+
+def rules_digest(rules):
+    """规则内容的摘要，用作地址中的版本号和 ETag"""
+    return hashlib.sha1(json.dumps(rules, sort_keys=True).encode('utf-8')).hexdigest()[:16]
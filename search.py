@@ -0,0 +1,161 @@
+"""主观题回答全文搜索
+
+结果页原本把全部主观题回答列在页面上，回答多时只能手工翻找。
+SQLite 中为 subjective_answer 建立 FTS5 外部内容索引（trigram 分词，按连续三个字符索引，
+中文不需要分词），由 subjective_answer 上的触发器维护：写入线程替换回答、分块删除、
+归档恢复、移入分库都在同一事务中同步更新索引，不需要各处分别处理。
+按问卷分库时索引建在各分库中（见 shards.py）。
+
+搜索词按空格拆分，全部命中才返回：
+- 三个字符及以上的词走 FTS5 索引；
+- 不足三个字符的词（如两个字的中文词）trigram 无法索引，在命中问卷的回答上用 LIKE 过滤；
+- SQLite 不支持 FTS5 trigram（3.34 以前）或使用 PostgreSQL 时全部用 LIKE / ILIKE，
+  PostgreSQL 有 pg_trgm 扩展时建立 GIN 索引加速 ILIKE。
+"""
+import logging
+import re
+from datetime import datetime, timedelta
+
+from markupsafe import Markup, escape
+from sqlalchemy import Integer, column, func, select, text
+from sqlalchemy.exc import DBAPIError
+
+from models import User, SubjectiveAnswer
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'subjective_answer_fts'
+TRIGRAM_MIN_LENGTH = 3
+SNIPPET_CONTEXT = 60  # 回答较长时，只显示第一个命中词前后各这么多个字符
+
+_SQLITE_INDEX = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"content, content='subjective_answer', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON subjective_answer BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON subjective_answer BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF content ON subjective_answer BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); "
+    f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+)
+
+
+def _has_fts(conn):
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+    ).first() is not None
+
+
+def create_search_index(conn):
+    """建立全文索引（幂等），conn 为处于事务中的连接；数据库不支持时记录警告，搜索改用 LIKE"""
+    if conn.dialect.name == 'sqlite':
+        existed = _has_fts(conn)
+        try:
+            for statement in _SQLITE_INDEX:
+                conn.execute(text(statement))
+        except DBAPIError as e:
+            logger.warning(f"SQLite 不支持 FTS5 trigram 分词，主观题搜索使用 LIKE: {e}")
+            return False
+        if not existed:
+            # 为已有的回答建立索引
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        return True
+    if conn.dialect.name == 'postgresql':
+        try:
+            with conn.begin_nested():
+                conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+                conn.execute(text('CREATE INDEX IF NOT EXISTS ix_subjective_answer_content_trgm '
+                                  'ON subjective_answer USING gin (content gin_trgm_ops)'))
+        except DBAPIError as e:
+            logger.warning(f"无法启用 pg_trgm，主观题搜索不使用索引: {e}")
+            return False
+        return True
+    return False
+
+
+def parse_terms(query):
+    """按空白拆分搜索词（去重，保持顺序）"""
+    terms = []
+    for term in (query or '').split():
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+def parse_date(value):
+    """解析 YYYY-MM-DD，无效时返回 None"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+
+def search_answers(session, survey_id, query='', username='', since=None, until=None, offset=0, limit=20):
+    """搜索问卷的主观题回答，返回 (命中总数, [回答])，按提交顺序从新到旧
+
+    username 为用户名的一部分；since / until 为日期，until 当天包含在内。
+    """
+    terms = parse_terms(query)
+    content = SubjectiveAnswer.content
+    conditions = [SubjectiveAnswer.survey_id == survey_id]
+    if not terms:
+        conditions.append(func.coalesce(content, '') != '')
+    sqlite = session.get_bind().dialect.name == 'sqlite'
+    indexed = [t for t in terms if len(t) >= TRIGRAM_MIN_LENGTH] if sqlite and _has_fts(session) else []
+    if indexed:
+        # 每个词作为一个短语，双引号转义为两个双引号
+        match = ' AND '.join('"' + t.replace('"', '""') + '"' for t in indexed)
+        hits = text(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match').bindparams(match=match)
+        conditions.append(SubjectiveAnswer.id.in_(hits.columns(column('rowid', Integer))))
+    for term in terms:
+        if term in indexed:
+            continue
+        # SQLite 的 LIKE 对英文字母不区分大小写，其他数据库用 ILIKE
+        conditions.append(content.contains(term, autoescape=True) if sqlite
+                          else content.icontains(term, autoescape=True))
+    if since is not None:
+        conditions.append(SubjectiveAnswer.created_at >= since)
+    if until is not None:
+        conditions.append(SubjectiveAnswer.created_at < until + timedelta(days=1))
+
+    counted = select(func.count()).select_from(SubjectiveAnswer)
+    if username:
+        # 只有按用户名筛选时计数才需要连接用户表
+        counted = counted.join(User, User.id == SubjectiveAnswer.user_id)
+        conditions.append(User.username.contains(username, autoescape=True))
+    total = session.execute(counted.where(*conditions)).scalar()
+    # 回答按提交顺序写入，按ID倒序即从新到旧，不需要对命中的回答按时间排序
+    rows = session.execute(
+        select(SubjectiveAnswer.id, User.username, content, SubjectiveAnswer.created_at)
+        .join(User, User.id == SubjectiveAnswer.user_id)
+        .where(*conditions)
+        .order_by(SubjectiveAnswer.id.desc())
+        .offset(offset).limit(limit)
+    ).all()
+    return total, [
+        {'id': answer_id, 'user': user, 'content': highlight(answer, terms), 'time': created_at}
+        for answer_id, user, answer, created_at in rows
+    ]
+
+
+def highlight(content, terms, context=SNIPPET_CONTEXT):
+    """转义 HTML 后用 <mark> 标出命中的词；回答较长时只保留第一个命中词附近的片段"""
+    if not terms:
+        return escape(content)
+    pattern = re.compile('|'.join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    start, end = 0, len(content)
+    first = pattern.search(content)
+    if first and len(content) > 4 * context:
+        start = max(first.start() - context, 0)
+        end = min(first.end() + context, len(content))
+    parts = ['…'] if start > 0 else []
+    position = start
+    for match in pattern.finditer(content, start, end):
+        parts.append(escape(content[position:match.start()]))
+        parts.append(Markup('<mark>%s</mark>') % match.group())
+        position = match.end()
+    parts.append(escape(content[position:end]))
+    if end < len(content):
+        parts.append('…')
+    return Markup('').join(parts)
@@ -0,0 +1,136 @@
+"""生产环境启动入口
+
+    python serve.py [--host 0.0.0.0] [--port 5005] [--threads 16] [--workers 1]
+
+各参数的默认值来自 .env / 环境变量（见 config.py），APP_MODE=voter 时只提供投票页面。
+
+- 工作进程数为 1（默认）时使用 waitress：单进程多线程，Windows 下也可运行；
+- 工作进程数大于 1 时使用 gunicorn（仅 Linux/macOS）：主进程预加载应用
+  （建表、迁移只执行一次），每个工作进程 fork 后重新建立数据库连接并启动自己的写入线程。
+  多个进程同时写 SQLite 时由数据库锁串行化，进程数不宜过多。
+
+收到 SIGTERM / SIGINT 后先停止接收新的投票（/readyz 返回 503，提交投票时提示稍后重试），
+等待正在处理的请求结束，再把写入队列中的投票全部写入数据库后退出。
+"""
+import argparse
+import logging
+import signal
+import sys
+
+from config import (
+    HOST, PORT, SERVER_WORKERS, SERVER_THREADS, SERVER_CONNECTION_LIMIT,
+    SERVER_CHANNEL_TIMEOUT, WRITER_DRAIN_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='DemoVote 生产环境启动入口')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='工作进程数，大于1时使用 gunicorn')
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help='每个工作进程的处理线程数')
+    parser.add_argument('--connection-limit', type=int, default=SERVER_CONNECTION_LIMIT)
+    parser.add_argument('--channel-timeout', type=int, default=SERVER_CHANNEL_TIMEOUT)
+    parser.add_argument('--drain-timeout', type=float, default=WRITER_DRAIN_TIMEOUT,
+                        help='退出时等待写入队列写完的最长时间（秒）')
+    return parser.parse_args(argv)
+
+
+def serve_waitress(app, args):
+    from waitress import create_server
+    from writer import stop_accepting, shutdown_writer
+
+    server = create_server(
+        app,
+        host=args.host,
+        port=args.port,
+        threads=args.threads,
+        connection_limit=args.connection_limit,
+        channel_timeout=args.channel_timeout,
+        ident='DemoVote',
+    )
+
+    def handle_stop(signum, frame):
+        logger.info(f"收到信号 {signum}，停止接收投票并准备退出")
+        stop_accepting()
+        # server.run() 捕获 SystemExit 后会等待处理线程结束再返回
+        raise SystemExit
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    logger.info(f"waitress 启动: http://{args.host}:{args.port}（线程数: {args.threads}，模式: {app.config['APP_MODE']}）")
+    server.run()
+    drained = shutdown_writer(args.drain_timeout)
+    server.close()
+    logger.info("服务已停止" if drained else "服务已停止，部分投票未能写入")
+    return 0 if drained else 1
+
+
+def serve_gunicorn(app, args):
+    from gunicorn.app.base import BaseApplication
+
+    def post_fork(server, worker):
+        from models import db
+        from shards import registry
+        from writer import start_writer
+        # 不复用主进程预加载时建立的数据库连接
+        with app.app_context():
+            db.engine.dispose(close=False)
+        if registry is not None:
+            registry.dispose_all(close=False)
+        start_writer(app)
+        if app.config['APP_MODE'] == 'full':
+            from snapshots import start_snapshotter
+            start_snapshotter(app)
+
+    def worker_exit(server, worker):
+        from writer import shutdown_writer
+        shutdown_writer(args.drain_timeout)
+
+    options = {
+        'bind': f'{args.host}:{args.port}',
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'worker_connections': args.connection_limit,
+        'keepalive': 5,
+        'preload_app': True,
+        # 留出等待写入队列的时间
+        'graceful_timeout': int(args.drain_timeout) + 10,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+    }
+
+    class DemoVoteApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    logger.info(f"gunicorn 启动: http://{args.host}:{args.port}（进程数: {args.workers}，线程数: {args.threads}，模式: {app.config['APP_MODE']}）")
+    DemoVoteApplication().run()
+    return 0
+
+
+def main(argv=None):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    args = parse_args(argv)
+    from app import app
+    if args.workers > 1:
+        if sys.platform == 'win32':
+            logger.error("Windows 下不支持多进程模式，请使用 --workers 1")
+            return 2
+        return serve_gunicorn(app, args)
+    return serve_waitress(app, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
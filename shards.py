@@ -0,0 +1,217 @@
+"""按问卷分库（默认关闭，SHARD_BY_SURVEY=true 时启用）
+
+所有问卷共用 instance/votes.db 时，不同会场同时投票也要排队等同一把 SQLite 写锁。
+分库模式下每个问卷的投票数据（投票、表格选票、选票布局、主观题回答）写入
+instance/shards/survey_<id>.db，votes.db 作为目录库，只保存问卷、问题、人名、
+用户和二维码。每个分库由独立的写入线程写入（见 writer.py），
+不同问卷的投票互不等待。
+
+分库连接打开时以 catalog 为名附加目录库。SQLite 解析不带库名的表名时先查主库，
+因此投票相关的表落在分库中，问卷、问题、用户等表落在目录库中，
+原有的查询、删除、归档代码不需要改写。
+
+二维码和用户仍保存在目录库中：扫码登录时只有令牌，还不知道是哪个问卷，
+且二维码只在生成时写入一次，用户只在首次扫码时写入一次。
+"""
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from models import db, bump_data_version
+from config import SHARD_BY_SURVEY, SHARD_DIR, DATABASE_PATH
+from database import is_sqlite
+from search import create_search_index
+
+logger = logging.getLogger(__name__)
+
+CATALOG_SCHEMA = 'catalog'
+
+# 写入分库的表（按外键依赖排序：选票引用布局）
+SHARD_TABLES = ('ballot_layout', 'vote', 'table_ballot', 'subjective_answer')
+
+
+class ShardRegistry:
+    """问卷ID -> 分库引擎，分库文件在首次使用时创建"""
+
+    def __init__(self, shard_dir, catalog_path):
+        self.shard_dir = shard_dir
+        self.catalog_path = catalog_path
+        self._engines = {}
+        self._sessionmakers = {}
+        self._lock = threading.Lock()
+
+    def path(self, survey_id):
+        return os.path.join(self.shard_dir, f'survey_{int(survey_id)}.db')
+
+    def engine(self, survey_id):
+        engine = self._engines.get(survey_id)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(survey_id)
+                if engine is None:
+                    engine = self._open(survey_id)
+                    self._sessionmakers[survey_id] = sessionmaker(bind=engine)
+                    self._engines[survey_id] = engine
+        return engine
+
+    def sessionmaker(self, survey_id):
+        self.engine(survey_id)
+        return self._sessionmakers[survey_id]
+
+    def _open(self, survey_id):
+        os.makedirs(self.shard_dir, exist_ok=True)
+        url = f'sqlite:///{self.path(survey_id)}'
+
+        # 先在未附加目录库的连接上建表，否则建表前的存在性检查会查到目录库中的同名表
+        setup = create_engine(url)
+        try:
+            tables = [db.metadata.tables[name] for name in SHARD_TABLES]
+            db.metadata.create_all(setup, tables=tables)
+            # 已有的分库补建之后新增的索引
+            for table in tables:
+                for index in table.indexes:
+                    index.create(setup, checkfirst=True)
+            with setup.begin() as conn:
+                conn.execute(text(
+                    'CREATE TABLE IF NOT EXISTS shard_meta '
+                    '(id INTEGER PRIMARY KEY CHECK (id = 1), data_version INTEGER NOT NULL DEFAULT 0)'
+                ))
+                conn.execute(text('INSERT OR IGNORE INTO shard_meta (id, data_version) VALUES (1, 0)'))
+                create_search_index(conn)  # 主观题回答的全文索引建在分库中
+        finally:
+            setup.dispose()
+
+        engine = create_engine(url)
+        catalog_path = self.catalog_path
+
+        @event.listens_for(engine, 'connect')
+        def attach_catalog(dbapi_connection, connection_record):
+            dbapi_connection.execute(f'ATTACH DATABASE ? AS {CATALOG_SCHEMA}', (catalog_path,))
+
+        self._absorb(engine, survey_id)
+        return engine
+
+    def _absorb(self, engine, survey_id):
+        """把目录库中该问卷的投票数据移入分库
+
+        启用分库前已有的投票、从归档恢复到目录库的投票都由这里迁移。
+        """
+        with engine.begin() as conn:
+            moved = {}
+            for name in SHARD_TABLES:
+                exists = conn.execute(
+                    text(f'SELECT 1 FROM {CATALOG_SCHEMA}."{name}" WHERE survey_id = :survey_id LIMIT 1'),
+                    {'survey_id': survey_id},
+                ).first()
+                if not exists:
+                    continue
+                columns = ', '.join(f'"{column.name}"' for column in db.metadata.tables[name].columns)
+                moved[name] = conn.execute(
+                    text(f'INSERT INTO main."{name}" ({columns}) '
+                         f'SELECT {columns} FROM {CATALOG_SCHEMA}."{name}" WHERE survey_id = :survey_id'),
+                    {'survey_id': survey_id},
+                ).rowcount
+                conn.execute(
+                    text(f'DELETE FROM {CATALOG_SCHEMA}."{name}" WHERE survey_id = :survey_id'),
+                    {'survey_id': survey_id},
+                )
+            if moved:
+                conn.execute(text('UPDATE shard_meta SET data_version = data_version + 1'))
+                logger.info(f"已把目录库中的投票数据移入分库: survey_id={survey_id}, 行数={moved}")
+
+    def absorb(self, survey_id):
+        self._absorb(self.engine(survey_id), survey_id)
+
+    def version(self, survey_id):
+        with self.engine(survey_id).connect() as conn:
+            return conn.execute(text('SELECT data_version FROM shard_meta WHERE id = 1')).scalar()
+
+    def drop(self, survey_id):
+        """删除问卷的分库文件（问卷删除或归档后调用）"""
+        with self._lock:
+            self._sessionmakers.pop(survey_id, None)
+            engine = self._engines.pop(survey_id, None)
+        if engine is not None:
+            engine.dispose()
+        path = self.path(survey_id)
+        for suffix in ('', '-journal', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    def dispose_all(self, close=True):
+        """释放全部分库连接（预加载后 fork 出的子进程中以 close=False 调用）"""
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose(close=close)
+
+
+registry = None
+if SHARD_BY_SURVEY:
+    if is_sqlite():
+        registry = ShardRegistry(SHARD_DIR, DATABASE_PATH)
+    else:
+        # PostgreSQL 等数据库没有整库写锁，不需要分库
+        logger.warning("SHARD_BY_SURVEY 仅适用于 SQLite，当前数据库不启用分库")
+
+
+def sharded():
+    return registry is not None
+
+
+def results_engine(survey_id):
+    """问卷投票数据所在的数据库引擎（分库连接上也能访问目录库中的表）"""
+    return registry.engine(survey_id) if registry is not None else db.engine
+
+
+@contextmanager
+def results_session(survey_id):
+    """问卷投票数据所在的 session
+
+    未分库时就是 db.session，写操作随调用方的 db.session.commit() 一起提交；
+    分库时为分库上的独立 session，with 块正常结束时提交，出错时回滚。
+    """
+    if registry is None:
+        yield db.session
+        return
+    session = registry.sessionmaker(survey_id)()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def bump_results_version(survey_id, session):
+    """投票写入后递增数据版本
+
+    分库时只递增分库中的版本，投票写入不碰目录库。
+    """
+    if registry is None:
+        bump_data_version(survey_id, session)
+    else:
+        session.execute(text('UPDATE shard_meta SET data_version = data_version + 1'))
+
+
+def export_version(survey):
+    """导出缓存使用的数据版本：目录库中的问卷版本，分库时再加上分库中的投票版本"""
+    if registry is None:
+        return survey.data_version
+    return f'{survey.data_version}-{registry.version(survey.id)}'
+
+
+def absorb_results(survey_id):
+    """把目录库中的投票数据移入分库（从归档恢复问卷后调用），未分库时不做任何事"""
+    if registry is not None:
+        registry.absorb(survey_id)
+
+
+def drop_results(survey_id):
+    if registry is not None:
+        registry.drop(survey_id)
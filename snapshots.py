@@ -0,0 +1,479 @@
+"""投票数据的分析快照（默认关闭，SNAPSHOT_INTERVAL 大于 0 时启用）
+
+投票进行中，结果页、导出和管理首页的计数都直接读写入线程正在写的数据库，
+大问卷的结果页和导出会长时间占用读事务，拖慢投票写入。
+启用后由后台线程每隔 SNAPSHOT_INTERVAL 秒把已提交的投票增量写入
+instance/snapshots/survey_<id>/ 下的 Parquet 分区，结果页、CSV / xlsx 导出
+和管理首页的计数改从快照读取，并显示快照的更新时间。
+
+- 整数编码：用户、问题、人名只保存ID，选项为字典编码，标签在读取时从目录库查询；
+- 增量刷新：只读取上次刷新以来写入的行（按 created_at，并向前多读 SNAPSHOT_OVERLAP 秒，
+  避免漏掉刷新时尚未提交的事务），提交过新选票的投票人的全部当前数据写成一个新分区；
+  同一投票人的数据只取最新的分区，重新提交自然覆盖旧数据；
+- 分区数超过 SNAPSHOT_MAX_PARTS 时合并为一个分区；
+- 删除投票结果、问题、人名等无法增量反映的修改调用 invalidate_snapshot，
+  快照作废（读取时回退到数据库），下次刷新时全量重建。
+
+多个工作进程共用同一目录，刷新时用锁文件保证同一问卷同一时刻只有一个进程在写。
+pyarrow 只在使用时导入，未安装时不启用快照。
+"""
+import glob
+import importlib.util
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text, bindparam, DateTime
+
+from config import SNAPSHOT_INTERVAL, SNAPSHOT_DIR, SNAPSHOT_OVERLAP, SNAPSHOT_MAX_PARTS
+from models import get_current_time
+from ballots import is_packed, iter_ballot_cells, option_labels
+from exports import (
+    SUBJECTIVE_DEFAULT_TITLE, result_columns, row_sort_key, stats_table, write_xlsx, write_csv,
+)
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+USERS = 'users.json'
+EPOCH = 'epoch'
+LOCK = '.lock'
+LOCK_STALE_SECONDS = 600  # 持有锁的进程异常退出时，超过该时间的锁文件视为失效
+
+# 快照的列；主观题回答的 question / respondent / option 为空
+COLUMNS = ('user', 'question', 'respondent', 'option', 'answer', 'created_at')
+
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('user', pa.int32()),
+        ('question', pa.int32()),
+        ('respondent', pa.int32()),
+        ('option', pa.dictionary(pa.int16(), pa.string())),
+        ('answer', pa.string()),
+        ('created_at', pa.timestamp('us')),
+    ])
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _survey_key(survey):
+    # 问卷删除后ID可能被新问卷复用，用创建时间区分
+    return survey.created_at.isoformat() if survey.created_at else ''
+
+
+class Snapshot:
+    """某个问卷快照中当前有效的行（每位投票人只保留最新一次提交的数据）"""
+
+    def __init__(self, manifest, table):
+        self.manifest = manifest
+        self.table = table
+
+    @property
+    def generation(self):
+        return self.manifest['generation']
+
+    @property
+    def refreshed_at(self):
+        return datetime.fromisoformat(self.manifest['refreshed_at'])
+
+    def user_ids(self):
+        return set(self.table['user'].to_pylist())
+
+    def vote_rows(self):
+        """(用户ID, 问题ID, 人名ID, 选项, 时间)"""
+        import pyarrow.compute as pc
+        votes = self.table.filter(pc.is_valid(self.table['question']))
+        return zip(*(votes[name].to_pylist() for name in ('user', 'question', 'respondent', 'option', 'created_at')))
+
+    def answer_rows(self):
+        """(用户ID, 回答内容, 时间)"""
+        import pyarrow.compute as pc
+        answers = self.table.filter(pc.is_valid(self.table['answer']))
+        return zip(*(answers[name].to_pylist() for name in ('user', 'answer', 'created_at')))
+
+
+class SnapshotStore:
+    def __init__(self, directory, overlap=30, max_parts=16):
+        self.directory = directory
+        self.overlap = overlap
+        self.max_parts = max_parts
+
+    def path(self, survey_id):
+        return os.path.join(self.directory, f'survey_{int(survey_id)}')
+
+    def _epoch(self, directory):
+        try:
+            with open(os.path.join(directory, EPOCH)) as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def manifest(self, survey):
+        """当前有效的快照清单，没有快照或快照已作废时返回 None"""
+        directory = self.path(survey.id)
+        manifest = _read_json(os.path.join(directory, MANIFEST))
+        if manifest is None or manifest['epoch'] != self._epoch(directory) \
+                or manifest['survey'] != _survey_key(survey):
+            return None
+        return manifest
+
+    def load(self, survey, manifest=None):
+        """读取快照，没有有效快照时返回 None"""
+        for _ in range(3):
+            manifest = manifest or self.manifest(survey)
+            if manifest is None:
+                return None
+            try:
+                return Snapshot(manifest, self._read_parts(self.path(survey.id), manifest['parts']))
+            except FileNotFoundError:
+                manifest = None  # 读取期间分区被合并，按最新的清单重读
+        return None
+
+    def _read_parts(self, directory, parts):
+        import numpy as np
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        tables = [pq.read_table(os.path.join(directory, name), schema=_schema()) for name in parts]
+        if not tables:
+            return _schema().empty_table()
+        table = pa.concat_tables(tables)
+        if len(tables) == 1:
+            return table
+        # 同一投票人只保留最新分区中的行
+        part_index = np.repeat(np.arange(len(tables)), [t.num_rows for t in tables])
+        _, inverse = np.unique(table['user'].to_numpy(), return_inverse=True)
+        latest = np.full(inverse.max() + 1 if len(inverse) else 0, -1)
+        np.maximum.at(latest, inverse, part_index)
+        return table.filter(pa.array(part_index == latest[inverse]))
+
+    def invalidate(self, survey_id):
+        """作废问卷的快照（删除投票、问题、人名后调用），下次刷新时全量重建"""
+        directory = self.path(survey_id)
+        if not os.path.isdir(directory):
+            return
+        tmp = os.path.join(directory, f'{EPOCH}.{os.getpid()}.tmp')
+        with open(tmp, 'w') as f:
+            f.write(str(self._epoch(directory) + 1))
+        os.replace(tmp, os.path.join(directory, EPOCH))
+
+    def drop(self, survey_id):
+        """删除问卷的快照目录（问卷删除或归档后调用）"""
+        directory = self.path(survey_id)
+        self.invalidate(survey_id)
+        for path in glob.glob(os.path.join(directory, '*')):
+            if os.path.basename(path) != EPOCH:
+                os.remove(path)
+
+    def _acquire(self, directory):
+        lock = os.path.join(directory, LOCK)
+        for _ in range(2):
+            try:
+                os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock) < LOCK_STALE_SECONDS:
+                        return False
+                    os.remove(lock)
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def refresh(self, session, survey):
+        """把上次刷新以来写入的数据追加到快照，返回是否有新数据
+
+        session 为问卷投票数据所在的会话（见 shards.results_session）。
+        """
+        directory = self.path(survey.id)
+        os.makedirs(directory, exist_ok=True)
+        if not self._acquire(directory):
+            return False
+        try:
+            return self._refresh(session, survey, directory)
+        finally:
+            try:
+                os.remove(os.path.join(directory, LOCK))
+            except FileNotFoundError:
+                pass
+
+    def _refresh(self, session, survey, directory):
+        epoch = self._epoch(directory)
+        manifest = _read_json(os.path.join(directory, MANIFEST))
+        users = _read_json(os.path.join(directory, USERS))
+        full = manifest is None or users is None or manifest['epoch'] != epoch \
+            or manifest['survey'] != _survey_key(survey)
+        started = get_current_time()
+        since = None if full else datetime.fromisoformat(manifest['watermark']) - timedelta(seconds=self.overlap)
+        if full:
+            users = {}
+
+        columns, latest, counts = _read_changes(session, survey, since)
+        changed = {user for user, created_at in latest.items()
+                   if users.get(str(user), [None])[0] != created_at.isoformat()}
+        generation = (manifest or {}).get('generation', 0)
+        parts = [] if full else list(manifest['parts'])
+
+        if changed or full:
+            generation += 1
+            if len(changed) < len(latest):
+                keep = [user in changed for user in columns['user']]
+                columns = {name: [v for v, k in zip(values, keep) if k] for name, values in columns.items()}
+            for user in changed:
+                users[str(user)] = [latest[user].isoformat()] + counts[user]
+            if columns['user']:
+                parts.append(self._write_part(directory, generation, columns))
+            if len(parts) > self.max_parts:
+                parts = [self._compact(directory, generation, parts)]
+
+        totals = [sum(entry[i] for entry in users.values()) for i in (1, 2, 3)]
+        new_manifest = {
+            'survey': _survey_key(survey),
+            'epoch': epoch,
+            'generation': generation,
+            'refreshed_at': started.isoformat(),
+            'watermark': started.isoformat(),
+            'parts': parts,
+            'counts': {'votes': totals[0], 'table_votes': totals[1], 'answers': totals[2], 'users': len(users)},
+        }
+        if changed or full:
+            _write_json(os.path.join(directory, USERS), users)
+        _write_json(os.path.join(directory, MANIFEST), new_manifest)
+
+        # 清理不再使用的分区（读取旧清单的请求遇到文件不存在时会按新清单重读）
+        for path in glob.glob(os.path.join(directory, 'part-*.parquet')):
+            if os.path.basename(path) not in parts:
+                os.remove(path)
+        if changed:
+            logger.info(f"快照已更新: survey_id={survey.id}, 投票人={len(changed)}, 分区={len(parts)}")
+        return bool(changed)
+
+    def _write_part(self, directory, generation, columns):
+        import pyarrow as pa
+        name = f'part-{generation:06d}.parquet'
+        schema = _schema()
+        table = pa.table({field.name: pa.array(columns[field.name], type=field.type) for field in schema}, schema=schema)
+        self._write_table(directory, name, table)
+        return name
+
+    def _write_table(self, directory, name, table):
+        import pyarrow.parquet as pq
+        tmp = os.path.join(directory, f'{name}.{os.getpid()}.tmp')
+        pq.write_table(table, tmp, compression='zstd')
+        os.replace(tmp, os.path.join(directory, name))
+
+    def _compact(self, directory, generation, parts):
+        name = f'part-{generation:06d}c.parquet'
+        self._write_table(directory, name, self._read_parts(directory, parts))
+        return name
+
+
+def _read_changes(session, survey, since):
+    """读取 since 之后写入的投票、选票单元格和主观题回答（since 为 None 时读取全部）
+
+    返回 (各列的值列表, 投票人 -> 最新写入时间, 投票人 -> [投票行数, 表格计数, 主观题回答数])
+    """
+    columns = {name: [] for name in COLUMNS}
+    latest, counts = {}, {}
+    where = "survey_id = :survey_id" + (" AND created_at >= :since" if since is not None else "")
+    params = {'survey_id': survey.id, 'since': since}
+
+    def statement(sql):
+        stmt = text(sql)
+        if since is not None:
+            stmt = stmt.bindparams(bindparam('since', type_=DateTime))
+        return stmt.columns(created_at=DateTime)
+
+    def add(user, question, respondent, option, answer, created_at, kind):
+        columns['user'].append(user)
+        columns['question'].append(question)
+        columns['respondent'].append(respondent)
+        columns['option'].append(option)
+        columns['answer'].append(answer)
+        columns['created_at'].append(created_at)
+        if user not in latest or created_at > latest[user]:
+            latest[user] = created_at
+        count = counts.setdefault(user, [0, 0, 0])
+        for i in kind:
+            count[i] += 1
+
+    result = session.execute(statement(
+        f"SELECT user_id, question_id, table_respondent_id, score, created_at FROM vote WHERE {where}"
+    ), params)
+    for user, question, respondent, score, created_at in result:
+        # 投票行数、表格计数（只计有人名的投票）与管理首页原有的计数方式一致
+        add(user, question, respondent, score, None, created_at, (0, 1) if respondent is not None else (0,))
+
+    if is_packed(survey):
+        labels = option_labels()
+        for cells in iter_ballot_cells(session, survey.id, since=since):
+            for user, question, respondent, option, created_at in zip(
+                cells['user_id'].tolist(), cells['question_id'].tolist(), cells['respondent_id'].tolist(),
+                labels[cells['code']].tolist(), cells['created_at'].tolist(),
+            ):
+                add(user, question, respondent, option, None, created_at, (1,))
+
+    result = session.execute(statement(
+        f"SELECT user_id, content, created_at FROM subjective_answer WHERE {where}"
+    ), params)
+    for user, content, created_at in result:
+        add(user, None, None, None, content, created_at, (2,))
+    return columns, latest, counts
+
+
+def _labels(session, survey, snapshot):
+    """快照中用户、问题、人名ID对应的文字（从目录库读取）"""
+    user_ids = sorted(snapshot.user_ids())
+    usernames = {}
+    stmt = text('SELECT id, username FROM "user" WHERE id IN :ids').bindparams(bindparam('ids', expanding=True))
+    for start in range(0, len(user_ids), 500):
+        usernames.update(session.execute(stmt, {'ids': user_ids[start:start + 500]}).all())
+    params = {'survey_id': survey.id}
+    questions = dict(session.execute(text("SELECT id, content FROM question WHERE survey_id = :survey_id"), params).all())
+    respondents = dict(session.execute(text("SELECT id, name FROM table_respondent WHERE survey_id = :survey_id"), params).all())
+    return usernames, questions, respondents
+
+
+def snapshot_results(session, survey, snapshot):
+    """结果页的投票和主观题回答列表，结构与直接读数据库时相同，按时间倒序"""
+    usernames, questions, respondents = _labels(session, survey, snapshot)
+    votes_data = []
+    for user_id, q_id, respondent_id, option, created_at in snapshot.vote_rows():
+        if q_id not in questions:
+            continue
+        vote = {'user': usernames.get(user_id), 'question': questions[q_id]}
+        if survey.type == 'table':
+            vote['respondent'] = respondents.get(respondent_id, '-')
+        vote.update(option=option, time=created_at)
+        votes_data.append(vote)
+    votes_data.sort(key=lambda v: v['time'], reverse=True)
+    subjective_data = [{'user': usernames.get(user_id), 'content': content, 'time': created_at}
+                       for user_id, content, created_at in snapshot.answer_rows()]
+    subjective_data.sort(key=lambda a: a['time'], reverse=True)
+    return votes_data, subjective_data
+
+
+def snapshot_rows(session, survey, snapshot):
+    """导出用的行，结构与 exports.iter_vote_rows 相同"""
+    usernames, questions, respondents = _labels(session, survey, snapshot)
+    questions = {q_id: content.replace(' ', '-') for q_id, content in questions.items()}
+    is_table = survey.type == 'table'
+    rows = []
+    for user_id, q_id, respondent_id, option, created_at in snapshot.vote_rows():
+        if q_id not in questions or user_id not in usernames:
+            continue
+        if is_table:
+            rows.append((usernames[user_id], questions[q_id], respondents.get(respondent_id, '-'), option, created_at))
+        else:
+            rows.append((usernames[user_id], questions[q_id], option, created_at))
+    subjective_title = (survey.subjective_question_prompt or SUBJECTIVE_DEFAULT_TITLE).replace(' ', '-')
+    for user_id, content, created_at in snapshot.answer_rows():
+        if user_id in usernames:
+            rows.append((usernames[user_id], subjective_title, None, content, created_at) if is_table
+                        else (usernames[user_id], subjective_title, content, created_at))
+    return rows
+
+
+def snapshot_stats(session, survey, snapshot):
+    is_table = survey.type == 'table'
+    counts = {}
+    for _, q_id, respondent_id, option, _ in snapshot.vote_rows():
+        key = (q_id, respondent_id if is_table else None, option)
+        counts[key] = counts.get(key, 0) + 1
+    return stats_table(session, survey, counts)
+
+
+def write_snapshot_xlsx(session, survey, snapshot, fileobj):
+    rows = snapshot_rows(session, survey, snapshot)
+    key = row_sort_key if survey.type == 'table' else (lambda row: (row[1] or '', row[2] or ''))
+    write_xlsx(fileobj, result_columns(survey), rows, sorted(rows, key=key), snapshot_stats(session, survey, snapshot))
+
+
+def write_snapshot_csv(session, survey, snapshot, fileobj):
+    write_csv(fileobj, result_columns(survey), snapshot_rows(session, survey, snapshot))
+
+
+store = None
+if SNAPSHOT_INTERVAL > 0:
+    if importlib.util.find_spec('pyarrow') is not None:
+        store = SnapshotStore(SNAPSHOT_DIR, overlap=SNAPSHOT_OVERLAP, max_parts=SNAPSHOT_MAX_PARTS)
+    else:
+        logger.warning("分析快照需要安装 pyarrow，当前不启用快照")
+
+
+def snapshot_manifest(survey):
+    """问卷当前有效的快照清单，未启用快照或快照尚未生成时返回 None"""
+    return store.manifest(survey) if store is not None else None
+
+
+def load_snapshot(survey, manifest=None):
+    return store.load(survey, manifest) if store is not None else None
+
+
+def invalidate_snapshot(survey_id):
+    if store is not None:
+        store.invalidate(survey_id)
+
+
+def drop_snapshot(survey_id):
+    if store is not None:
+        store.drop(survey_id)
+
+
+def refresh_all(app):
+    """刷新全部问卷（不含模板）的快照"""
+    from models import db, Survey
+    from shards import results_session
+    with app.app_context():
+        survey_ids = [sid for (sid,) in db.session.query(Survey.id).filter(Survey.is_template.isnot(True))]
+        for survey_id in survey_ids:
+            try:
+                survey = db.session.get(Survey, survey_id)
+                if survey is None:
+                    continue
+                with results_session(survey_id) as results:
+                    store.refresh(results, survey)
+            except Exception as e:
+                logger.error(f"刷新快照失败: survey_id={survey_id}, 错误: {e}", exc_info=True)
+            finally:
+                db.session.remove()  # 结束读事务，不阻塞写入线程
+
+
+_snapshotter = None
+
+
+def start_snapshotter(app):
+    """启动后台刷新线程（未启用快照时不做任何事）
+
+    fork 出的子进程中需要重新调用；多个进程同时刷新时由锁文件排队。
+    """
+    global _snapshotter
+    if store is None or (_snapshotter is not None and _snapshotter.is_alive()):
+        return _snapshotter
+
+    def run():
+        while True:
+            refresh_all(app)
+            time.sleep(SNAPSHOT_INTERVAL)
+
+    _snapshotter = threading.Thread(target=run, name='snapshotter', daemon=True)
+    _snapshotter.start()
+    logger.info(f"分析快照已启用: 每 {SNAPSHOT_INTERVAL:g} 秒刷新一次，目录 {SNAPSHOT_DIR}")
+    return _snapshotter
@@ -0,0 +1,39 @@
+import io
+
+from importer import DECODE_CHUNK_SIZE, detect_encoding, iter_csv_rows, iter_import_rows
+
+
+class Upload:
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.stream = io.BytesIO(data)
+
+
+def test_utf8_character_straddling_chunk_boundary():
+    # 第一行凑足字节数，使“题”（3 字节）跨越 4096 字节处以及分块边界
+    for boundary in (4096, DECODE_CHUNK_SIZE):
+        data = ('a' * (boundary - 2) + '题\n问题一\n').encode('utf-8')
+        assert data[boundary - 2:boundary + 1] == '题'.encode('utf-8')
+        stream = io.BytesIO(data)
+        assert detect_encoding(stream) == 'utf-8-sig'
+        assert stream.tell() == 0
+        rows = list(iter_csv_rows(stream))
+        assert rows[0][1].endswith('题')
+        assert rows[1] == (2, '问题一')
+
+
+def test_gbk_csv():
+    stream = io.BytesIO('姓名\n张三\n李四\n'.encode('gbk'))
+    assert detect_encoding(stream) == 'gbk'
+    assert list(iter_csv_rows(stream)) == [(1, '姓名'), (2, '张三'), (3, '李四')]
+
+
+def test_invalid_utf8_after_first_chunk_falls_back_to_gbk():
+    data = ('a' * DECODE_CHUNK_SIZE + '\n张三\n').encode('utf-8') + '李四\n'.encode('gbk')
+    assert detect_encoding(io.BytesIO(data)) == 'gbk'
+
+
+def test_header_skipped_only_for_files():
+    upload = Upload('names.csv', '﻿姓名\n张三\n'.encode('utf-8'))
+    assert list(iter_import_rows(upload=upload)) == [(2, '张三')]
+    assert list(iter_import_rows(text='姓名\n张三\n')) == [(1, '姓名\n'), (2, '张三\n')]
@@ -0,0 +1,290 @@
+"""投票端路由：扫码登录、填写与提交问卷
+
+只依赖数据库模型和投票写入队列，不加载导出、二维码、PDF 等管理后台使用的库。
+"""
+import logging
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, jsonify
+from flask_login import login_user, login_required, current_user
+from werkzeug.security import generate_password_hash
+
+from config import (
+    ADMISSION_QUEUE_HIGH_WATER, ADMISSION_MAX_LAG, ADMISSION_CLIENT_RATE, ADMISSION_CLIENT_BURST,
+    ADMISSION_SURVEY_RATE, ADMISSION_SURVEY_BURST, ADMISSION_RETRY_AFTER,
+)
+from models import db, User, Survey, Question, TableRespondent, QRCode
+from writer import queue_for, save_vote_to_db, accepting_votes
+from ballots import cell_map, decode_payload
+from admission import AdmissionController
+from rules import compile_rules, rules_digest
+from participation import tracker
+
+logger = logging.getLogger(__name__)
+
+voter_bp = Blueprint('voter', __name__)
+
+admission = AdmissionController(
+    queue_high_water=ADMISSION_QUEUE_HIGH_WATER,
+    max_lag=ADMISSION_MAX_LAG,
+    client_rate=ADMISSION_CLIENT_RATE,
+    client_burst=ADMISSION_CLIENT_BURST,
+    survey_rate=ADMISSION_SURVEY_RATE,
+    survey_burst=ADMISSION_SURVEY_BURST,
+    retry_after=ADMISSION_RETRY_AFTER,
+)
+
+# 路由
+@voter_bp.route('/')
+def index():
+    if current_user.is_authenticated and current_user.is_admin and 'admin' in current_app.blueprints:
+        return redirect(url_for('admin.dashboard'))
+    surveys = Survey.query.filter_by(is_active=True).all()
+    return render_template('index.html', surveys=surveys)
+
+@voter_bp.route('/login/<token>')
+def login_with_qr(token):
+    qr = QRCode.query.filter_by(token=token).first()
+    if not qr:
+        flash('无效的二维码', 'danger')
+        return redirect(url_for('voter.thank_you'))
+    
+    # 查找或创建用户
+    user = User.query.filter_by(qr_code=token).first()
+    if not user:
+        # 创建新用户
+        user = User(
+            username=f"user_{token[:8]}",
+            password_hash=generate_password_hash(token),
+            qr_code=token
+        )
+        db.session.add(user)
+    if user.id is None or not qr.is_used:
+        # 首次扫码：标记二维码已使用，更新参与情况
+        qr.is_used = True
+        db.session.commit()
+        tracker.mark_scanned(qr.survey_id, token)
+    
+    login_user(user)
+    return redirect(url_for('voter.vote', survey_id=qr.survey_id))
+
+@voter_bp.route('/vote/<int:survey_id>')
+@login_required
+def vote(survey_id):
+    survey = Survey.query.get_or_404(survey_id)
+    if not survey.is_active:
+        flash('该问卷已关闭', 'warning')
+        return redirect(url_for('voter.thank_you'))
+    questions = Question.query.filter_by(survey_id=survey_id).order_by(Question.order_index, Question.id).all()
+    
+    respondents = []
+    cells = None
+    if survey.type == 'table':
+        respondents = TableRespondent.query.filter_by(survey_id=survey_id).order_by(TableRespondent.id).all()
+        # 紧凑提交使用的单元格顺序
+        cells = cell_map(
+            tuple(q.id for q in questions if q.component_type != 'custom_single_choice' and not q.custom_options),
+            tuple(r.id for r in respondents)
+        )
+        
+    table_option_count = survey.table_option_count if survey.type == 'table' else None
+    # 校验规则的地址带内容摘要，规则不变时浏览器使用缓存
+    rules = compile_rules(survey, questions, [r.id for r in respondents])
+    rules_url = url_for('voter.vote_rules', survey_id=survey_id, v=rules_digest(rules))
+    
+    # 从session中恢复保存的选择
+    session_key = f'saved_choices_{survey_id}'
+    saved_choices = session.get(session_key, {})
+    if cells and 'ballot' in saved_choices:
+        # 紧凑提交的选择展开为逐个单元格，结构已变化时不恢复
+        saved_choices = dict(saved_choices)
+        payload = saved_choices.pop('ballot')
+        if saved_choices.pop('ballot_schema', None) == cells.token and len(payload) == len(cells.cells):
+            for (q_id, r_id), option in zip(cells.cells, payload):
+                saved_choices[f'vote_{q_id}_{r_id}'] = option
+    
+    return render_template(
+        'vote.html',
+        survey=survey,
+        questions=questions,
+        respondents=respondents,
+        subjective_question_prompt=survey.subjective_question_prompt,
+        table_option_count=table_option_count,
+        enable_quick_fill=survey.enable_quick_fill,
+        saved_choices=saved_choices,
+        ballot_cells=cells,
+        rules_url=rules_url
+    )
+
+@voter_bp.route('/vote/<int:survey_id>/rules.json')
+@login_required
+def vote_rules(survey_id):
+    """投票页在浏览器中即时校验使用的规则（见 rules.py）"""
+    survey = Survey.query.get_or_404(survey_id)
+    questions = Question.query.filter_by(survey_id=survey_id).order_by(Question.order_index, Question.id).all()
+    respondent_ids = []
+    if survey.type == 'table':
+        respondent_ids = [r_id for r_id, in db.session.query(TableRespondent.id).filter_by(survey_id=survey_id).order_by(TableRespondent.id)]
+    rules = compile_rules(survey, questions, respondent_ids)
+    digest = rules_digest(rules)
+    
+    response = jsonify(rules)
+    response.set_etag(digest)
+    if request.args.get('v') == digest:
+        # 地址中的摘要与当前规则一致：规则变化后投票页会换用新地址，可以长期缓存
+        response.cache_control.private = True
+        response.cache_control.max_age = 86400
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@voter_bp.route('/submit_vote/<int:survey_id>', methods=['POST'])
+@login_required
+def submit_vote(survey_id):
+    survey = Survey.query.get_or_404(survey_id)
+    if not survey.is_active:
+        flash('该问卷已关闭，投票未被记录', 'warning')
+        return redirect(url_for('voter.thank_you'))
+    
+    # 一次遍历表单：question_<问题ID> 为单选题/自定义单选组件，vote_<问题ID>_<人名ID> 为旧式表格单元格
+    choices = {}
+    cell_choices = {}
+    for key, value in request.form.items():
+        if key.startswith('question_'):
+            choices[key] = value
+        elif key.startswith('vote_'):
+            cell_choices[key] = value
+    ballot_payload = request.form.get('ballot') if survey.type == 'table' else None
+    
+    # 保存用户的选择到session，以便验证失败时恢复
+    saved_choices = dict(choices)
+    if ballot_payload is not None:
+        saved_choices['ballot'] = ballot_payload
+        saved_choices['ballot_schema'] = request.form.get('ballot_schema', '')
+    else:
+        saved_choices.update(cell_choices)
+    if 'subjective_answer' in request.form:
+        saved_choices['subjective_answer'] = request.form.get('subjective_answer', '')
+    
+    session_key = f'saved_choices_{survey_id}'
+    session[session_key] = saved_choices
+    
+    questions = Question.query.filter_by(survey_id=survey_id).order_by(Question.order_index, Question.id).all()
+    # 自定义组件的判断：component_type为custom_single_choice 或 custom_options不为空
+    standard_questions = [
+        q for q in questions 
+        if q.component_type != 'custom_single_choice' and not q.custom_options
+    ]
+    
+    # 打包投票数据
+    vote_data = {
+        'survey_id': survey_id,
+        'user_id': current_user.id,
+        'qr_token': current_user.qr_code,  # 写入后更新参与情况
+        'single_choice_votes': [],
+        'table_votes': [],
+        'subjective_answer': None
+    }
+    
+    # 校验逻辑
+    if survey.type == 'single_choice':
+        single_questions = questions
+    else:
+        # 表格问卷中的自定义组件作为单选题提交
+        single_questions = [q for q in questions if q.component_type == 'custom_single_choice' or q.custom_options]
+    for question in single_questions:
+        if not choices.get(f'question_{question.id}'):
+            flash('请完成所有问题后再进行提交', 'danger')
+            return redirect(url_for('voter.vote', survey_id=survey_id))
+    # 只取本问卷的问题，表单中的其他 question_* 字段忽略
+    vote_data['single_choice_votes'] = [(q.id, choices[f'question_{q.id}']) for q in single_questions]
+    
+    if survey.type == 'table':
+        respondent_ids = tuple(r_id for r_id, in db.session.query(TableRespondent.id).filter_by(survey_id=survey_id).order_by(TableRespondent.id))
+        cells = cell_map(tuple(q.id for q in standard_questions), respondent_ids)
+        table_options = 'ABCDE'[:survey.table_option_count or 0]
+        if ballot_payload is not None:
+            # 紧凑提交：按单元格映射一次遍历解码
+            if request.form.get('ballot_schema') != cells.token:
+                del session[session_key]
+                flash('问卷内容已更新，请重新填写', 'warning')
+                return redirect(url_for('voter.vote', survey_id=survey_id))
+            try:
+                table_votes, missing = decode_payload(ballot_payload, cells, table_options)
+            except ValueError as e:
+                logger.warning(f"紧凑表格数据无效: survey_id={survey_id}, 错误: {e}")
+                del session[session_key]
+                flash('提交的数据无效，请重新填写', 'danger')
+                return redirect(url_for('voter.vote', survey_id=survey_id))
+        else:
+            # 旧式提交：每个单元格一个表单字段
+            table_votes, missing = [], 0
+            for q_id, r_id in cells.cells:
+                score = cell_choices.get(f'vote_{q_id}_{r_id}')
+                if not score:
+                    missing += 1
+                elif score in table_options:
+                    table_votes.append((q_id, r_id, score))
+                else:
+                    # 与紧凑提交一样拒绝不可用的选项，否则紧凑存储在写入线程中无法编码
+                    logger.warning(f"表格选项无效: survey_id={survey_id}, 选项={score!r}")
+                    flash('提交的数据无效，请重新填写', 'danger')
+                    return redirect(url_for('voter.vote', survey_id=survey_id))
+        if missing:
+            flash('请完成所有问题后再进行提交', 'danger')
+            return redirect(url_for('voter.vote', survey_id=survey_id))
+        vote_data['table_votes'] = table_votes
+    
+    if survey.option_limits:
+        # 只统计标准问题的选项，不统计自定义组件
+        if survey.type == 'single_choice':
+            standard_question_ids = {q.id for q in standard_questions}
+            scores = [score for q_id, score in vote_data['single_choice_votes'] if q_id in standard_question_ids]
+        else:
+            scores = [score for _, _, score in vote_data['table_votes']]
+        option_counts = {}
+        for option in scores:
+            option_counts[option] = option_counts.get(option, 0) + 1
+        for option, limit in survey.option_limits.items():
+            if option_counts.get(option, 0) > limit:
+                flash(f'选项 {option} 的选择次数超过了限制 ({limit}次)', 'danger')
+                return redirect(url_for('voter.vote', survey_id=survey_id))
+    
+    if survey.subjective_question_prompt:
+        subjective_answer_content = request.form.get('subjective_answer', '').strip()
+        if subjective_answer_content:
+            vote_data['subjective_answer'] = subjective_answer_content
+    
+    if not accepting_votes():
+        # 服务正在停止：不再接收投票，已填写的内容保留在 session 中
+        flash('服务器正在维护，投票未被记录，请稍后重新提交', 'warning')
+        return redirect(url_for('voter.vote', survey_id=survey_id))
+    
+    # 准入控制放在校验之后：校验未通过、需要修改后重新提交的投票不消耗配额
+    # 过载或提交过快时快速拒绝，已填写的内容保留在 session 和重试页面中
+    rejection = admission.check(survey_id, current_user.id)
+    if rejection:
+        logger.info(f"投票提交被拒绝: survey_id={survey_id}, user_id={current_user.id}, 原因={rejection.reason}")
+        response = current_app.make_response((render_template(
+            'vote_retry.html',
+            survey_id=survey_id,
+            message=rejection.message,
+            retry_after=rejection.retry_after,
+            form_items=list(request.form.items(multi=True)),
+        ), 503))
+        response.headers['Retry-After'] = str(rejection.retry_after)
+        return response
+    
+    # 将投票数据入队等待写入数据库
+    queue_for(survey_id, vote_data['user_id']).put((save_vote_to_db, (vote_data,), {}))
+    
+    # 清除保存的选择（提交成功）
+    session_key = f'saved_choices_{survey_id}'
+    if session_key in session:
+        del session[session_key]
+    
+    flash('您的投票已提交成功！', 'success')
+    return redirect(url_for('voter.thank_you'))
+
+@voter_bp.route('/thank_you')
+def thank_you():
+    return render_template('thank_you.html')
@@ -0,0 +1,319 @@
+"""投票写入线程
+
+所有投票写入都放入 submit_queue，由单个后台线程顺序写入数据库，
+避免 SQLite 的并发写锁冲突。管理后台的后台任务（如问题重新编号）也复用该队列。
+使用 PostgreSQL 时由 WRITER_THREADS 个写入线程并行写入（见 database.py），每个线程一个队列，
+第一个就是 submit_queue；投票按 (问卷ID, 用户ID) 固定放入其中一个队列，
+同一投票人的多次提交由同一个线程按提交顺序写入，旧选票不会覆盖新选票。
+按问卷分库时（见 shards.py），投票改为放入 queue_for(survey_id) 返回的分库队列，
+每个分库一个写入线程，不同问卷的投票并行写入。
+问卷的数据版本（导出缓存据此失效）不在每张选票的事务中递增，否则所有写入线程都要更新问卷这一行而互相等待；
+写入线程提交选票后记下问卷，队列空闲时或每隔 RESULTS_VERSION_INTERVAL 秒在单独的短事务中统一递增。
+参与情况位图（见 participation.py）每隔 PARTICIPATION_FLUSH_INTERVAL 秒由 submit_queue 写回数据库。
+进程退出前先停止接收新的投票，再等待队列中已接收的投票写完。
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+
+from models import db, Survey, Vote, SubjectiveAnswer, get_current_time, bump_data_version
+from ballots import STORAGE_PACKED, save_ballot
+from shards import sharded, results_engine, bump_results_version
+from database import writer_threads, lock_voter, copy_rows
+from participation import tracker
+from config import WRITER_DRAIN_TIMEOUT, PARTICIPATION_FLUSH_INTERVAL, RESULTS_VERSION_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+class SubmitQueue(queue.Queue):
+    """记录每个任务入队时间的队列，用于计算写入延迟"""
+
+    def _init(self, maxsize):
+        self.queue = deque()
+
+    def _put(self, item):
+        self.queue.append((time.monotonic(), item))
+
+    def _get(self):
+        return self.queue.popleft()[1]
+
+    def oldest_age(self):
+        """队列中最早的任务已等待的秒数，队列为空时为 0"""
+        with self.mutex:
+            return time.monotonic() - self.queue[0][0] if self.queue else 0.0
+
+submit_queue = SubmitQueue()
+_writer_pid = None
+_writer_app = None
+_writer_threads = []
+_voter_queues = []  # 写入线程各自的队列，第一个为 submit_queue
+_shard_queues = {}  # 问卷ID -> (队列, 写入线程)，仅分库时使用
+_shard_lock = threading.Lock()
+_accepting = threading.Event()
+_changed_surveys = set()  # 已写入新选票、尚未递增数据版本的问卷（仅未分库时使用）
+_changed_lock = threading.Lock()
+_last_version_flush = 0.0
+
+def _start_worker(app, task_queue, name):
+    def db_worker():
+        with app.app_context():
+            while True:
+                try:
+                    func, args, kwargs = task_queue.get()
+                    func(*args, **kwargs)
+                    flush_results_versions(force=task_queue.empty())
+                    task_queue.task_done()
+                except Exception as e:
+                    logger.error(f"数据库写入失败: {e}", exc_info=True)
+                    task_queue.task_done()  # 确保即使出错也标记任务完成
+
+    thread = threading.Thread(target=db_worker, name=name, daemon=True)
+    thread.start()
+    return thread
+
+def start_writer(app):
+    """启动写入线程（每个进程只启动一次；预加载后 fork 出的子进程需要重新启动）"""
+    global _writer_pid, _writer_app, _writer_threads
+    if _writer_pid == os.getpid():
+        return
+    first_start = _writer_pid is None
+    _writer_pid = os.getpid()
+    _writer_app = app
+    _shard_queues.clear()  # fork 前父进程的分库写入线程不会被子进程继承
+    count = writer_threads()
+    _voter_queues[:] = [submit_queue] + [SubmitQueue() for _ in range(count - 1)]
+    _writer_threads = [
+        _start_worker(app, task_queue, 'db-writer' if count == 1 else f'db-writer-main-{i}')
+        for i, task_queue in enumerate(_voter_queues)
+    ]
+    _accepting.set()
+    threading.Thread(target=_participation_flusher, name='participation-flusher', daemon=True).start()
+    if first_start:
+        atexit.register(shutdown_writer)
+
+def flush_participation():
+    tracker.flush(db.session)
+
+def _participation_flusher():
+    pid = os.getpid()
+    while _writer_pid == pid:
+        time.sleep(PARTICIPATION_FLUSH_INTERVAL)
+        if tracker.dirty():
+            submit_queue.put((flush_participation, (), {}))
+
+def queue_for(survey_id, user_id=None):
+    """问卷投票的写入队列
+
+    分库时每个问卷一个队列（首次使用时启动写入线程）；否则有多个写入线程时
+    按 (问卷ID, 用户ID) 固定选择其中一个队列，未给出用户时为 submit_queue。
+    """
+    if not sharded():
+        if user_id is None or len(_voter_queues) < 2:
+            return submit_queue
+        return _voter_queues[hash((survey_id, user_id)) % len(_voter_queues)]
+    entry = _shard_queues.get(survey_id)
+    if entry is None:
+        with _shard_lock:
+            entry = _shard_queues.get(survey_id)
+            if entry is None:
+                task_queue = SubmitQueue()
+                thread = _start_worker(_writer_app, task_queue, f'db-writer-{survey_id}')
+                entry = _shard_queues[survey_id] = (task_queue, thread)
+    return entry[0]
+
+def _all_queues():
+    return (list(_voter_queues) or [submit_queue]) + [task_queue for task_queue, _ in list(_shard_queues.values())]
+
+def _survey_queues(survey_id):
+    """问卷投票所在的队列：未分库时为全部写入线程的队列"""
+    if not sharded():
+        return list(_voter_queues) or [submit_queue]
+    entry = _shard_queues.get(survey_id)
+    return [entry[0]] if entry else []
+
+def queue_depth(survey_id=None):
+    """等待写入的任务数；指定问卷时只计该问卷所在的队列"""
+    queues = _all_queues() if survey_id is None else _survey_queues(survey_id)
+    return sum(task_queue.qsize() for task_queue in queues)
+
+def writer_lag(survey_id=None):
+    """写入延迟：队列中最早的投票已等待的秒数；指定问卷时只看该问卷所在的队列"""
+    queues = _all_queues() if survey_id is None else _survey_queues(survey_id)
+    return max((task_queue.oldest_age() for task_queue in queues), default=0.0)
+
+def writer_alive():
+    if not _writer_threads:
+        return False
+    threads = _writer_threads + [thread for _, thread in list(_shard_queues.values())]
+    return all(thread.is_alive() for thread in threads)
+
+def wait_for_survey(survey_id, timeout=WRITER_DRAIN_TIMEOUT):
+    """等待问卷此前已入队的投票全部写完，超时返回 False
+
+    在问卷所在的每个队列末尾放入一个标记任务，各写入线程执行到标记时即已写完之前的投票。
+    """
+    if not writer_alive():
+        return not any(task_queue.unfinished_tasks for task_queue in _survey_queues(survey_id))
+    markers = []
+    for task_queue in _survey_queues(survey_id):
+        marker = threading.Event()
+        task_queue.put((marker.set, (), {}))
+        markers.append(marker)
+    deadline = time.monotonic() + timeout
+    return all(marker.wait(max(deadline - time.monotonic(), 0)) for marker in markers)
+
+def accepting_votes():
+    """写入线程正在运行且进程没有进入退出流程"""
+    return _accepting.is_set() and writer_alive()
+
+def stop_accepting():
+    _accepting.clear()
+
+def _unfinished():
+    return sum(task_queue.unfinished_tasks for task_queue in _all_queues())
+
+def drain(timeout=WRITER_DRAIN_TIMEOUT):
+    """等待各队列中的任务全部写完，超时返回 False"""
+    deadline = time.monotonic() + timeout
+    for task_queue in _all_queues():
+        with task_queue.all_tasks_done:
+            while task_queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                task_queue.all_tasks_done.wait(remaining)
+    return True
+
+def shutdown_writer(timeout=WRITER_DRAIN_TIMEOUT):
+    """停止接收投票并等待写入完成（进程退出时调用，可重复调用）"""
+    stop_accepting()
+    if not any(thread.is_alive() for thread in _writer_threads):
+        return True
+    pending = _unfinished()
+    if pending:
+        logger.info(f"等待写入队列中的 {pending} 个任务完成")
+    if drain(timeout):
+        if tracker.dirty():
+            # 投票全部写完后再写回一次参与情况
+            submit_queue.put((flush_participation, (), {}))
+            drain(timeout)
+        return True
+    logger.error(f"写入队列在 {timeout} 秒内未写完，仍有 {_unfinished()} 个任务未写入")
+    return False
+
+def _results_changed(survey_id):
+    with _changed_lock:
+        _changed_surveys.add(survey_id)
+
+def flush_results_versions(force=False):
+    """递增已写入新选票的问卷的数据版本（由写入线程在任务之间调用）
+
+    force 为 False 时距上次递增不足 RESULTS_VERSION_INTERVAL 秒则不做任何事。
+    """
+    global _last_version_flush
+    with _changed_lock:
+        if not _changed_surveys:
+            return
+        if not force and time.monotonic() - _last_version_flush < RESULTS_VERSION_INTERVAL:
+            return
+        survey_ids = sorted(_changed_surveys)  # 按ID顺序更新，多个线程同时递增时不会死锁
+        _changed_surveys.clear()
+        _last_version_flush = time.monotonic()
+    session = Session(db.engine)
+    try:
+        for survey_id in survey_ids:
+            bump_data_version(survey_id, session)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        with _changed_lock:
+            _changed_surveys.update(survey_ids)
+        logger.error(f"递增问卷数据版本失败: survey_ids={survey_ids}, 错误: {e}", exc_info=True)
+    finally:
+        session.close()
+
+def save_vote_to_db(vote_data, retry_count=0):
+    """保存投票到数据库，带重试机制
+    
+    失败时在当前写入线程中等待后重试，不重新入队：重新入队会排到同一投票人
+    之后的提交后面，重试成功时旧选票反而覆盖新选票。
+    
+    Args:
+        vote_data: 投票数据字典
+        retry_count: 当前重试次数（默认最大重试3次）
+    """
+    MAX_RETRIES = 3
+    while True:
+        try:
+            _write_vote(vote_data)
+        except Exception as e:
+            logger.error(f"数据库写入异常: user_id={vote_data['user_id']}, survey_id={vote_data['survey_id']}, 重试次数={retry_count}, 错误: {e}", exc_info=True)
+            if retry_count >= MAX_RETRIES:
+                logger.error(f"达到最大重试次数，放弃写入: user_id={vote_data['user_id']}, survey_id={vote_data['survey_id']}")
+                return
+            retry_count += 1
+            time.sleep(0.5 * retry_count)  # 退避
+            continue
+        if retry_count > 0:
+            logger.info(f"投票数据成功写入（经过 {retry_count} 次重试）: user_id={vote_data['user_id']}, survey_id={vote_data['survey_id']}")
+        return
+
+def _write_vote(vote_data):
+    """在一个事务中替换投票人的选票，出错时回滚并抛出异常"""
+    Session = scoped_session(sessionmaker(bind=results_engine(vote_data['survey_id'])))
+    session = Session()
+    try:
+        survey_id = vote_data['survey_id']
+        user_id = vote_data['user_id']
+        survey = session.get(Survey, survey_id)
+        if not survey:
+            logger.error(f"问卷不存在: survey_id={survey_id}")
+            return
+        
+        lock_voter(session, survey_id, user_id)
+        now = get_current_time()
+        
+        # 删除旧投票
+        session.query(Vote).filter(Vote.survey_id == survey_id, Vote.user_id == user_id).delete(synchronize_session=False)
+        session.query(SubjectiveAnswer).filter_by(user_id=user_id, survey_id=survey_id).delete(synchronize_session='fetch')
+        # 插入新投票：一张选票的全部投票行一次批量写入（PostgreSQL 使用 COPY）
+        vote_rows = []
+        if survey.type in ('single_choice', 'table'):
+            # 单选题，以及表格问卷中自定义单选组件的投票（没有table_respondent_id）
+            for q_id, score in vote_data['single_choice_votes']:
+                vote_rows.append({'user_id': user_id, 'survey_id': survey_id, 'question_id': q_id,
+                                  'table_respondent_id': None, 'score': score, 'created_at': now})
+        if survey.type == 'table':
+            if survey.ballot_storage == STORAGE_PACKED:
+                # 紧凑存储：整张选票写成一行（替换旧选票）
+                save_ballot(session, survey_id, user_id, vote_data['table_votes'], now)
+            else:
+                # 保存标准表格问题的投票（有table_respondent_id）
+                for q_id, respondent_id, score in vote_data['table_votes']:
+                    vote_rows.append({'user_id': user_id, 'survey_id': survey_id, 'question_id': q_id,
+                                      'table_respondent_id': respondent_id, 'score': score, 'created_at': now})
+        copy_rows(session.connection(), Vote.__table__, vote_rows)
+        if vote_data.get('subjective_answer'):
+            subjective_answer = SubjectiveAnswer(user_id=user_id, survey_id=survey_id, content=vote_data['subjective_answer'],
+                                                 created_at=now)
+            session.add(subjective_answer)
+        if sharded():
+            # 分库只有一个写入线程，分库中的版本随选票一起递增
+            bump_results_version(survey_id, session)
+        
+        # 提交事务
+        session.commit()
+        if not sharded():
+            _results_changed(survey_id)
+        tracker.mark_voted(survey_id, vote_data.get('qr_token'))
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()